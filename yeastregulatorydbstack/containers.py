@@ -0,0 +1,341 @@
+"""
+The container settings shared by every container which runs the Django app
+image: Django, the Celery worker pools, beat and Flower.
+
+How the containers' logs are delivered is chosen per service with a
+<prefix>LogDelivery parameter, see `configure_log_delivery`:
+
+- blocking: awslogs, which stalls a container writing to stdout whenever
+  CloudWatch Logs is slow
+- non-blocking: awslogs with a LogMaxBufferSize buffer, which drops the
+  oldest lines if the buffer fills rather than stall
+- firelens-cloudwatch, firelens-s3: a Fluent Bit sidecar which batches the
+  logs to the CloudWatch log group, or gzipped to LogArchiveBucket
+
+With AppDatabaseEndpoint pgbouncer, the containers connect to PostgreSQL
+through a PgBouncer sidecar, see `add_pgbouncer`.
+"""
+
+from collections.abc import Iterable, MutableMapping
+
+from ruamel.yaml.comments import CommentedMap
+
+from yeastregulatorydbstack import pgbouncer
+from yeastregulatorydbstack.database import (
+    app_endpoint,
+    database_endpoint,
+    reader_endpoint,
+)
+from yeastregulatorydbstack.template import load_fragment, ref, sub
+
+_APP_CONTAINER = """
+Image: !Ref DjangoAppImage
+Environment:
+  - Name: AWS_DEFAULT_REGION
+    Value: !Ref "AWS::Region"
+  - Name: AWS_S3_REGION_NAME
+    Value: !Ref "AWS::Region"
+  - Name: REDIS_HOST
+    Value: !GetAtt MyElastiCacheRedis.RedisEndpoint.Address
+  - Name: REDIS_PORT
+    Value: !GetAtt MyElastiCacheRedis.RedisEndpoint.Port
+  - Name: POSTGRES_DB
+    Value: !Ref DBName
+  - Name: POSTGRES_USER
+    Value: !Ref PostgresUser
+  - Name: POSTGRES_PASSWORD
+    Value: !Ref PostgresPassword
+EnvironmentFiles:
+  - Value: !Sub "arn:aws:s3:::${EnvFilePath}"
+    Type: s3
+"""
+
+
+# scratch volumes are mounted at SCRATCH_PATH/<volume name>
+SCRATCH_PATH = "/scratch"
+
+LOG_DELIVERY_MODES = ("blocking", "non-blocking", "firelens-cloudwatch", "firelens-s3")
+LOG_ROUTER = "log-router"
+PGBOUNCER = "pgbouncer"
+
+
+def app_container(name: str, command: list | None = None) -> CommentedMap:
+    """
+    Return a container definition which runs the Django app image with the
+    shared environment. Its log configuration is set by
+    `configure_log_delivery`.
+
+    :param name: the container name
+    :type name: str
+    :param command: the container command. Defaults to the image's.
+    :type command: list | None
+
+    :return: a new container definition, which the caller may extend, eg
+      with PortMappings
+    :rtype: CommentedMap
+    """
+    # parsed on every call, since the container is modified in place, eg by
+    # configure_log_delivery
+    container = CommentedMap({"Name": name})
+    shared = load_fragment(_APP_CONTAINER)
+    # the writer, through the PgBouncer sidecar, the RDS Proxy or directly,
+    # and the readers, see yeastregulatorydbstack.database. A Django
+    # database router sends reads to POSTGRES_READ_HOST.
+    environment = shared["Environment"]
+    database = next(
+        index
+        for index, variable in enumerate(environment)
+        if variable["Name"] == "POSTGRES_DB"
+    )
+    environment[database:database] = [
+        {"Name": "POSTGRES_HOST", "Value": app_endpoint("Address")},
+        {"Name": "POSTGRES_PORT", "Value": app_endpoint("Port")},
+        {"Name": "POSTGRES_READ_HOST", "Value": reader_endpoint("Address")},
+        {"Name": "POSTGRES_READ_PORT", "Value": reader_endpoint("Port")},
+    ]
+    container["Image"] = shared.pop("Image")
+    if command is not None:
+        container["Command"] = command
+    container.update(shared)
+    return container
+
+
+def mount_scratch_volumes(
+    task_definition: MutableMapping, names: Iterable[str]
+) -> None:
+    """
+    Add scratch volumes to a task definition resource and mount them into
+    every container at `SCRATCH_PATH`/<name>, which the containers find in
+    the SCRATCH_DIR environment variable.
+
+    A scratch volume is a bind mount without a host path, so it lives on the
+    task's ephemeral storage, see `EphemeralStorage`, and is discarded with
+    the task. Unlike the container's own filesystem, it is not copy on write.
+
+    :param task_definition: an AWS::ECS::TaskDefinition resource. It is
+      modified in place.
+    :type task_definition: MutableMapping
+    :param names: the volume names
+    :type names: Iterable[str]
+    """
+    names = list(names)
+    if not names:
+        return
+    properties = task_definition["Properties"]
+    properties.setdefault("Volumes", []).extend({"Name": name} for name in names)
+    for container in properties["ContainerDefinitions"]:
+        container.setdefault("MountPoints", []).extend(
+            {"SourceVolume": name, "ContainerPath": f"{SCRATCH_PATH}/{name}"}
+            for name in names
+        )
+        container["Environment"].append({"Name": "SCRATCH_DIR", "Value": SCRATCH_PATH})
+
+
+def log_delivery_parameter(prefix: str, services: str) -> dict:
+    """
+    Return the <prefix>LogDelivery parameter.
+
+    :param prefix: the logical ID prefix, eg Django
+    :type prefix: str
+    :param services: the services it applies to, for the description
+    :type services: str
+
+    :return: the parameter
+    :rtype: dict
+    """
+    return {
+        "Type": "String",
+        "Description": (
+            f"How the {services} logs are delivered: awslogs in blocking or "
+            "non-blocking mode, or a Fluent Bit sidecar which batches them to "
+            "CloudWatch Logs or to LogArchiveBucket"
+        ),
+        "Default": "non-blocking",
+        "AllowedValues": list(LOG_DELIVERY_MODES),
+    }
+
+
+def log_delivery_conditions(prefix: str) -> dict:
+    """
+    Return the conditions `configure_log_delivery` uses for a service.
+
+    :param prefix: the logical ID prefix of the <prefix>LogDelivery parameter
+    :type prefix: str
+
+    :return: conditions, by name
+    :rtype: dict
+    """
+    delivery = ref(f"{prefix}LogDelivery")
+
+    def mode_is(mode: str) -> dict:
+        return {"Fn::Equals": [delivery, mode]}
+
+    return {
+        f"{prefix}BlockingLogs": mode_is("blocking"),
+        f"{prefix}FireLensS3Logs": mode_is("firelens-s3"),
+        f"{prefix}FireLensLogs": {
+            "Fn::Or": [
+                mode_is("firelens-cloudwatch"),
+                {"Condition": f"{prefix}FireLensS3Logs"},
+            ]
+        },
+    }
+
+
+def log_delivery_rule(prefix: str) -> dict:
+    """
+    Return a template rule which requires LogArchiveBucket when the
+    <prefix>LogDelivery parameter is firelens-s3.
+
+    :param prefix: the logical ID prefix of the <prefix>LogDelivery parameter
+    :type prefix: str
+
+    :return: the rule
+    :rtype: dict
+    """
+    return {
+        "RuleCondition": {"Fn::Equals": [ref(f"{prefix}LogDelivery"), "firelens-s3"]},
+        "Assertions": [
+            {
+                "Assert": {"Fn::Not": [{"Fn::Equals": [ref("LogArchiveBucket"), ""]}]},
+                "AssertDescription": (
+                    f"{prefix}LogDelivery firelens-s3 needs a LogArchiveBucket"
+                ),
+            }
+        ],
+    }
+
+
+def _awslogs(stream_prefix: str, blocking_condition: str | None = None) -> dict:
+    mode = "non-blocking"
+    buffer_size = ref("LogMaxBufferSize")
+    if blocking_condition is not None:
+        mode = {"Fn::If": [blocking_condition, "blocking", "non-blocking"]}
+        buffer_size = {"Fn::If": [blocking_condition, ref("AWS::NoValue"), buffer_size]}
+    return {
+        "logDriver": "awslogs",
+        "options": {
+            "awslogs-group": sub("/ecs/${LogGroup}"),
+            "awslogs-region": ref("AWS::Region"),
+            "awslogs-stream-prefix": stream_prefix,
+            "mode": mode,
+            "max-buffer-size": buffer_size,
+        },
+    }
+
+
+def _firelens(s3_condition: str) -> dict:
+    cloudwatch = {
+        "Name": "cloudwatch_logs",
+        "region": ref("AWS::Region"),
+        "log_group_name": sub("/ecs/${LogGroup}"),
+        "log_stream_prefix": "firelens/",
+        "auto_create_group": "false",
+    }
+    s3 = {
+        "Name": "s3",
+        "region": ref("AWS::Region"),
+        "bucket": ref("LogArchiveBucket"),
+        "compression": "gzip",
+        "use_put_object": "true",
+        "total_file_size": "16M",
+        "upload_timeout": "1m",
+        "s3_key_format": sub("/${LogGroup}/%Y/%m/%d/$TAG/%H%M%S-$UUID.gz"),
+    }
+    return {
+        "logDriver": "awsfirelens",
+        "options": {"Fn::If": [s3_condition, s3, cloudwatch]},
+    }
+
+
+def configure_log_delivery(task_definition: MutableMapping, prefix: str) -> None:
+    """
+    Set the log configuration of every container of a task definition
+    resource from the <prefix>LogDelivery parameter, and add the Fluent Bit
+    sidecar when it is a firelens mode. Call it once the containers are
+    otherwise complete. Conditional sidecars, eg PgBouncer's, are left as
+    they are.
+
+    :param task_definition: an AWS::ECS::TaskDefinition resource. It is
+      modified in place.
+    :type task_definition: MutableMapping
+    :param prefix: the logical ID prefix of the <prefix>LogDelivery parameter
+      and its `log_delivery_conditions`
+    :type prefix: str
+    """
+    firelens = f"{prefix}FireLensLogs"
+    containers = task_definition["Properties"]["ContainerDefinitions"]
+    for container in containers:
+        if "Fn::If" in container:
+            # a conditional sidecar, which keeps its own log configuration
+            continue
+        container["LogConfiguration"] = {
+            "Fn::If": [
+                firelens,
+                _firelens(f"{prefix}FireLensS3Logs"),
+                _awslogs("ecs", f"{prefix}BlockingLogs"),
+            ]
+        }
+        container["DependsOn"] = {
+            "Fn::If": [
+                firelens,
+                [{"ContainerName": LOG_ROUTER, "Condition": "START"}],
+                ref("AWS::NoValue"),
+            ]
+        }
+    # the router's own logs always go to CloudWatch, without blocking it
+    router = {
+        "Name": LOG_ROUTER,
+        "Image": ref("LogRouterImage"),
+        "Essential": True,
+        "MemoryReservation": 50,
+        "FirelensConfiguration": {
+            "Type": "fluentbit",
+            "Options": {"enable-ecs-log-metadata": "true"},
+        },
+        "LogConfiguration": _awslogs("firelens"),
+    }
+    containers.append({"Fn::If": [firelens, router, ref("AWS::NoValue")]})
+
+
+def add_pgbouncer(
+    task_definition: MutableMapping,
+    settings: pgbouncer.PgBouncerSettings | dict,
+) -> None:
+    """
+    Add a PgBouncer sidecar to a task definition resource, when
+    AppDatabaseEndpoint is pgbouncer. The app containers then connect to it
+    on localhost, see `app_container`, and it connects to the database.
+
+    The app opens its database connections once it serves a request or runs
+    a task, so it does not wait for the sidecar to start.
+
+    :param task_definition: an AWS::ECS::TaskDefinition resource. It is
+      modified in place.
+    :type task_definition: MutableMapping
+    :param settings: the pool settings, see `pgbouncer.pgbouncer_settings`,
+      or their lookup in a mapping, see `pgbouncer.mapped_settings`
+    :type settings: pgbouncer.PgBouncerSettings | dict
+    """
+    sidecar = {
+        "Name": PGBOUNCER,
+        "Image": ref("PgBouncerImage"),
+        "Essential": True,
+        # a reservation, not a limit, which the app containers leave room
+        # for since they set no Memory of their own
+        "MemoryReservation": 32,
+        "Environment": [
+            {"Name": "DB_HOST", "Value": database_endpoint("Address")},
+            {"Name": "DB_PORT", "Value": database_endpoint("Port")},
+            {"Name": "DB_NAME", "Value": ref("DBName")},
+            {"Name": "DB_USER", "Value": ref("PostgresUser")},
+            {"Name": "DB_PASSWORD", "Value": ref("PostgresPassword")},
+            {"Name": "LISTEN_PORT", "Value": str(pgbouncer.PORT)},
+            {"Name": "AUTH_TYPE", "Value": "scram-sha-256"},
+            *pgbouncer.settings_environment(settings),
+        ],
+        "LogConfiguration": _awslogs(PGBOUNCER),
+    }
+    task_definition["Properties"]["ContainerDefinitions"].append(
+        {"Fn::If": ["AppsUsePgBouncer", sidecar, ref("AWS::NoValue")]}
+    )
@@ -1,62 +1,89 @@
+import argparse
+from types import ModuleType
+
+from yeastregulatorydbstack.dependency_graph import prune_template
+from yeastregulatorydbstack.image_architecture import check_image_architectures
 from yeastregulatorydbstack.resources import (
     alb,
+    celery,
     ecs_fargate,
+    efs,
     lambda_functions,
     rds_redis_ec2,
     security_groups,
     vpc_subnets_routetables_networkcon,
 )
+from yeastregulatorydbstack.template import Template
 
-HEADER = (
+# the resource modules which make up the stack, in template order
+MODULES = [
+    vpc_subnets_routetables_networkcon,
+    security_groups,
+    lambda_functions,
+    rds_redis_ec2,
+    efs,
+    ecs_fargate,
+    celery,
+    alb,
+]
+
+
+def build_template(modules: list[ModuleType] = MODULES) -> Template:
     """
-AWSTemplateFormatVersion: '2010-09-09'
-Description: CloudFormation template for PostgreSQL RDS, ElastiCache Redis, """
-    + "EC2 and a ECS/Fargate cluster for a django app complete with VPC, "
-    + "subnets, security groups, and IAM roles."
-)
+    Build the in-memory CloudFormation template from a list of resource
+    modules.
+
+    :param modules: resource modules, each with `get_parameters`,
+      `get_resources` and `get_outputs` functions
+    :type modules: list[ModuleType]
+
+    :return: the template
+    :rtype: Template
+    """
+    template = Template()
+    for module in modules:
+        template.add_module(module)
+    return template
 
 
 def create_template(
     parameter_list: list, resource_list: list, output_list: list
 ) -> str:
-    """Create a CloudFormation template."""
-    template = HEADER + "\n\nParameters:\n"
+    """Create a CloudFormation template from lists of yaml fragments."""
+    template = Template()
     for parameter in parameter_list:
-        template += parameter
-    template += "\nResources:\n"
+        template.add_parameters(parameter)
     for resource in resource_list:
-        template += resource
-    template += "\nOutputs:\n"
+        template.add_resources(resource)
     for output in output_list:
-        template += output
-    return template
+        template.add_outputs(output)
+    return template.to_yaml()
 
 
-if __name__ == "__main__":
-    template_body = create_template(
-        parameter_list=[
-            vpc_subnets_routetables_networkcon.get_parameters(),
-            security_groups.get_parameters(),
-            lambda_functions.get_parameters(),
-            rds_redis_ec2.get_parameters(),
-            ecs_fargate.get_parameters(),
-            alb.get_parameters(),
-        ],
-        resource_list=[
-            vpc_subnets_routetables_networkcon.get_resources(),
-            security_groups.get_resources(),
-            lambda_functions.get_resources(),
-            rds_redis_ec2.get_resources(),
-            ecs_fargate.get_resources(),
-            alb.get_resources(),
-        ],
-        output_list=[
-            vpc_subnets_routetables_networkcon.get_outputs(),
-            security_groups.get_outputs(),
-            lambda_functions.get_outputs(),
-            rds_redis_ec2.get_outputs(),
-            ecs_fargate.get_outputs(),
-            alb.get_outputs(),
-        ],
+def parse_args():
+    parser = argparse.ArgumentParser(description="Print the stack template.")
+    parser.add_argument(
+        "--prune-depends-on",
+        action="store_true",
+        help="Remove redundant and unneeded DependsOn entries. "
+        "See yeastregulatorydbstack.dependency_graph",
     )
-    print(template_body)
+    parser.add_argument(
+        "--parameters",
+        help="A json parameters file. Check that its images are built for "
+        "its CPUArchitecture. See yeastregulatorydbstack.image_architecture",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import json
+
+    args = parse_args()
+    template = build_template()
+    if args.parameters:
+        with open(args.parameters, "r", encoding="utf-8") as file:
+            check_image_architectures(template, json.load(file))
+    if args.prune_depends_on:
+        template = prune_template(template)
+    print(template.to_yaml())
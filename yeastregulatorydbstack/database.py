@@ -0,0 +1,99 @@
+"""
+The PostgreSQL endpoints the rest of the stack connects to, whichever
+database backend and connection pooling the stack parameters choose.
+
+DatabaseEngine selects the backend, see rds_redis_ec2.py:
+
+- postgres: the MyDBInstance RDS instance, with ReadReplicaCount read
+  replicas behind the `READER_NAME` weighted DNS name
+- aurora-postgresql-serverless: the MyDBCluster Aurora cluster of Serverless
+  v2 instances, with ReadReplicaCount readers behind the cluster's reader
+  endpoint
+
+AppDatabaseEndpoint selects how the app containers reach the writer: through
+a PgBouncer sidecar on localhost, through the RDS Proxy, or directly.
+"""
+
+from yeastregulatorydbstack.pgbouncer import PORT as PGBOUNCER_PORT
+from yeastregulatorydbstack.template import get_att, sub
+
+AURORA_CONDITION = "UseAurora"
+INSTANCE_CONDITION = "UseRdsInstance"
+# the replica records of the postgres engine, in a private hosted zone
+READER_NAME = "reader.${AWS::StackName}.internal"
+# the port the RDS Proxy listens on, for PostgreSQL
+PROXY_PORT = 5432
+
+
+def database_endpoint(attribute: str) -> dict:
+    """
+    Return an attribute of the writer endpoint of the database: the Aurora
+    cluster's, or the RDS instance's.
+
+    :param attribute: `Address` or `Port`
+    :type attribute: str
+
+    :rtype: dict
+    """
+    return {
+        "Fn::If": [
+            AURORA_CONDITION,
+            get_att("MyDBCluster", f"Endpoint.{attribute}"),
+            get_att("MyDBInstance", f"Endpoint.{attribute}"),
+        ]
+    }
+
+
+def app_endpoint(attribute: str) -> dict:
+    """
+    Return an attribute of the endpoint the app containers write through,
+    see AppDatabaseEndpoint.
+
+    :param attribute: `Address` or `Port`
+    :type attribute: str
+
+    :rtype: dict
+    """
+    if attribute == "Address":
+        pgbouncer, proxy = "127.0.0.1", get_att("MyDBProxy", "Endpoint")
+    else:
+        pgbouncer, proxy = str(PGBOUNCER_PORT), str(PROXY_PORT)
+    return {
+        "Fn::If": [
+            "AppsUsePgBouncer",
+            pgbouncer,
+            {"Fn::If": ["AppsUseDBProxy", proxy, database_endpoint(attribute)]},
+        ]
+    }
+
+
+def reader_endpoint(attribute: str) -> dict:
+    """
+    Return an attribute of the endpoint the app containers read through: the
+    Aurora reader endpoint, which is the writer without readers, the read
+    replicas, or without replicas the `app_endpoint`.
+
+    :param attribute: `Address` or `Port`
+    :type attribute: str
+
+    :rtype: dict
+    """
+    if attribute == "Address":
+        aurora = get_att("MyDBCluster", "ReadEndpoint.Address")
+        replicas = sub(READER_NAME)
+    else:
+        aurora = get_att("MyDBCluster", "Endpoint.Port")
+        replicas = get_att("MyDBInstance", "Endpoint.Port")
+    return {
+        "Fn::If": [
+            AURORA_CONDITION,
+            aurora,
+            {
+                "Fn::If": [
+                    "InstanceReadReplica1",
+                    replicas,
+                    app_endpoint(attribute),
+                ]
+            },
+        ]
+    }
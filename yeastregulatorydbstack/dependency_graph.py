@@ -0,0 +1,374 @@
+"""
+Build the dependency graph of a CloudFormation template and find the
+explicit `DependsOn` edges which only serialize the stack build.
+
+CloudFormation creates every resource whose dependencies are complete in
+parallel. Dependencies come from `Ref`, `GetAtt` and `Sub` references
+(implicit), in a resource's Properties or Metadata, and from `DependsOn`
+(explicit). References in Metadata order the WaitConditionHandle gates, eg
+DatabaseReady, which stand in for a conditional resource in a DependsOn. An
+explicit edge is
+
+- redundant if the dependency is already implied, either by a reference or
+  by a longer path through the graph which does not pass through a resource
+  with a Condition, since that path is gone when the condition is false, and
+- unneeded if it matches a resource type pair in `UNNEEDED_DEPENDENCIES`,
+  ie an ordering which CloudFormation and the service do not require.
+
+Removing a redundant edge does not change the order in which anything gets
+built, only how much of it can be built at the same time. Removing an
+unneeded edge does change the order, so a pair only belongs in
+`UNNEEDED_DEPENDENCIES` if nothing which waits on the dependent needs the
+dependency either. eg the subnets' DependsOn on PublicRoute stays: the load
+balancer and the services only wait on the subnets, and need the route to
+the internet gateway.
+"""
+
+import argparse
+import copy
+import re
+from collections.abc import Iterable, Mapping
+
+from ruamel.yaml.comments import TaggedScalar
+
+from yeastregulatorydbstack.template import Template
+
+# (dependent resource type, dependency resource type) pairs for which an
+# explicit DependsOn is not required
+UNNEEDED_DEPENDENCIES = {
+    # registering a task definition does not require the database or cache.
+    # Where the endpoints are used in the container environment, the GetAtt
+    # already orders the two
+    ("AWS::ECS::TaskDefinition", "AWS::RDS::DBInstance"),
+    ("AWS::ECS::TaskDefinition", "AWS::ElastiCache::CacheCluster"),
+}
+
+# matches ${Name} and ${Name.Attribute} in a Sub string, but not ${!Literal}
+_SUB_VARIABLE = re.compile(r"\$\{([^!}][^}]*)\}")
+
+
+def _sub_references(string: str, local_variables: Iterable[str] = ()) -> set[str]:
+    references = set()
+    for variable in _SUB_VARIABLE.findall(string):
+        name = variable.split(".")[0].strip()
+        if name not in local_variables:
+            references.add(name)
+    return references
+
+
+def find_references(value: object) -> set[str]:
+    """
+    Find the logical IDs referenced by `Ref`, `GetAtt` and `Sub`, in both the
+    short (`!Ref X`) and long (`{"Ref": "X"}`) form, anywhere in a value.
+
+    Pseudo parameters, eg `AWS::Region`, are not included.
+
+    :param value: a resource definition, or any part of one
+    :type value: object
+
+    :return: the referenced logical IDs
+    :rtype: set[str]
+    """
+    references: set[str] = set()
+    tag = getattr(getattr(value, "tag", None), "value", None)
+
+    if isinstance(value, TaggedScalar):
+        if tag == "!Ref":
+            references.add(str(value.value))
+        elif tag == "!GetAtt":
+            references.add(str(value.value).split(".")[0])
+        elif tag == "!Sub":
+            references |= _sub_references(str(value.value))
+    elif isinstance(value, Mapping):
+        for key, item in value.items():
+            if key == "Ref" and isinstance(item, str):
+                references.add(item)
+            elif key == "Fn::GetAtt":
+                target = item[0] if isinstance(item, list) else str(item)
+                references.add(target.split(".")[0])
+            elif key == "Fn::Sub":
+                references |= _sub_from_item(item)
+            else:
+                references |= find_references(item)
+    elif isinstance(value, list):
+        if tag == "!Sub":
+            references |= _sub_from_item(value)
+        elif tag == "!GetAtt":
+            references.add(str(value[0]))
+        else:
+            for item in value:
+                references |= find_references(item)
+
+    return {r for r in references if not r.startswith("AWS::")}
+
+
+def _sub_from_item(item: object) -> set[str]:
+    # Fn::Sub is either a string, or a [string, {variable: value}] list
+    if isinstance(item, list):
+        local_variables = item[1] if len(item) > 1 else {}
+        return _sub_references(str(item[0]), local_variables) | find_references(
+            local_variables
+        )
+    return _sub_references(str(item))
+
+
+def _depends_on(definition: Mapping) -> list[str]:
+    depends_on = definition.get("DependsOn", [])
+    return [depends_on] if isinstance(depends_on, str) else list(depends_on)
+
+
+class DependencyGraph:
+    """
+    The resource dependency graph of a template. Edges point from a resource
+    to the resources which must be complete before it can be created.
+    """
+
+    def __init__(self, template: Template) -> None:
+        """
+        :param template: the template to analyze
+        :type template: Template
+
+        :raises ValueError: if a DependsOn names a resource which is not
+          in the template
+        """
+        self.template = template
+        self.resource_types: dict[str, str] = {}
+        # resources with a Condition, which may not be created
+        self.conditional: set[str] = set()
+        self.implicit: dict[str, set[str]] = {}
+        self.explicit: dict[str, set[str]] = {}
+
+        resources = template.resources
+        for logical_id, definition in resources.items():
+            self.resource_types[logical_id] = definition.get("Type", "")
+            if "Condition" in definition:
+                self.conditional.add(logical_id)
+            # references to parameters are not graph edges
+            self.implicit[logical_id] = {
+                r
+                for section in ("Properties", "Metadata")
+                for r in find_references(definition.get(section, {}))
+                if r in resources and r != logical_id
+            }
+            explicit = set(_depends_on(definition))
+            missing = explicit - set(resources)
+            if missing:
+                raise ValueError(
+                    f"{logical_id} DependsOn resources which are not in the "
+                    f"template: {sorted(missing)}"
+                )
+            self.explicit[logical_id] = explicit
+
+    def dependencies(self, logical_id: str) -> set[str]:
+        """Return the direct dependencies, implicit and explicit, of a resource."""
+        return self.implicit[logical_id] | self.explicit[logical_id]
+
+    def topological_order(self) -> list[str]:
+        """
+        Return the resources ordered so that each comes after its
+        dependencies.
+
+        :return: the ordered logical IDs
+        :rtype: list[str]
+        :raises ValueError: if the graph contains a cycle
+        """
+        remaining = {r: set(self.dependencies(r)) for r in self.resource_types}
+        order: list[str] = []
+        ready = [r for r, deps in remaining.items() if not deps]
+        while ready:
+            logical_id = ready.pop(0)
+            order.append(logical_id)
+            for other, deps in remaining.items():
+                if logical_id in deps:
+                    deps.discard(logical_id)
+                    if not deps:
+                        ready.append(other)
+        if len(order) != len(remaining):
+            cycle = sorted(r for r, deps in remaining.items() if deps)
+            raise ValueError(f"Circular dependency between {cycle}")
+        return order
+
+    def waves(self) -> list[list[str]]:
+        """
+        Group the resources into the waves in which CloudFormation could
+        create them, assuming every resource takes the same time.
+
+        :return: lists of logical IDs. Wave n only depends on waves < n
+        :rtype: list[list[str]]
+        """
+        level: dict[str, int] = {}
+        for logical_id in self.topological_order():
+            level[logical_id] = 1 + max(
+                (level[d] for d in self.dependencies(logical_id)), default=-1
+            )
+        waves: list[list[str]] = [
+            [] for _ in range(max(level.values(), default=-1) + 1)
+        ]
+        for logical_id, n in level.items():
+            waves[n].append(logical_id)
+        return waves
+
+    def _reachable(self, start: Iterable[str], skip: set[tuple[str, str]]) -> set[str]:
+        seen: set[str] = set()
+        stack = list(start)
+        while stack:
+            logical_id = stack.pop()
+            if logical_id in seen:
+                continue
+            seen.add(logical_id)
+            # a path through a resource which may not be created orders
+            # nothing
+            if logical_id in self.conditional:
+                continue
+            stack.extend(
+                d for d in self.dependencies(logical_id) if (logical_id, d) not in skip
+            )
+        return seen
+
+    def unneeded_depends_on(self) -> dict[str, set[str]]:
+        """
+        Return the explicit edges which match `UNNEEDED_DEPENDENCIES`.
+
+        :return: a map of resource to the DependsOn entries which can go
+        :rtype: dict[str, set[str]]
+        """
+        unneeded = {}
+        for logical_id, explicit in self.explicit.items():
+            source_type = self.resource_types[logical_id]
+            edges = {
+                d
+                for d in explicit
+                if (source_type, self.resource_types[d]) in UNNEEDED_DEPENDENCIES
+                and d not in self.implicit[logical_id]
+            }
+            if edges:
+                unneeded[logical_id] = edges
+        return unneeded
+
+    def redundant_depends_on(
+        self, removed: Mapping[str, set[str]] | None = None
+    ) -> dict[str, set[str]]:
+        """
+        Return the explicit edges which are implied by a reference or by a
+        longer path through the graph. Paths through a resource with a
+        Condition do not count.
+
+        :param removed: edges to treat as already removed, eg the output of
+          `unneeded_depends_on`, so that an edge is not called redundant
+          because of a path which will itself be pruned
+        :type removed: Mapping[str, set[str]] | None
+
+        :return: a map of resource to the DependsOn entries which can go
+        :rtype: dict[str, set[str]]
+        """
+        skip = {(a, b) for a, deps in (removed or {}).items() for b in deps}
+        redundant = {}
+        for logical_id, explicit in self.explicit.items():
+            edges = set()
+            for dependency in explicit:
+                if (logical_id, dependency) in skip:
+                    continue
+                if dependency in self.implicit[logical_id]:
+                    edges.add(dependency)
+                    continue
+                # is the dependency reachable through any other direct
+                # dependency? Transitive reduction of a DAG is unique, so all
+                # such edges can be removed together
+                others = self.dependencies(logical_id) - {dependency}
+                if dependency in self._reachable(
+                    (o for o in others if (logical_id, o) not in skip), skip
+                ):
+                    edges.add(dependency)
+            if edges:
+                redundant[logical_id] = edges
+        return redundant
+
+    def prunable_depends_on(self, unneeded: bool = True) -> dict[str, set[str]]:
+        """
+        Return the redundant, and optionally the unneeded, explicit edges.
+
+        :param unneeded: include the edges in `UNNEEDED_DEPENDENCIES`
+        :type unneeded: bool
+
+        :return: a map of resource to the DependsOn entries which can go
+        :rtype: dict[str, set[str]]
+        """
+        prunable = self.unneeded_depends_on() if unneeded else {}
+        for logical_id, edges in self.redundant_depends_on(prunable).items():
+            prunable.setdefault(logical_id, set()).update(edges)
+        return prunable
+
+
+def prune_template(template: Template, unneeded: bool = True) -> Template:
+    """
+    Return a copy of a template with the prunable DependsOn entries removed.
+
+    :param template: the template to prune. It is not modified.
+    :type template: Template
+    :param unneeded: also remove the edges in `UNNEEDED_DEPENDENCIES`
+    :type unneeded: bool
+
+    :return: the pruned template
+    :rtype: Template
+    """
+    prunable = DependencyGraph(template).prunable_depends_on(unneeded=unneeded)
+    pruned = copy.deepcopy(template)
+    for logical_id, edges in prunable.items():
+        definition = pruned.resources[logical_id]
+        depends_on = [d for d in _depends_on(definition) if d not in edges]
+        if depends_on:
+            definition["DependsOn"] = depends_on
+        else:
+            del definition["DependsOn"]
+    return pruned
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Report, and optionally prune, DependsOn edges which "
+        "serialize the stack build."
+    )
+    parser.add_argument(
+        "template",
+        nargs="?",
+        help="A rendered template. Defaults to the template built by "
+        "create_template.",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Print the pruned template rather than the report.",
+    )
+    parser.add_argument(
+        "--keep-unneeded",
+        action="store_true",
+        help="Only prune redundant edges, not those in UNNEEDED_DEPENDENCIES.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from yeastregulatorydbstack.create_template import build_template
+
+    args = parse_args()
+    if args.template:
+        with open(args.template, "r", encoding="utf-8") as file:
+            template = Template.from_yaml(file.read())
+    else:
+        template = build_template()
+
+    if args.prune:
+        print(prune_template(template, unneeded=not args.keep_unneeded).to_yaml())
+    else:
+        graph = DependencyGraph(template)
+        pruned = DependencyGraph(
+            prune_template(template, unneeded=not args.keep_unneeded)
+        )
+        for label, edges in [
+            ("redundant", graph.redundant_depends_on()),
+            ("unneeded", graph.unneeded_depends_on()),
+        ]:
+            print(f"{label} DependsOn:")
+            for logical_id, dependencies in sorted(edges.items()):
+                print(f"  {logical_id}: {', '.join(sorted(dependencies))}")
+        print(f"creation waves: {len(graph.waves())} -> {len(pruned.waves())}")
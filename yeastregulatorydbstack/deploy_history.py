@@ -0,0 +1,313 @@
+"""
+A local SQLite record of how long each resource took to provision, per deploy.
+
+`deploy_stack` records the resource timings of every deploy it waits on,
+keyed by stack, template hash (see `deploy_stack.template_hash`) and resource
+type. The CLI reports the p50/p95 provisioning time per resource type and
+compares two template versions, eg
+
+    python -m yeastregulatorydbstack.deploy_history report --stack MyStack
+    python -m yeastregulatorydbstack.deploy_history compare \\
+        --stack MyStack <old template hash> <new template hash>
+
+`deploys` lists the recorded deploys and their template hashes, which may be
+abbreviated to a prefix.
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+from collections.abc import Iterable, Mapping
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from yeastregulatorydbstack.deploy_time import STACK_TYPE, resource_timings
+
+DEFAULT_PATH = os.environ.get(
+    "DEPLOY_HISTORY_DB",
+    os.path.join(
+        os.path.expanduser("~"), ".yeastregulatorydbstack", "deploy_history.sqlite3"
+    ),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deploys (
+    id INTEGER PRIMARY KEY,
+    stack_name TEXT NOT NULL,
+    template_hash TEXT NOT NULL,
+    stack_status TEXT NOT NULL,
+    recorded_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resource_timings (
+    deploy_id INTEGER NOT NULL REFERENCES deploys(id),
+    logical_id TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    action TEXT NOT NULL,
+    status TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deploys_stack_hash
+    ON deploys (stack_name, template_hash);
+CREATE INDEX IF NOT EXISTS resource_timings_type
+    ON resource_timings (deploy_id, resource_type);
+"""
+
+
+class Percentiles(NamedTuple):
+    key: str
+    action: str
+    count: int
+    p50: float
+    p95: float
+
+
+class Regression(NamedTuple):
+    key: str
+    action: str
+    baseline_p50: float
+    candidate_p50: float
+
+
+def connect(path: str = DEFAULT_PATH) -> sqlite3.Connection:
+    """
+    Open, and if necessary create, the history database.
+
+    :param path: the database file. `:memory:` is accepted.
+    :type path: str
+
+    :return: the connection
+    :rtype: sqlite3.Connection
+    """
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def record_deploy(
+    connection: sqlite3.Connection,
+    stack_name: str,
+    template_hash: str,
+    stack_status: str,
+    events: Iterable[Mapping],
+) -> int:
+    """
+    Record the resource timings of a deploy.
+
+    :param connection: see `connect`
+    :type connection: sqlite3.Connection
+    :param stack_name: the stack name
+    :type stack_name: str
+    :param template_hash: the hash of the deployed template and parameters
+    :type template_hash: str
+    :param stack_status: the final stack status, eg UPDATE_COMPLETE
+    :type stack_status: str
+    :param events: the stack events of the deploy, eg `WatchResult.events`
+    :type events: Iterable[Mapping]
+
+    :return: the deploy id
+    :rtype: int
+    """
+    with connection:
+        cursor = connection.execute(
+            "INSERT INTO deploys (stack_name, template_hash, stack_status, "
+            "recorded_at) VALUES (?, ?, ?, ?)",
+            (
+                stack_name,
+                template_hash,
+                stack_status,
+                datetime.now(timezone.utc).isoformat(),
+            ),
+        )
+        deploy_id = cursor.lastrowid
+        connection.executemany(
+            "INSERT INTO resource_timings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    deploy_id,
+                    t.logical_id,
+                    t.resource_type,
+                    t.action,
+                    t.status,
+                    t.start.isoformat(),
+                    t.end.isoformat(),
+                    t.seconds,
+                )
+                for t in resource_timings(events)
+            ],
+        )
+    return deploy_id
+
+
+def _percentile(values: list[float], percent: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def percentiles(
+    connection: sqlite3.Connection,
+    stack_name: str | None = None,
+    template_hash: str | None = None,
+    by_resource: bool = False,
+) -> list[Percentiles]:
+    """
+    Return the p50 and p95 of the completed resource timings.
+
+    :param connection: see `connect`
+    :type connection: sqlite3.Connection
+    :param stack_name: only include this stack
+    :type stack_name: str | None
+    :param template_hash: only include this template hash, or hash prefix
+    :type template_hash: str | None
+    :param by_resource: group by logical ID rather than resource type
+    :type by_resource: bool
+
+    :return: one row per resource type (or logical ID) and action, slowest
+      p95 first
+    :rtype: list[Percentiles]
+    """
+    key = "t.logical_id" if by_resource else "t.resource_type"
+    query = (
+        f"SELECT {key}, t.action, t.seconds FROM resource_timings t "
+        "JOIN deploys d ON d.id = t.deploy_id "
+        "WHERE t.status = 'COMPLETE' AND t.resource_type != ?"
+    )
+    arguments: list = [STACK_TYPE]
+    if stack_name:
+        query += " AND d.stack_name = ?"
+        arguments.append(stack_name)
+    if template_hash:
+        query += " AND d.template_hash LIKE ?"
+        arguments.append(f"{template_hash}%")
+
+    grouped: dict[tuple[str, str], list[float]] = {}
+    for group, action, seconds in connection.execute(query, arguments):
+        grouped.setdefault((group, action), []).append(seconds)
+    rows = [
+        Percentiles(
+            group,
+            action,
+            len(values),
+            _percentile(values, 50),
+            _percentile(values, 95),
+        )
+        for (group, action), values in grouped.items()
+    ]
+    return sorted(rows, key=lambda r: r.p95, reverse=True)
+
+
+def regressions(
+    connection: sqlite3.Connection,
+    stack_name: str | None,
+    baseline_hash: str,
+    candidate_hash: str,
+    threshold: float = 1.25,
+    min_seconds: float = 30,
+) -> list[Regression]:
+    """
+    Return the resource types whose p50 provisioning time grew between two
+    template versions.
+
+    :param connection: see `connect`
+    :type connection: sqlite3.Connection
+    :param stack_name: only include this stack
+    :type stack_name: str | None
+    :param baseline_hash: the earlier template hash, or hash prefix
+    :type baseline_hash: str
+    :param candidate_hash: the later template hash, or hash prefix
+    :type candidate_hash: str
+    :param threshold: the ratio of candidate to baseline p50 which counts as
+      a regression
+    :type threshold: float
+    :param min_seconds: ignore increases smaller than this
+    :type min_seconds: float
+
+    :return: the regressions, largest increase first. Resource types which
+      only appear in the candidate are included with a baseline of 0.
+    :rtype: list[Regression]
+    """
+    baseline = {
+        (r.key, r.action): r.p50
+        for r in percentiles(connection, stack_name, baseline_hash)
+    }
+    found = []
+    for row in percentiles(connection, stack_name, candidate_hash):
+        before = baseline.get((row.key, row.action), 0.0)
+        if row.p50 - before >= min_seconds and row.p50 > before * threshold:
+            found.append(Regression(row.key, row.action, before, row.p50))
+    return sorted(found, key=lambda r: r.candidate_p50 - r.baseline_p50, reverse=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query the deploy history.")
+    parser.add_argument("--db", default=DEFAULT_PATH, help="The history database.")
+    parser.add_argument("--stack", help="Only include this stack.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("deploys", help="List the recorded deploys.")
+
+    report = subparsers.add_parser(
+        "report", help="p50/p95 provisioning time per resource type."
+    )
+    report.add_argument("--template-hash", help="Only include this template.")
+    report.add_argument(
+        "--by-resource",
+        action="store_true",
+        help="Group by logical ID rather than resource type.",
+    )
+
+    compare = subparsers.add_parser(
+        "compare", help="Flag resource types which got slower between templates."
+    )
+    compare.add_argument("baseline_hash", help="The earlier template hash.")
+    compare.add_argument("candidate_hash", help="The later template hash.")
+    compare.add_argument("--threshold", type=float, default=1.25)
+    compare.add_argument("--min-seconds", type=float, default=30)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    connection = connect(args.db)
+    if args.command == "deploys":
+        query = (
+            "SELECT stack_name, template_hash, stack_status, recorded_at FROM deploys"
+        )
+        arguments = []
+        if args.stack:
+            query += " WHERE stack_name = ?"
+            arguments.append(args.stack)
+        for stack_name, digest, stack_status, recorded_at in connection.execute(
+            query + " ORDER BY id", arguments
+        ):
+            print(f"{recorded_at}  {stack_name}  {digest[:12]}  {stack_status}")
+    elif args.command == "report":
+        rows = percentiles(connection, args.stack, args.template_hash, args.by_resource)
+        width = max((len(r.key) for r in rows), default=8)
+        print(f"{'resource':<{width}}  {'action':<6}  {'n':>4}  {'p50':>7}  {'p95':>7}")
+        for r in rows:
+            print(
+                f"{r.key:<{width}}  {r.action:<6}  {r.count:>4}"
+                f"  {r.p50:>6.0f}s  {r.p95:>6.0f}s"
+            )
+    else:
+        found = regressions(
+            connection,
+            args.stack,
+            args.baseline_hash,
+            args.candidate_hash,
+            args.threshold,
+            args.min_seconds,
+        )
+        if not found:
+            print("No regressions.")
+        for r in found:
+            print(
+                f"REGRESSION {r.key} {r.action}: p50 "
+                f"{r.baseline_p50:.0f}s -> {r.candidate_p50:.0f}s"
+            )
@@ -0,0 +1,392 @@
+"""
+Deploy a new DjangoAppImage without a full stack update.
+
+A CloudFormation update re-evaluates every resource, which takes minutes
+even when only the image changed. `deploy_image` instead registers a new
+revision of each of the stack's task definitions which run the current image,
+with only the image swapped, and points the ECS services at the new
+revisions. Once the services are stable, and each one's primary deployment
+runs its new revision, the stack's DjangoAppImage parameter is updated, with
+the previous template, so that the next `deploy_stack` does not roll the
+image back. A service whose deployment failed, eg which the circuit breaker
+rolled back, raises instead and the parameter is left alone. The same update sets each updated service's task
+definition ARN parameter to the revision it already runs, see
+`fargate.pin_task_definition`, so that CloudFormation's own revisions of the
+task definitions do not redeploy the services. The next `deploy_stack` leaves
+those parameters empty, and returns the services to the template's task
+definitions.
+
+    python -m yeastregulatorydbstack.deploy_image \\
+      --stack-name YeastRegulatoryDBStack \\
+      --image 040367161929.dkr.ecr.us-east-2.amazonaws.com/django-stack:v2
+"""
+
+import argparse
+from collections.abc import Callable, Mapping
+
+import boto3
+from botocore.exceptions import WaiterError
+
+from yeastregulatorydbstack.deploy_stack import CAPABILITIES, get_stack
+from yeastregulatorydbstack.fargate import pinned_task_definition
+from yeastregulatorydbstack.image_architecture import check_image_architectures
+from yeastregulatorydbstack.template import Template
+
+IMAGE_PARAMETER = "DjangoAppImage"
+# the describe_task_definition fields which register_task_definition accepts
+TASK_DEFINITION_FIELDS = (
+    "family",
+    "taskRoleArn",
+    "executionRoleArn",
+    "networkMode",
+    "containerDefinitions",
+    "volumes",
+    "placementConstraints",
+    "requiresCompatibilities",
+    "cpu",
+    "memory",
+    "pidMode",
+    "ipcMode",
+    "proxyConfiguration",
+    "inferenceAccelerators",
+    "ephemeralStorage",
+    "runtimePlatform",
+)
+# describe_services accepts at most this many services per call
+_DESCRIBE_SERVICES_LIMIT = 10
+
+
+def stack_services(cf_client, stack_name: str) -> tuple[str, dict[str, str]]:
+    """
+    Return the ECS cluster of a stack and the ARNs of its services, by
+    logical ID.
+
+    :raises ValueError: if the stack has no ECS cluster
+    :rtype: tuple[str, dict[str, str]]
+    """
+    cluster = None
+    services = {}
+    kwargs = {"StackName": stack_name}
+    while True:
+        response = cf_client.list_stack_resources(**kwargs)
+        for resource in response["StackResourceSummaries"]:
+            if resource["ResourceType"] == "AWS::ECS::Cluster":
+                cluster = resource["PhysicalResourceId"]
+            elif resource["ResourceType"] == "AWS::ECS::Service":
+                services[resource["LogicalResourceId"]] = resource["PhysicalResourceId"]
+        if not response.get("NextToken"):
+            break
+        kwargs["NextToken"] = response["NextToken"]
+    if cluster is None:
+        raise ValueError(f"Stack {stack_name} has no ECS cluster")
+    return cluster, services
+
+
+def swap_image(task_definition: Mapping, old_image: str, new_image: str) -> dict:
+    """
+    Return the register_task_definition arguments of a new revision of a
+    task definition, with `new_image` in every container which runs
+    `old_image`.
+
+    :param task_definition: a describe_task_definition response, with tags
+    :type task_definition: Mapping
+    :param old_image: the image to replace
+    :type old_image: str
+    :param new_image: the image to run instead
+    :type new_image: str
+
+    :return: register_task_definition keyword arguments
+    :rtype: dict
+    """
+    description = task_definition["taskDefinition"]
+    revision = {
+        field: description[field]
+        for field in TASK_DEFINITION_FIELDS
+        if description.get(field) not in (None, [], {})
+    }
+    revision["containerDefinitions"] = [
+        (
+            {**container, "image": new_image}
+            if container["image"] == old_image
+            else container
+        )
+        for container in description["containerDefinitions"]
+    ]
+    if task_definition.get("tags"):
+        revision["tags"] = task_definition["tags"]
+    return revision
+
+
+def _runs_image(task_definition: Mapping, image: str) -> bool:
+    return any(
+        container["image"] == image
+        for container in task_definition["taskDefinition"]["containerDefinitions"]
+    )
+
+
+def _describe_services(ecs_client, cluster: str, service_arns: list[str]) -> list:
+    services = []
+    for start in range(0, len(service_arns), _DESCRIBE_SERVICES_LIMIT):
+        services.extend(
+            ecs_client.describe_services(
+                cluster=cluster,
+                services=service_arns[start : start + _DESCRIBE_SERVICES_LIMIT],
+            )["services"]
+        )
+    return services
+
+
+def check_deployments(
+    ecs_client, cluster: str, task_definitions: Mapping[str, str]
+) -> None:
+    """
+    Check that the primary deployment of each service runs the task
+    definition it was updated to, and has completed. services_stable only
+    waits for the running count to settle, which it also does once the
+    deployment circuit breaker has rolled a service back to its previous
+    task definition.
+
+    :param cluster: the ECS cluster
+    :type cluster: str
+    :param task_definitions: the expected task definition ARN, by service ARN
+    :type task_definitions: Mapping[str, str]
+
+    :raises ValueError: naming each service whose deployment did not complete
+    """
+    failed = []
+    for service in _describe_services(ecs_client, cluster, list(task_definitions)):
+        primary = next(
+            (d for d in service.get("deployments", []) if d["status"] == "PRIMARY"),
+            {},
+        )
+        expected = task_definitions[service["serviceArn"]]
+        if primary.get("taskDefinition") != expected:
+            failed.append(
+                f"{service['serviceName']} runs {primary.get('taskDefinition')}, "
+                f"not {expected}"
+            )
+        elif primary.get("rolloutState") != "COMPLETED":
+            failed.append(
+                f"{service['serviceName']} deployment is "
+                f"{primary.get('rolloutState')}"
+            )
+    if failed:
+        raise ValueError("Deployment failed: " + "; ".join(failed))
+
+
+def reconcile_parameter(
+    cf_client,
+    stack: Mapping,
+    image: str,
+    task_definitions: Mapping[str, str] | None = None,
+) -> None:
+    """
+    Update the stack's DjangoAppImage parameter to `image`, and pin services
+    to the task definition revisions they run, keeping the template and every
+    other parameter, and wait for the update to finish.
+
+    :param stack: the describe_stacks description of the stack
+    :type stack: Mapping
+    :param image: the new image URI
+    :type image: str
+    :param task_definitions: task definition ARNs, by the logical ID of the
+      service which runs them. A service is only pinned if the stack has its
+      task definition ARN parameter, see `fargate.pin_task_definition`.
+    :type task_definitions: Mapping[str, str] | None
+
+    :raises ValueError: if the update fails, eg rolls back
+    """
+    values = {IMAGE_PARAMETER: image}
+    for service, arn in (task_definitions or {}).items():
+        values[pinned_task_definition(service)[0]] = arn
+    cf_client.update_stack(
+        StackName=stack["StackName"],
+        UsePreviousTemplate=True,
+        Parameters=[
+            (
+                {"ParameterKey": key, "ParameterValue": values[key]}
+                if key in values
+                else {"ParameterKey": key, "UsePreviousValue": True}
+            )
+            for key in (p["ParameterKey"] for p in stack.get("Parameters", []))
+        ],
+        Capabilities=CAPABILITIES,
+    )
+    try:
+        cf_client.get_waiter("stack_update_complete").wait(
+            StackName=stack["StackName"], WaiterConfig={"Delay": 10}
+        )
+    except WaiterError as e:
+        status = (e.last_response or {}).get("Stacks", [{}])[0].get("StackStatus")
+        raise ValueError(
+            f"Updating the {IMAGE_PARAMETER} parameter of stack "
+            f"{stack['StackName']} failed with {status}"
+        ) from e
+
+
+def deploy_image(
+    stack_name: str,
+    image: str,
+    wait: bool = True,
+    reconcile: bool = True,
+    check_images: bool = True,
+    cf_client=None,
+    ecs_client=None,
+    printer: Callable[[str], None] = print,
+) -> str:
+    """
+    Run a new DjangoAppImage on a stack's ECS services.
+
+    :param stack_name: the stack name
+    :type stack_name: str
+    :param image: the new image URI
+    :type image: str
+    :param wait: wait for the services to reach a steady state, and check
+      that their deployments completed
+    :type wait: bool
+    :param reconcile: once the services are stable, update the stack's
+      DjangoAppImage parameter. Without it, the next stack update rolls the
+      image back. Ignored without `wait`, since a deployment which is not
+      known to have completed may yet be rolled back.
+    :type reconcile: bool
+    :param check_images: check that the image is built for the stack's
+      CPUArchitecture. See `image_architecture`.
+    :type check_images: bool
+    :param cf_client: a boto3 CloudFormation client. Defaults to a new one.
+    :param ecs_client: a boto3 ECS client. Defaults to a new one.
+    :param printer: called with each line of progress
+    :type printer: Callable[[str], None]
+
+    :return: `unchanged` if the stack already runs the image, otherwise
+      `deployed`
+    :rtype: str
+    :raises ValueError: if the stack does not exist, is being updated, or
+      has no DjangoAppImage parameter, or if a service's deployment or the
+      parameter update failed
+    """
+    cf_client = cf_client or boto3.client("cloudformation")
+    ecs_client = ecs_client or boto3.client("ecs")
+
+    stack = get_stack(cf_client, stack_name)
+    if stack is None:
+        raise ValueError(f"Stack {stack_name} does not exist")
+    if stack["StackStatus"].endswith("_IN_PROGRESS"):
+        raise ValueError(f"Stack {stack_name} is {stack['StackStatus']}")
+    parameters = stack.get("Parameters", [])
+    current = next(
+        (
+            p["ParameterValue"]
+            for p in parameters
+            if p["ParameterKey"] == IMAGE_PARAMETER
+        ),
+        None,
+    )
+    if current is None:
+        raise ValueError(f"Stack {stack_name} has no {IMAGE_PARAMETER} parameter")
+    if current == image:
+        printer(f"Stack {stack_name} already runs {image}.")
+        return "unchanged"
+    if check_images:
+        # the first value of a parameter wins
+        check_image_architectures(
+            Template(),
+            [{"ParameterKey": IMAGE_PARAMETER, "ParameterValue": image}, *parameters],
+        )
+
+    cluster, service_ids = stack_services(cf_client, stack_name)
+    logical_ids = {arn: logical_id for logical_id, arn in service_ids.items()}
+    services = _describe_services(ecs_client, cluster, list(service_ids.values()))
+
+    revisions: dict[str, str | None] = {}
+    updated = {}
+    pinned = {}
+    for service in services:
+        current_arn = service["taskDefinition"]
+        if current_arn not in revisions:
+            task_definition = ecs_client.describe_task_definition(
+                taskDefinition=current_arn, include=["TAGS"]
+            )
+            revisions[current_arn] = None
+            if _runs_image(task_definition, current):
+                revisions[current_arn] = ecs_client.register_task_definition(
+                    **swap_image(task_definition, current, image)
+                )["taskDefinition"]["taskDefinitionArn"]
+                printer(f"Registered {revisions[current_arn]}")
+        if revisions[current_arn] is None:
+            continue
+        ecs_client.update_service(
+            cluster=cluster,
+            service=service["serviceArn"],
+            taskDefinition=revisions[current_arn],
+        )
+        updated[service["serviceArn"]] = revisions[current_arn]
+        pinned[logical_ids[service["serviceArn"]]] = revisions[current_arn]
+        printer(f"Updated {service['serviceName']}")
+
+    if not wait:
+        if reconcile:
+            printer(
+                f"Not waiting, so the {IMAGE_PARAMETER} parameter of stack "
+                f"{stack_name} is left at {current}."
+            )
+        return "deployed"
+
+    if updated:
+        printer(f"Waiting for {len(updated)} services to be stable...")
+        waiter = ecs_client.get_waiter("services_stable")
+        service_arns = list(updated)
+        for start in range(0, len(service_arns), _DESCRIBE_SERVICES_LIMIT):
+            waiter.wait(
+                cluster=cluster,
+                services=service_arns[start : start + _DESCRIBE_SERVICES_LIMIT],
+                WaiterConfig={"Delay": 10},
+            )
+        check_deployments(ecs_client, cluster, updated)
+        printer("Services are stable.")
+
+    if reconcile:
+        printer(f"Updating the {IMAGE_PARAMETER} parameter of stack {stack_name}...")
+        reconcile_parameter(cf_client, stack, image, pinned)
+        printer(f"Stack {stack_name} now runs {image}.")
+    return "deployed"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Deploy a new DjangoAppImage to the ECS services directly, "
+        "then update the stack parameter."
+    )
+    parser.add_argument(
+        "--stack-name",
+        default="YeastRegulatoryDBStack",
+        help="The stack whose services run the image.",
+    )
+    parser.add_argument("--image", required=True, help="The new image URI.")
+    parser.add_argument(
+        "--no-wait",
+        action="store_true",
+        help="Exit once the services are updated, rather than waiting for "
+        "them to be stable. The stack parameter is then not updated.",
+    )
+    parser.add_argument(
+        "--no-reconcile",
+        action="store_true",
+        help="Do not update the stack's DjangoAppImage parameter.",
+    )
+    parser.add_argument(
+        "--skip-image-check",
+        action="store_true",
+        help="Do not check that the image is built for CPUArchitecture.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    deploy_image(
+        args.stack_name,
+        args.image,
+        wait=not args.no_wait,
+        reconcile=not args.no_reconcile,
+        check_images=not args.skip_image_check,
+    )
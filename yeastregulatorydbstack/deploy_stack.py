@@ -1,55 +1,490 @@
+"""
+Deploy the stack template through a CloudFormation change set.
+
+The rendered template and the parameter values are hashed and the hash is
+written to the template's Metadata. If the deployed stack already carries the
+same hash, and its parameter values are the ones the deploy would set, the
+deploy is skipped after a `describe_stacks` and a `get_template_summary`
+call. The values are compared as well as the hash since an update with the
+previous template, eg by deploy_image, changes them and keeps the hash.
+Otherwise a change set is created, its per resource actions are printed, and
+it is executed either after confirmation or, with `auto_approve`, straight
+away.
+
+Templates larger than CloudFormation's 51,200 byte TemplateBody limit are
+uploaded to `<template bucket>/<stack name>/<hash>.yaml` and passed by URL.
+The bucket must be in the stack's region, the region of the CloudFormation
+client.
+
+A stack in REVIEW_IN_PROGRESS, created by a CREATE change set which was never
+executed, or in ROLLBACK_COMPLETE, whose creation failed, is not deployed:
+its hash is not compared, and it is created again by a CREATE change set. A
+stack in ROLLBACK_COMPLETE can not be updated, so it is deleted first.
+
+NOTE: the values of NoEcho parameters, eg PostgresPassword, are not part of
+the hash, so that the hash does not leak them. Use `force` to deploy a change
+to a NoEcho parameter alone.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from collections.abc import Callable, Mapping
+
 import boto3
+from botocore.exceptions import ClientError, WaiterError
+
+from yeastregulatorydbstack import deploy_history
+from yeastregulatorydbstack.image_architecture import check_image_architectures
+from yeastregulatorydbstack.stack_events import (
+    format_timings,
+    is_success,
+    latest_event_id,
+    watch_stack,
+)
+from yeastregulatorydbstack.template import Template
+
+CAPABILITIES = ["CAPABILITY_IAM", "CAPABILITY_NAMED_IAM"]
+# the template Metadata key which holds the hash of the deployed template
+TEMPLATE_HASH_KEY = "TemplateHash"
+# the largest template which can be passed as TemplateBody
+MAX_TEMPLATE_BODY = 51_200
+# StatusReason fragments of a change set which failed because it is empty
+_NO_CHANGES = ("didn't contain changes", "No updates are to be performed")
+# the StackStatus of a stack which exists, but whose template was never
+# deployed
+NOT_DEPLOYED = ("REVIEW_IN_PROGRESS", "ROLLBACK_COMPLETE")
+
+
+def load_parameters(path: str) -> list[dict]:
+    """
+    Load a CloudFormation parameters file, eg params.json in the README.
 
+    :param path: path to a json list of ParameterKey/ParameterValue objects
+    :type path: str
 
-def deploy_stack(stack_name, template_body):
-    """Deploy or update CloudFormation stack."""
-    cf_client = boto3.client("cloudformation")
+    :return: the parameters
+    :rtype: list[dict]
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def template_hash(template: Template, parameters: list[dict] | None = None) -> str:
+    """
+    Hash a template and the values of its non NoEcho parameters.
+
+    :param template: the template. Any existing TemplateHash in its Metadata
+      is ignored.
+    :type template: Template
+    :param parameters: ParameterKey/ParameterValue dicts
+    :type parameters: list[dict] | None
+
+    :return: a sha256 hex digest
+    :rtype: str
+    """
+    body = template.to_dict()
+    body.get("Metadata", {}).pop(TEMPLATE_HASH_KEY, None)
+    if not body.get("Metadata", True):
+        del body["Metadata"]
+    values = {
+        p["ParameterKey"]: p.get("ParameterValue")
+        for p in parameters or []
+        if not template.parameters.get(p["ParameterKey"], {}).get("NoEcho")
+    }
+    digest = hashlib.sha256()
+    digest.update(json.dumps(body, sort_keys=True).encode("utf-8"))
+    digest.update(json.dumps(values, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def template_source(
+    template_body: str,
+    stack_name: str,
+    digest: str,
+    region: str,
+    template_bucket: str | None = None,
+    s3_client=None,
+) -> dict:
+    """
+    Return the TemplateBody, or for a large template the TemplateURL,
+    argument of validate_template and create_change_set.
+
+    :param template_body: the rendered template
+    :type template_body: str
+    :param stack_name: the stack name, the prefix of the S3 key
+    :type stack_name: str
+    :param digest: the template hash, the name of the S3 object
+    :type digest: str
+    :param region: the stack's region, which the bucket is in
+    :type region: str
+    :param template_bucket: the S3 bucket large templates are uploaded to
+    :type template_bucket: str | None
+    :param s3_client: a boto3 S3 client in `region`. Defaults to a new one.
+
+    :return: a dict with either TemplateBody or TemplateURL
+    :rtype: dict
+    :raises ValueError: if the template is too large and there is no bucket
+    """
+    size = len(template_body.encode("utf-8"))
+    if size <= MAX_TEMPLATE_BODY:
+        return {"TemplateBody": template_body}
+    if not template_bucket:
+        raise ValueError(
+            f"The template is {size} bytes, more than the {MAX_TEMPLATE_BODY} "
+            "byte TemplateBody limit. Pass a template bucket to upload it to."
+        )
+    s3_client = s3_client or boto3.client("s3", region_name=region)
+    key = f"{stack_name}/{digest}.yaml"
+    s3_client.put_object(
+        Bucket=template_bucket, Key=key, Body=template_body.encode("utf-8")
+    )
+    return {"TemplateURL": f"https://{template_bucket}.s3.{region}.amazonaws.com/{key}"}
 
+
+def get_stack(cf_client, stack_name: str) -> dict | None:
+    """
+    Describe a stack.
+
+    :return: the stack description, or None if the stack does not exist
+    :rtype: dict | None
+    """
     try:
-        validate_response = cf_client.validate_template(TemplateBody=template_body)
-        print("Template is valid.")
-        print(
-            validate_response
-        )  # This will print details of the validation, including capabilities required, etc.
-    except cf_client.exceptions.ValidationError as e:
-        print("Template is invalid.")
-        print(e)
+        return cf_client.describe_stacks(StackName=stack_name)["Stacks"][0]
+    except ClientError as e:
+        if "does not exist" in str(e):
+            return None
+        raise
+
+
+def changed_parameters(
+    template: Template, parameters: list[dict] | None, stack: Mapping
+) -> list[str]:
+    """
+    Return the non NoEcho parameters of a deployed stack whose value is not
+    the one a deploy of the template would set: the given value, or else the
+    template's Default.
+
+    :param template: the template
+    :type template: Template
+    :param parameters: ParameterKey/ParameterValue dicts
+    :type parameters: list[dict] | None
+    :param stack: the describe_stacks description of the stack
+    :type stack: Mapping
+
+    :return: the parameter keys
+    :rtype: list[str]
+    """
+    declared = template.to_dict().get("Parameters", {})
+    given = {p["ParameterKey"]: p.get("ParameterValue") for p in parameters or []}
+    changed = []
+    for deployed in stack.get("Parameters", []):
+        key = deployed["ParameterKey"]
+        if key not in declared or declared[key].get("NoEcho"):
+            continue
+        value = given.get(key, declared[key].get("Default"))
+        if value is not None and str(value) != deployed.get("ParameterValue"):
+            changed.append(key)
+    return changed
+
+
+def deployed_hash(cf_client, stack_name: str) -> str | None:
+    """
+    Return the TemplateHash in the Metadata of the deployed template.
+
+    :return: the hash, or None if the stack or the hash does not exist
+    :rtype: str | None
+    """
     try:
-        cf_client.describe_stacks(StackName=stack_name)
-        print(f"Updating stack {stack_name}...")
-        response = cf_client.update_stack(
+        summary = cf_client.get_template_summary(StackName=stack_name)
+    except ClientError as e:
+        if "does not exist" in str(e):
+            return None
+        raise
+    metadata = json.loads(summary.get("Metadata") or "{}")
+    return metadata.get(TEMPLATE_HASH_KEY)
+
+
+def describe_changes(cf_client, stack_name: str, change_set_name: str) -> list[dict]:
+    """
+    Return the ResourceChange of every change in a change set.
+
+    :rtype: list[dict]
+    """
+    changes = []
+    kwargs = {"ChangeSetName": change_set_name, "StackName": stack_name}
+    while True:
+        response = cf_client.describe_change_set(**kwargs)
+        changes.extend(c["ResourceChange"] for c in response.get("Changes", []))
+        if not response.get("NextToken"):
+            return changes
+        kwargs["NextToken"] = response["NextToken"]
+
+
+def format_changes(changes: list[Mapping]) -> str:
+    """
+    Format the per resource actions of a change set, eg
+
+        Replace  MyDBInstance  AWS::RDS::DBInstance
+
+    Modifications which may require replacement are labelled `Replace?`.
+
+    :param changes: ResourceChange dicts from describe_change_set
+    :type changes: list[Mapping]
+
+    :return: one line per change
+    :rtype: str
+    """
+    lines = []
+    width = max((len(c["LogicalResourceId"]) for c in changes), default=0)
+    for change in changes:
+        action = change["Action"]
+        if action == "Modify":
+            action = {"True": "Replace", "Conditional": "Replace?"}.get(
+                change.get("Replacement"), action
+            )
+        lines.append(
+            f"  {action:<8}  {change['LogicalResourceId']:<{width}}"
+            f"  {change.get('ResourceType', '')}"
+        )
+    return "\n".join(lines)
+
+
+def deploy_stack(
+    stack_name: str,
+    template: Template | str,
+    parameters: list[dict] | None = None,
+    auto_approve: bool = False,
+    force: bool = False,
+    wait: bool = True,
+    history_path: str | None = None,
+    check_images: bool = True,
+    template_bucket: str | None = None,
+    cf_client=None,
+    s3_client=None,
+    printer: Callable[[str], None] = print,
+) -> str:
+    """
+    Deploy or update a CloudFormation stack through a change set.
+
+    :param stack_name: the stack name
+    :type stack_name: str
+    :param template: the template, or a rendered template body. The hash is
+      written to the Metadata of a copy, the template is not modified.
+    :type template: Template | str
+    :param parameters: ParameterKey/ParameterValue dicts
+    :type parameters: list[dict] | None
+    :param auto_approve: execute the change set without asking
+    :type auto_approve: bool
+    :param force: create a change set even if the template hash matches
+      the deployed stack
+    :type force: bool
+    :param wait: stream the stack events until the deploy finishes and print
+      the per resource timings
+    :type wait: bool
+    :param history_path: with `wait`, record the resource timings in this
+      deploy history database. See `deploy_history`.
+    :type history_path: str | None
+    :param check_images: check that the images are built for the stack's
+      CPUArchitecture. See `image_architecture`.
+    :type check_images: bool
+    :param template_bucket: the S3 bucket templates too large for
+      TemplateBody are uploaded to. See `template_source`.
+    :type template_bucket: str | None
+    :param cf_client: a boto3 CloudFormation client. Defaults to a new one.
+    :param s3_client: a boto3 S3 client in the region of `cf_client`.
+      Defaults to a new one.
+    :param printer: called with each line of progress
+    :type printer: Callable[[str], None]
+
+    :return: one of `unchanged` (the hash matched, or the change set was
+      empty), `cancelled` (the change set, or the deletion of a stack in
+      ROLLBACK_COMPLETE, was not approved), `executed`, or,
+      with `wait`, `failed` if the stack did not reach CREATE/UPDATE_COMPLETE
+    :rtype: str
+    """
+    cf_client = cf_client or boto3.client("cloudformation")
+    # a copy, whose Metadata the hash is written to
+    template = Template.from_yaml(
+        template if isinstance(template, str) else template.to_yaml()
+    )
+
+    stack = get_stack(cf_client, stack_name)
+    deployed = stack is not None and stack["StackStatus"] not in NOT_DEPLOYED
+    digest = template_hash(template, parameters)
+    if (
+        not force
+        and deployed
+        and not changed_parameters(template, parameters, stack)
+        and deployed_hash(cf_client, stack_name) == digest
+    ):
+        printer(f"Stack {stack_name} is up to date with template {digest[:12]}.")
+        return "unchanged"
+    if check_images:
+        check_image_architectures(template, parameters)
+    template.metadata[TEMPLATE_HASH_KEY] = digest
+    source = template_source(
+        template.to_yaml(),
+        stack_name,
+        digest,
+        cf_client.meta.region_name,
+        template_bucket,
+        s3_client,
+    )
+
+    try:
+        cf_client.validate_template(**source)
+    except ClientError as e:
+        printer("Template is invalid.")
+        printer(str(e))
+        raise
+
+    if stack is not None and stack["StackStatus"] == "ROLLBACK_COMPLETE":
+        printer(f"Stack {stack_name} failed to create, and can only be deleted.")
+        if not auto_approve:
+            answer = input(f"Delete stack {stack_name} to create it again? [y/N] ")
+            if answer.strip().lower() not in ("y", "yes"):
+                return "cancelled"
+        cf_client.delete_stack(StackName=stack_name)
+        cf_client.get_waiter("stack_delete_complete").wait(
+            StackName=stack_name, WaiterConfig={"Delay": 5}
+        )
+        printer(f"Stack {stack_name} deleted.")
+    change_set_type = "UPDATE" if deployed else "CREATE"
+    change_set_name = f"deploy-{digest[:12]}-{int(time.time())}"
+    printer(f"Creating {change_set_type} change set {change_set_name}...")
+    cf_client.create_change_set(
+        StackName=stack_name,
+        ChangeSetName=change_set_name,
+        **source,
+        Parameters=parameters or [],
+        Capabilities=CAPABILITIES,
+        ChangeSetType=change_set_type,
+    )
+    try:
+        cf_client.get_waiter("change_set_create_complete").wait(
             StackName=stack_name,
-            TemplateBody=template_body,
-            Capabilities=["CAPABILITY_IAM", "CAPABILITY_NAMED_IAM"],
+            ChangeSetName=change_set_name,
+            WaiterConfig={"Delay": 5},
         )
-        print(f"Stack update initiated: {response['StackId']}")
-    except cf_client.exceptions.ClientError as e:
-        if "does not exist" in str(e):
-            print(f"Creating stack {stack_name}...")
-            response = cf_client.create_stack(
-                StackName=stack_name,
-                TemplateBody=template_body,
-                Capabilities=["CAPABILITY_IAM", "CAPABILITY_NAMED_IAM"],
+    except WaiterError:
+        reason = cf_client.describe_change_set(
+            StackName=stack_name, ChangeSetName=change_set_name
+        ).get("StatusReason", "")
+        if any(fragment in reason for fragment in _NO_CHANGES):
+            printer(f"No changes to stack {stack_name}.")
+            cf_client.delete_change_set(
+                StackName=stack_name, ChangeSetName=change_set_name
+            )
+            return "unchanged"
+        raise
+
+    printer(format_changes(describe_changes(cf_client, stack_name, change_set_name)))
+    if not auto_approve:
+        answer = input(f"Execute change set {change_set_name}? [y/N] ")
+        if answer.strip().lower() not in ("y", "yes"):
+            cf_client.delete_change_set(
+                StackName=stack_name, ChangeSetName=change_set_name
             )
-            print(f"Stack creation initiated: {response['StackId']}")
-        else:
-            raise
+            printer("Change set deleted.")
+            return "cancelled"
+
+    after_event_id = latest_event_id(cf_client, stack_name)
+    cf_client.execute_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+    printer(f"Change set {change_set_name} executed on stack {stack_name}.")
+    if not wait:
+        return "executed"
+
+    result = asyncio.run(
+        watch_stack(stack_name, cf_client, after_event_id, printer=printer)
+    )
+    printer(format_timings(result.events))
+    printer(f"Stack {stack_name} finished with {result.stack_status}")
+    if history_path:
+        connection = deploy_history.connect(history_path)
+        deploy_history.record_deploy(
+            connection, stack_name, digest, result.stack_status, result.events
+        )
+        connection.close()
+    return "executed" if is_success(result.stack_status) else "failed"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Deploy the stack template through a change set."
+    )
+    parser.add_argument(
+        "--stack-name",
+        default="YeastRegulatoryDBStack",
+        help="The stack to create or update.",
+    )
+    parser.add_argument(
+        "--parameters",
+        help="A json parameters file, see the README.",
+    )
+    parser.add_argument(
+        "--template",
+        help="A rendered template. Defaults to the template built by "
+        "create_template.",
+    )
+    parser.add_argument(
+        "--auto-approve",
+        action="store_true",
+        help="Execute the change set without asking, eg in CI.",
+    )
+    parser.add_argument(
+        "--no-wait",
+        action="store_true",
+        help="Exit once the change set is executed, rather than streaming "
+        "the stack events until the deploy finishes.",
+    )
+    parser.add_argument(
+        "--history",
+        default=deploy_history.DEFAULT_PATH,
+        help="The deploy history database in which to record resource timings.",
+    )
+    parser.add_argument(
+        "--no-history",
+        action="store_true",
+        help="Do not record resource timings.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Create a change set even if the template hash is unchanged.",
+    )
+    parser.add_argument(
+        "--template-bucket",
+        help="The S3 bucket, in the stack's region, which templates too large "
+        "to pass inline are uploaded to.",
+    )
+    parser.add_argument(
+        "--skip-image-check",
+        action="store_true",
+        help="Do not check that the images are built for CPUArchitecture.",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    stack_name = "YeastRegulatoryDBStack"
-    template_body = create_template(
-        resource_list=[
-            vpc_subnets_routetables_networkcon.get_resources(),
-            rds_redis_ec2.get_resources(),
-            ecs_fargate.get_resources(),
-            alb.get_resources(),
-        ],
-        output_list=[
-            vpc_subnets_routetables_networkcon.get_outputs(),
-            rds_redis_ec2.get_outputs(),
-            ecs_fargate.get_outputs(),
-            alb.get_outputs(),
-        ],
-    )
-    deploy_stack(stack_name, template_body)
+    from yeastregulatorydbstack.create_template import build_template
+
+    args = parse_args()
+    if args.template:
+        with open(args.template, "r", encoding="utf-8") as file:
+            template = Template.from_yaml(file.read())
+    else:
+        template = build_template()
+    deploy_stack(
+        args.stack_name,
+        template,
+        parameters=load_parameters(args.parameters) if args.parameters else None,
+        auto_approve=args.auto_approve,
+        force=args.force,
+        wait=not args.no_wait,
+        history_path=None if args.no_history else args.history,
+        check_images=not args.skip_image_check,
+        template_bucket=args.template_bucket,
+    )
@@ -0,0 +1,435 @@
+"""
+Estimate the wall-clock time of creating or updating a stack from the
+dependency graph of its template.
+
+Each resource is weighted by a per resource type duration and the estimate is
+the longest (critical) path through the graph: CloudFormation starts a
+resource as soon as its dependencies complete, so nothing off the critical
+path adds to the total. The default durations are rough figures for a small
+stack in us-east-2 and can be calibrated from the events of past deploys, eg
+
+    aws cloudformation describe-stack-events --stack-name <name> > events.json
+    python -m yeastregulatorydbstack.deploy_time --events events.json
+
+The template's Conditions are evaluated with the parameter defaults, or the
+values in a parameters file, and the resources whose condition is false are
+left out, eg the Aurora cluster of a stack with an RDS instance:
+
+    python -m yeastregulatorydbstack.deploy_time --parameters params.json
+"""
+
+import argparse
+import json
+import statistics
+from collections.abc import Iterable, Mapping
+from datetime import datetime
+from typing import NamedTuple
+
+from yeastregulatorydbstack.dependency_graph import DependencyGraph, prune_template
+from yeastregulatorydbstack.template import Template, to_plain
+
+# (create, update) seconds by resource type
+DEFAULT_DURATIONS: dict[str, tuple[float, float]] = {
+    "AWS::RDS::DBInstance": (600, 600),
+    "AWS::RDS::DBProxy": (300, 60),
+    "AWS::ElastiCache::CacheCluster": (480, 360),
+    "AWS::ECS::Service": (180, 240),
+    "AWS::ECS::Cluster": (10, 5),
+    "AWS::ECS::TaskDefinition": (5, 5),
+    "AWS::ElasticLoadBalancingV2::LoadBalancer": (180, 30),
+    "AWS::ElasticLoadBalancingV2::Listener": (5, 5),
+    "AWS::ElasticLoadBalancingV2::TargetGroup": (15, 15),
+    "AWS::IAM::Role": (20, 20),
+    "AWS::Lambda::Function": (10, 10),
+    "AWS::EC2::InternetGateway": (15, 5),
+    "AWS::EC2::VPCGatewayAttachment": (15, 15),
+    "AWS::EC2::Subnet": (10, 10),
+    "AWS::EC2::SecurityGroup": (10, 10),
+}
+# used for any resource type which is not in the table
+DEFAULT_DURATION: tuple[float, float] = (10, 10)
+# the resource type of the stack's own events
+STACK_TYPE = "AWS::CloudFormation::Stack"
+# custom resources run a lambda, which is typically quick
+CUSTOM_RESOURCE_DURATION: tuple[float, float] = (30, 30)
+
+
+class PathStep(NamedTuple):
+    logical_id: str
+    resource_type: str
+    seconds: float
+
+
+class ResourceTiming(NamedTuple):
+    logical_id: str
+    resource_type: str
+    action: str
+    status: str
+    start: datetime
+    end: datetime
+
+    @property
+    def seconds(self) -> float:
+        return (self.end - self.start).total_seconds()
+
+
+class Estimate(NamedTuple):
+    seconds: float
+    critical_path: list[PathStep]
+
+
+def duration(
+    resource_type: str,
+    durations: Mapping[str, tuple[float, float]] = DEFAULT_DURATIONS,
+    update: bool = False,
+) -> float:
+    """
+    Look up the create or update duration of a resource type.
+
+    :param resource_type: eg AWS::RDS::DBInstance
+    :type resource_type: str
+    :param durations: (create, update) seconds by resource type
+    :type durations: Mapping[str, tuple[float, float]]
+    :param update: return the update, rather than create, duration
+    :type update: bool
+
+    :return: the duration in seconds
+    :rtype: float
+    """
+    if resource_type in durations:
+        entry = durations[resource_type]
+    elif resource_type.startswith("Custom::"):
+        entry = CUSTOM_RESOURCE_DURATION
+    else:
+        entry = DEFAULT_DURATION
+    return entry[1] if update else entry[0]
+
+
+def parse_timestamp(value: str | datetime) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def resource_timings(events: Iterable[Mapping]) -> list[ResourceTiming]:
+    """
+    Pair the IN_PROGRESS and COMPLETE (or FAILED) events of each resource in
+    a list of `describe_stack_events` StackEvents.
+
+    :param events: stack events, in any order
+    :type events: Iterable[Mapping]
+
+    :return: the timings, in order of completion
+    :rtype: list[ResourceTiming]
+    """
+    started: dict[tuple[str, str], datetime] = {}
+    timings = []
+    for event in sorted(events, key=lambda e: parse_timestamp(e["Timestamp"])):
+        action, _, status = event["ResourceStatus"].partition("_")
+        if action not in ("CREATE", "UPDATE"):
+            continue
+        key = (event["LogicalResourceId"], action)
+        timestamp = parse_timestamp(event["Timestamp"])
+        if status == "IN_PROGRESS":
+            # later IN_PROGRESS events, eg "Resource creation Initiated",
+            # do not restart the clock
+            started.setdefault(key, timestamp)
+        elif status in ("COMPLETE", "FAILED") and key in started:
+            timings.append(
+                ResourceTiming(
+                    key[0],
+                    event["ResourceType"],
+                    action,
+                    status,
+                    started.pop(key),
+                    timestamp,
+                )
+            )
+    return timings
+
+
+def calibrate(
+    events: Iterable[Mapping],
+    durations: Mapping[str, tuple[float, float]] = DEFAULT_DURATIONS,
+) -> dict[str, tuple[float, float]]:
+    """
+    Replace the durations table entries with the median observed durations
+    from stack events. The stack itself is excluded.
+
+    :param events: `describe_stack_events` StackEvents, from any number of
+      deploys
+    :type events: Iterable[Mapping]
+    :param durations: the table to start from
+    :type durations: Mapping[str, tuple[float, float]]
+
+    :return: the calibrated table
+    :rtype: dict[str, tuple[float, float]]
+    """
+    observed: dict[tuple[str, str], list[float]] = {}
+    for timing in resource_timings(events):
+        if timing.status != "COMPLETE" or timing.resource_type == STACK_TYPE:
+            continue
+        key = (timing.resource_type, timing.action)
+        observed.setdefault(key, []).append(timing.seconds)
+
+    calibrated = dict(durations)
+    for resource_type in {t for t, _ in observed}:
+        create, update = calibrated.get(resource_type, DEFAULT_DURATION)
+        if (resource_type, "CREATE") in observed:
+            create = statistics.median(observed[(resource_type, "CREATE")])
+        if (resource_type, "UPDATE") in observed:
+            update = statistics.median(observed[(resource_type, "UPDATE")])
+        calibrated[resource_type] = (create, update)
+    return calibrated
+
+
+def evaluate_conditions(
+    template: Template, parameters: list[dict] | None = None
+) -> dict[str, bool]:
+    """
+    Evaluate the Conditions of a template. Fn::Equals, Fn::And, Fn::Or,
+    Fn::Not and Condition are supported, and Ref to a parameter.
+
+    :param template: the template
+    :type template: Template
+    :param parameters: ParameterKey/ParameterValue dicts, which override the
+      parameter defaults
+    :type parameters: list[dict] | None
+
+    :return: the value of each condition, by name
+    :rtype: dict[str, bool]
+    :raises ValueError: if a condition uses another function, or a Ref to a
+      parameter without a value
+    """
+    body = template.to_dict()
+    values = {
+        name: definition["Default"]
+        for name, definition in body.get("Parameters", {}).items()
+        if "Default" in definition
+    }
+    values.update(
+        (p["ParameterKey"], p.get("ParameterValue")) for p in parameters or []
+    )
+    definitions = body.get("Conditions", {})
+    evaluated: dict[str, bool] = {}
+
+    def value(item) -> str:
+        if isinstance(item, dict):
+            if set(item) != {"Ref"} or item["Ref"] not in values:
+                raise ValueError(f"Can not evaluate {item} in a condition")
+            item = values[item["Ref"]]
+        return str(item)
+
+    def evaluate(item) -> bool:
+        ((function, arguments),) = item.items()
+        if function == "Condition":
+            if arguments not in evaluated:
+                evaluated[arguments] = evaluate(definitions[arguments])
+            return evaluated[arguments]
+        if function == "Fn::Equals":
+            return value(arguments[0]) == value(arguments[1])
+        if function == "Fn::Not":
+            return not evaluate(arguments[0])
+        if function == "Fn::And":
+            return all(evaluate(argument) for argument in arguments)
+        if function == "Fn::Or":
+            return any(evaluate(argument) for argument in arguments)
+        raise ValueError(f"Can not evaluate {function} in a condition")
+
+    for name in definitions:
+        evaluate({"Condition": name})
+    return evaluated
+
+
+def _resolve_if(value, conditions: Mapping[str, bool]):
+    if isinstance(value, dict):
+        if set(value) == {"Fn::If"}:
+            condition, true, false = value["Fn::If"]
+            return _resolve_if(true if conditions[condition] else false, conditions)
+        return {k: _resolve_if(v, conditions) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve_if(v, conditions) for v in value]
+    return value
+
+
+def apply_conditions(
+    template: Template, parameters: list[dict] | None = None
+) -> Template:
+    """
+    Return a copy of a template without the resources whose condition is
+    false, and with each Fn::If replaced by its chosen value, see
+    `evaluate_conditions`.
+
+    :param template: the template
+    :type template: Template
+    :param parameters: ParameterKey/ParameterValue dicts, which override the
+      parameter defaults
+    :type parameters: list[dict] | None
+
+    :return: the resources which would be deployed
+    :rtype: Template
+    """
+    conditions = evaluate_conditions(template, parameters)
+    applied = Template(template.description)
+    applied.add_resources(
+        {
+            logical_id: _resolve_if(definition, conditions)
+            for logical_id, definition in template.to_dict()
+            .get("Resources", {})
+            .items()
+            if conditions.get(definition.get("Condition"), True)
+        }
+    )
+    return applied
+
+
+def changed_resources(template: Template, baseline: Template) -> set[str]:
+    """
+    Return the resources which are new or whose definition differs from a
+    baseline template.
+
+    :param template: the new template
+    :type template: Template
+    :param baseline: the currently deployed template
+    :type baseline: Template
+
+    :return: the logical IDs which an update will touch
+    :rtype: set[str]
+    """
+    return {
+        logical_id
+        for logical_id, definition in template.resources.items()
+        if to_plain(baseline.resources.get(logical_id)) != to_plain(definition)
+    }
+
+
+def estimate(
+    template: Template,
+    durations: Mapping[str, tuple[float, float]] = DEFAULT_DURATIONS,
+    changed: set[str] | None = None,
+    parameters: list[dict] | None = None,
+) -> Estimate:
+    """
+    Estimate the time to create, or update, a stack. Resources whose
+    condition is false are left out, see `apply_conditions`.
+
+    :param template: the template to deploy
+    :type template: Template
+    :param durations: (create, update) seconds by resource type
+    :type durations: Mapping[str, tuple[float, float]]
+    :param changed: if given, estimate an update in which only these
+      resources change. Other resources take no time.
+    :type changed: set[str] | None
+    :param parameters: ParameterKey/ParameterValue dicts, which override the
+      parameter defaults in the conditions
+    :type parameters: list[dict] | None
+
+    :return: the total seconds and the critical path
+    :rtype: Estimate
+    """
+    graph = DependencyGraph(apply_conditions(template, parameters))
+    finish: dict[str, float] = {}
+    previous: dict[str, str | None] = {}
+    for logical_id in graph.topological_order():
+        resource_type = graph.resource_types[logical_id]
+        if changed is None:
+            seconds = duration(resource_type, durations)
+        elif logical_id in changed:
+            seconds = duration(resource_type, durations, update=True)
+        else:
+            seconds = 0.0
+        dependencies = graph.dependencies(logical_id)
+        slowest = max(dependencies, key=lambda d: finish[d], default=None)
+        previous[logical_id] = slowest
+        finish[logical_id] = seconds + (finish[slowest] if slowest else 0.0)
+
+    last = max(finish, key=lambda r: finish[r], default=None)
+    path: list[PathStep] = []
+    while last is not None:
+        start = finish[previous[last]] if previous[last] else 0.0
+        path.append(PathStep(last, graph.resource_types[last], finish[last] - start))
+        last = previous[last]
+    path.reverse()
+    return Estimate(sum(step.seconds for step in path), path)
+
+
+def format_estimate(label: str, result: Estimate) -> str:
+    """Format an estimate and its critical path as a table."""
+    lines = [f"{label}: {result.seconds / 60:.1f} minutes", "critical path:"]
+    width = max((len(step.logical_id) for step in result.critical_path), default=0)
+    for step in result.critical_path:
+        if step.seconds:
+            lines.append(
+                f"  {step.logical_id:<{width}}  {step.resource_type:<45}"
+                f"  {step.seconds:>6.0f}s"
+            )
+    return "\n".join(lines)
+
+
+def _load_events(paths: list[str]) -> list[dict]:
+    events = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        events.extend(data["StackEvents"] if isinstance(data, dict) else data)
+    return events
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Estimate stack create and update time from the "
+        "template's critical path."
+    )
+    parser.add_argument(
+        "template",
+        nargs="?",
+        help="A rendered template. Defaults to the template built by "
+        "create_template.",
+    )
+    parser.add_argument(
+        "--baseline",
+        help="The currently deployed template. If given, also estimate the "
+        "update from the baseline to the template.",
+    )
+    parser.add_argument(
+        "--events",
+        nargs="+",
+        default=[],
+        help="describe-stack-events json output used to calibrate durations.",
+    )
+    parser.add_argument(
+        "--parameters",
+        help="A json parameters file, see the README, whose values override "
+        "the parameter defaults in the template's Conditions.",
+    )
+    parser.add_argument(
+        "--prune-depends-on",
+        action="store_true",
+        help="Estimate the template after removing redundant and unneeded "
+        "DependsOn entries.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from yeastregulatorydbstack.create_template import build_template
+
+    args = parse_args()
+    if args.template:
+        with open(args.template, "r", encoding="utf-8") as file:
+            template = Template.from_yaml(file.read())
+    else:
+        template = build_template()
+    if args.prune_depends_on:
+        template = prune_template(template)
+
+    table = calibrate(_load_events(args.events)) if args.events else DEFAULT_DURATIONS
+    parameters = None
+    if args.parameters:
+        with open(args.parameters, "r", encoding="utf-8") as file:
+            parameters = json.load(file)
+
+    print(format_estimate("create", estimate(template, table, None, parameters)))
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = Template.from_yaml(file.read())
+        changed = changed_resources(template, baseline)
+        print(format_estimate("update", estimate(template, table, changed, parameters)))
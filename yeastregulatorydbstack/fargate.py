@@ -0,0 +1,196 @@
+"""
+The task sizes Fargate supports. A task definition's Cpu, in CPU units where
+1024 is one vCPU, must be one of `TASK_SIZES` and its Memory, in MiB, one of
+the values allowed for that Cpu.
+
+`constrain_task_size` enforces the matrix on a pair of Cpu/Memory template
+parameters, so that an invalid pair fails when the change set is created
+rather than part way through the deploy.
+
+`pin_task_definition` lets a service run a task definition revision which
+was registered outside of CloudFormation, see deploy_image.py.
+
+A task's ephemeral storage holds its image layers as well as what it writes
+to disk. Fargate gives `DEFAULT_EPHEMERAL_STORAGE` GiB unless the task
+definition asks for more, up to `MAX_EPHEMERAL_STORAGE`.
+"""
+
+import math
+from collections.abc import Iterable, Iterator, MutableMapping
+
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
+
+from yeastregulatorydbstack.template import ref, set_allowed_values
+
+
+def _mib(first_gib: int, last_gib: int, step_gib: int = 1) -> tuple[int, ...]:
+    return tuple(gib * 1024 for gib in range(first_gib, last_gib + 1, step_gib))
+
+
+# CPU units to the memory sizes, in MiB, allowed with them
+TASK_SIZES: dict[int, tuple[int, ...]] = {
+    256: (512, 1024, 2048),
+    512: _mib(1, 4),
+    1024: _mib(2, 8),
+    2048: _mib(4, 16),
+    4096: _mib(8, 30),
+    8192: _mib(16, 60, 4),
+    16384: _mib(32, 120, 8),
+}
+
+
+# GiB
+DEFAULT_EPHEMERAL_STORAGE = 20
+MIN_EPHEMERAL_STORAGE = 21
+MAX_EPHEMERAL_STORAGE = 200
+# GiB set aside for the image layers and the container's own writes
+IMAGE_ALLOWANCE = 4
+
+
+def task_sizes() -> Iterator[tuple[int, int]]:
+    """Yield every valid (cpu, memory) pair, smallest first."""
+    for cpu, memories in TASK_SIZES.items():
+        for memory in memories:
+            yield cpu, memory
+
+
+def is_valid_task_size(cpu: int, memory: int) -> bool:
+    """Return True if Fargate supports a task with this cpu and memory."""
+    return memory in TASK_SIZES.get(int(cpu), ())
+
+
+def ephemeral_storage_needed(working_set: float) -> int:
+    """
+    Return the GiB of ephemeral storage a task needs to hold a working set,
+    ie the most it has on disk at once, of this many GiB.
+    """
+    return max(DEFAULT_EPHEMERAL_STORAGE, math.ceil(working_set + IMAGE_ALLOWANCE))
+
+
+def is_valid_ephemeral_storage(size: int) -> bool:
+    """Return True if a task definition may set this EphemeralStorage."""
+    return MIN_EPHEMERAL_STORAGE <= size <= MAX_EPHEMERAL_STORAGE
+
+
+def constrain_task_size(
+    parameters: MutableMapping, cpu_parameter: str, memory_parameter: str
+) -> CommentedMap:
+    """
+    Restrict a pair of Cpu/Memory parameters to the Fargate task sizes.
+
+    Sets the AllowedValues of both parameters, and returns one template rule
+    per Cpu value which asserts that the Memory is allowed with it.
+
+    :param parameters: the parameters section, or fragment, which holds the
+      two parameters. It is modified in place.
+    :type parameters: MutableMapping
+    :param cpu_parameter: the Cpu parameter, eg DjangoTaskDefinitionCPUs
+    :type cpu_parameter: str
+    :param memory_parameter: the Memory parameter
+    :type memory_parameter: str
+
+    :return: rules, by logical ID, for the template's Rules section
+    :rtype: CommentedMap
+    """
+    set_allowed_values(parameters[cpu_parameter], TASK_SIZES)
+    set_allowed_values(
+        parameters[memory_parameter], sorted({m for _, m in task_sizes()})
+    )
+    rules = CommentedMap()
+    for cpu, memories in TASK_SIZES.items():
+        allowed = CommentedSeq(str(memory) for memory in memories)
+        allowed.fa.set_flow_style()
+        rules[f"{cpu_parameter}{cpu}"] = {
+            "RuleCondition": {"Fn::Equals": [ref(cpu_parameter), str(cpu)]},
+            "Assertions": [
+                {
+                    "Assert": {"Fn::Contains": [allowed, ref(memory_parameter)]},
+                    "AssertDescription": (
+                        f"With {cpu_parameter} {cpu}, {memory_parameter} must "
+                        f"be one of {', '.join(map(str, memories))}"
+                    ),
+                }
+            ],
+        }
+    return rules
+
+
+def pinned_task_definition(service: str) -> tuple[str, str]:
+    """
+    Return the names of the parameter and of the condition which pin a
+    service to a task definition revision, see `pin_task_definition`.
+
+    :param service: the logical ID of the service, eg DjangoService
+    :type service: str
+
+    :return: the parameter, eg DjangoServiceTaskDefinitionArn, and the
+      condition, eg DjangoServiceTaskDefinitionPinned
+    :rtype: tuple[str, str]
+    """
+    return f"{service}TaskDefinitionArn", f"{service}TaskDefinitionPinned"
+
+
+def pinned_task_definition_parameters(services: Iterable[str]) -> CommentedMap:
+    """
+    Return the task definition ARN parameters of services, see
+    `pin_task_definition`.
+
+    :param services: the logical IDs of the services
+    :type services: Iterable[str]
+
+    :return: parameters, by name
+    :rtype: CommentedMap
+    """
+    parameters = CommentedMap()
+    for service in services:
+        parameter, _ = pinned_task_definition(service)
+        parameters[parameter] = {
+            "Type": "String",
+            "Description": (
+                f"A task definition revision for {service} to run instead of "
+                "the template's, set by deploy_image. Leave empty."
+            ),
+            "Default": "",
+        }
+    return parameters
+
+
+def pinned_task_definition_conditions(services: Iterable[str]) -> CommentedMap:
+    """
+    Return the conditions which are true when a service's task definition ARN
+    parameter is set, see `pin_task_definition`.
+
+    :param services: the logical IDs of the services
+    :type services: Iterable[str]
+
+    :return: conditions, by name
+    :rtype: CommentedMap
+    """
+    conditions = CommentedMap()
+    for service in services:
+        parameter, condition = pinned_task_definition(service)
+        conditions[condition] = {"Fn::Not": [{"Fn::Equals": [ref(parameter), ""]}]}
+    return conditions
+
+
+def pin_task_definition(resource: MutableMapping, service: str) -> None:
+    """
+    Let the task definition ARN parameter of a service, by default empty,
+    override its TaskDefinition.
+
+    deploy_image registers revisions with a new image and sets the parameter
+    to them, so that its update of the image parameter does not redeploy the
+    service with CloudFormation's own, otherwise identical, revision. A stack
+    update which leaves the parameter empty returns the service to the
+    template's task definition.
+
+    :param resource: the service. It is modified in place.
+    :type resource: MutableMapping
+    :param service: the logical ID of the service
+    :type service: str
+    """
+    parameter, condition = pinned_task_definition(service)
+    properties = resource["Properties"]
+    properties["TaskDefinition"] = {
+        "Fn::If": [condition, ref(parameter), properties["TaskDefinition"]]
+    }
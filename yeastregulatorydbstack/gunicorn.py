@@ -0,0 +1,78 @@
+"""
+Derive the gunicorn settings of the Django container from its task size.
+
+The Django task definition's Cpu and Memory are parameters, so the settings
+for every Fargate task size are generated into the `DjangoGunicorn` mapping
+and looked up with `!FindInMap [DjangoGunicorn, <cpu>, <memory>]`. Each entry
+is a list, indexed by `FIELDS`.
+
+Workers follow the usual 2 x vCPUs + 1, capped by the number of workers which
+fit in memory. Tasks with less than one vCPU are throttled, so they get
+fewer threads and a longer timeout. Workers are recycled after
+`max_requests` requests, sooner when each has little memory headroom.
+"""
+
+from typing import NamedTuple
+
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
+
+from yeastregulatorydbstack.fargate import task_sizes
+
+MAPPING_NAME = "DjangoGunicorn"
+# memory, in MiB, kept back for the gunicorn arbiter and the OS, and the
+# memory each Django worker is assumed to need
+RESERVED_MEMORY = 256
+WORKER_MEMORY = 256
+
+
+class GunicornSettings(NamedTuple):
+    workers: int
+    threads: int
+    timeout: int
+    max_requests: int
+    max_requests_jitter: int
+
+
+FIELDS = GunicornSettings._fields
+
+
+def gunicorn_settings(cpu: int, memory: int) -> GunicornSettings:
+    """
+    Return the gunicorn settings for a task size.
+
+    :param cpu: the task CPU units, where 1024 is one vCPU
+    :type cpu: int
+    :param memory: the task memory in MiB
+    :type memory: int
+
+    :return: the settings
+    :rtype: GunicornSettings
+    """
+    vcpus = cpu / 1024
+    workers_by_cpu = int(2 * vcpus) + 1
+    workers_by_memory = (memory - RESERVED_MEMORY) // WORKER_MEMORY
+    workers = max(1, min(workers_by_cpu, workers_by_memory))
+    fractional = vcpus < 1
+    max_requests = 1000 if (memory - RESERVED_MEMORY) / workers >= 512 else 500
+    return GunicornSettings(
+        workers=workers,
+        threads=2 if fractional else 4,
+        timeout=60 if fractional else 30,
+        max_requests=max_requests,
+        max_requests_jitter=max_requests // 10,
+    )
+
+
+def gunicorn_mapping() -> CommentedMap:
+    """
+    Return the `DjangoGunicorn` template mapping of cpu, then memory, to
+    the gunicorn settings as a list of strings.
+
+    :rtype: CommentedMap
+    """
+    by_cpu = CommentedMap()
+    for cpu, memory in task_sizes():
+        settings = CommentedSeq(str(value) for value in gunicorn_settings(cpu, memory))
+        settings.fa.set_flow_style()
+        by_cpu.setdefault(str(cpu), CommentedMap())[str(memory)] = settings
+    return CommentedMap({MAPPING_NAME: by_cpu})
@@ -0,0 +1,205 @@
+"""
+Check that the container images of the stack are built for the CPU
+architecture of its task definitions, see the CPUArchitecture parameter.
+
+An amd64 image on ARM64 tasks, or the reverse, only fails once the tasks
+start, with `exec format error`. The architectures of an ECR image are read
+from its manifest: every platform of a multi-architecture image index, or the
+config blob of a single image. Images outside private ECR are not checked,
+eg the default public.ecr.aws log router and Docker Hub PgBouncer images, but
+their mirrors in the account's ECR are.
+
+    python -m yeastregulatorydbstack.image_architecture params.json
+"""
+
+import argparse
+import json
+import re
+import urllib.request
+from collections.abc import Callable
+from typing import NamedTuple
+
+import boto3
+
+from yeastregulatorydbstack.template import Template
+
+CPU_ARCHITECTURE_PARAMETER = "CPUArchitecture"
+# the parameters which hold an image URI
+IMAGE_PARAMETERS = ("DjangoAppImage", "LogRouterImage", "PgBouncerImage")
+# RuntimePlatform.CpuArchitecture to the architecture in an image manifest
+DOCKER_ARCHITECTURES = {"X86_64": "amd64", "ARM64": "arm64"}
+
+_INDEX_MEDIA_TYPES = (
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+)
+_MANIFEST_MEDIA_TYPES = _INDEX_MEDIA_TYPES + (
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+)
+_ECR_IMAGE = re.compile(
+    r"^(?P<registry_id>\d{12})\.dkr\.ecr\.(?P<region>[a-z0-9-]+)\.amazonaws\.com"
+    r"/(?P<repository>[^:@]+)(?:(?::(?P<tag>[^@]+))?(?:@(?P<digest>.+))?)$"
+)
+
+
+class EcrImage(NamedTuple):
+    registry_id: str
+    region: str
+    repository: str
+    tag: str | None = None
+    digest: str | None = None
+
+
+def parse_ecr_image(image: str) -> EcrImage | None:
+    """
+    Parse an ECR image URI, eg
+    040367161929.dkr.ecr.us-east-2.amazonaws.com/django-stack:latest
+
+    :return: the image, or None if it is not in ECR. An image with neither
+      a tag nor a digest is tagged `latest`.
+    :rtype: EcrImage | None
+    """
+    match = _ECR_IMAGE.match(image.strip())
+    if not match:
+        return None
+    image = EcrImage(**match.groupdict())
+    if not image.tag and not image.digest:
+        image = image._replace(tag="latest")
+    return image
+
+
+def _fetch_json(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.load(response)
+
+
+def image_architectures(
+    ecr_client, image: EcrImage, fetch: Callable[[str], dict] = _fetch_json
+) -> set[str]:
+    """
+    Return the architectures an ECR image is built for.
+
+    :param ecr_client: a boto3 ECR client in the image's region
+    :param image: the image
+    :type image: EcrImage
+    :param fetch: GETs a url and parses the json response. Used to download
+      the config blob of a single architecture image.
+    :type fetch: Callable[[str], dict]
+
+    :return: docker architecture names, eg {"amd64", "arm64"}
+    :rtype: set[str]
+    :raises ValueError: if the image does not exist
+    """
+    image_id = (
+        {"imageDigest": image.digest} if image.digest else {"imageTag": image.tag}
+    )
+    response = ecr_client.batch_get_image(
+        registryId=image.registry_id,
+        repositoryName=image.repository,
+        imageIds=[image_id],
+        acceptedMediaTypes=list(_MANIFEST_MEDIA_TYPES),
+    )
+    if not response["images"]:
+        failures = "; ".join(f["failureReason"] for f in response.get("failures", []))
+        raise ValueError(f"Image {image} not found: {failures}")
+    manifest = json.loads(response["images"][0]["imageManifest"])
+
+    if manifest.get("mediaType") in _INDEX_MEDIA_TYPES or "manifests" in manifest:
+        # attestation manifests in buildx indexes have the platform unknown/unknown
+        return {
+            m["platform"]["architecture"]
+            for m in manifest["manifests"]
+            if m.get("platform", {}).get("architecture", "unknown") != "unknown"
+        }
+    url = ecr_client.get_download_url_for_layer(
+        registryId=image.registry_id,
+        repositoryName=image.repository,
+        layerDigest=manifest["config"]["digest"],
+    )["downloadUrl"]
+    return {fetch(url)["architecture"]}
+
+
+def parameter_value(
+    template: Template, parameters: list[dict] | None, key: str
+) -> str | None:
+    """
+    Return a parameter's value from ParameterKey/ParameterValue dicts,
+    falling back to its Default in the template.
+
+    :rtype: str | None
+    """
+    for parameter in parameters or []:
+        if parameter["ParameterKey"] == key:
+            return parameter.get("ParameterValue")
+    default = template.parameters.get(key, {}).get("Default")
+    return None if default is None else str(default)
+
+
+def check_image_architectures(
+    template: Template,
+    parameters: list[dict] | None,
+    ecr_client=None,
+    fetch: Callable[[str], dict] = _fetch_json,
+) -> dict[str, set[str]]:
+    """
+    Check that the images in the parameters are built for the stack's
+    CPUArchitecture.
+
+    :param template: the template
+    :type template: Template
+    :param parameters: ParameterKey/ParameterValue dicts
+    :type parameters: list[dict] | None
+    :param ecr_client: a boto3 ECR client. Defaults to one per image region.
+    :param fetch: see `image_architectures`
+    :type fetch: Callable[[str], dict]
+
+    :return: the architectures of each checked image
+    :rtype: dict[str, set[str]]
+    :raises ValueError: if an image is not built for the CPU architecture
+    """
+    cpu_architecture = parameter_value(template, parameters, CPU_ARCHITECTURE_PARAMETER)
+    if cpu_architecture is None:
+        return {}
+    expected = DOCKER_ARCHITECTURES[cpu_architecture]
+
+    found = {}
+    for key in IMAGE_PARAMETERS:
+        uri = parameter_value(template, parameters, key)
+        image = parse_ecr_image(uri) if uri else None
+        if image is None:
+            continue
+        client = ecr_client or boto3.client("ecr", region_name=image.region)
+        found[uri] = image_architectures(client, image, fetch)
+
+    mismatched = {uri: archs for uri, archs in found.items() if expected not in archs}
+    if mismatched:
+        details = ", ".join(
+            f"{uri} is {'/'.join(sorted(archs)) or 'of unknown architecture'}"
+            for uri, archs in mismatched.items()
+        )
+        raise ValueError(
+            f"{CPU_ARCHITECTURE_PARAMETER} is {cpu_architecture}, which needs "
+            f"{expected} images, but {details}"
+        )
+    return found
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Check the images in a parameters file against the "
+        "stack's CPUArchitecture."
+    )
+    parser.add_argument("parameters", help="A json parameters file, see the README.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from yeastregulatorydbstack.create_template import build_template
+    from yeastregulatorydbstack.deploy_stack import load_parameters
+
+    args = parse_args()
+    for uri, archs in check_image_architectures(
+        build_template(), load_parameters(args.parameters)
+    ).items():
+        print(f"{uri}: {', '.join(sorted(archs))}")
@@ -0,0 +1,81 @@
+"""Publish the backlog per task of each Celery worker pool to CloudWatch.
+
+Inlined as the QueueDepthFunction source by lambda_functions.py, so it must
+only use the standard library and boto3, and stay under 4096 characters.
+"""
+
+import os
+import socket
+
+
+def queue_lengths(host, port, queues, timeout=5.0):
+    """Return {queue: LLEN queue}, pipelined over one RESP connection."""
+    with socket.create_connection((host, int(port)), timeout=timeout) as sock:
+        stream = sock.makefile("rwb")
+        for queue in queues:
+            name = queue.encode()
+            stream.write(b"*2\r\n$4\r\nLLEN\r\n$%d\r\n%s\r\n" % (len(name), name))
+        stream.flush()
+        lengths = {}
+        for queue in queues:
+            reply = stream.readline()
+            if not reply.startswith(b":"):
+                raise RuntimeError(f"LLEN {queue} failed: {reply!r}")
+            lengths[queue] = int(reply[1:])
+        return lengths
+
+
+def parse_pools(spec):
+    """Parse `<service>=<queue>,<queue>;...` into {service: [queue, ...]}."""
+    pools = {}
+    for entry in filter(None, spec.split(";")):
+        service, queues = entry.split("=", 1)
+        pools[service.strip()] = [q.strip() for q in queues.split(",") if q.strip()]
+    return pools
+
+
+def backlog_metrics(lengths, queues, running_tasks, service_name):
+    """Return the CloudWatch MetricData for one worker pool."""
+    dimensions = [{"Name": "ServiceName", "Value": service_name}]
+    metrics = [
+        {
+            "MetricName": "QueueLength",
+            "Dimensions": dimensions + [{"Name": "Queue", "Value": queue}],
+            "Value": lengths[queue],
+            "Unit": "Count",
+        }
+        for queue in queues
+    ]
+    metrics.append(
+        {
+            "MetricName": "BacklogPerTask",
+            "Dimensions": dimensions,
+            "Value": sum(lengths[q] for q in queues) / max(running_tasks, 1),
+            "Unit": "Count",
+        }
+    )
+    return metrics
+
+
+def publish(cloudwatch, ecs, env):
+    """Measure the backlog of every pool and publish it. Returns the MetricData."""
+    pools = parse_pools(env["WORKER_POOLS"])
+    queues = [q for pool_queues in pools.values() for q in pool_queues]
+    lengths = queue_lengths(env["REDIS_HOST"], env["REDIS_PORT"], queues)
+    services = ecs.describe_services(cluster=env["CLUSTER_NAME"], services=list(pools))[
+        "services"
+    ]
+    running = {s["serviceName"]: s["runningCount"] for s in services}
+    metrics = []
+    for service, pool_queues in pools.items():
+        metrics += backlog_metrics(
+            lengths, pool_queues, running.get(service, 0), service
+        )
+    cloudwatch.put_metric_data(Namespace=env["METRIC_NAMESPACE"], MetricData=metrics)
+    return metrics
+
+
+def handler(event, context):
+    import boto3
+
+    return publish(boto3.client("cloudwatch"), boto3.client("ecs"), os.environ)
@@ -0,0 +1,124 @@
+import os
+import socket
+import uuid
+
+import pytest
+
+from yeastregulatorydbstack.create_template import build_template
+from yeastregulatorydbstack.resources.lambda_functions import QUEUE_DEPTH_SOURCE
+
+from .queue_depth import backlog_metrics, parse_pools, publish, queue_lengths
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+
+
+def _redis_available() -> bool:
+    try:
+        socket.create_connection((REDIS_HOST, REDIS_PORT), timeout=0.5).close()
+    except OSError:
+        return False
+    return True
+
+
+requires_redis = pytest.mark.skipif(
+    not _redis_available(), reason=f"no Redis at {REDIS_HOST}:{REDIS_PORT}"
+)
+
+
+def _redis_command(*args: str) -> bytes:
+    command = b"*%d\r\n" % len(args)
+    for arg in args:
+        command += b"$%d\r\n%s\r\n" % (len(arg), arg.encode())
+    with socket.create_connection((REDIS_HOST, REDIS_PORT)) as sock:
+        sock.sendall(command)
+        return sock.recv(1024)
+
+
+class FakeEcs:
+    def __init__(self, running_counts):
+        self.running_counts = running_counts
+
+    def describe_services(self, cluster, services):
+        return {
+            "services": [
+                {"serviceName": name, "runningCount": self.running_counts[name]}
+                for name in services
+            ]
+        }
+
+
+class FakeCloudWatch:
+    def __init__(self):
+        self.calls = []
+
+    def put_metric_data(self, **kwargs):
+        self.calls.append(kwargs)
+
+
+def test_parse_pools():
+    assert parse_pools("default=celery;heavy=peak_calling, rank_response;") == {
+        "default": ["celery"],
+        "heavy": ["peak_calling", "rank_response"],
+    }
+
+
+def test_backlog_metrics():
+    lengths = {"celery": 30, "uploads": 10, "other": 99}
+    metrics = backlog_metrics(lengths, ["celery", "uploads"], 4, "workers")
+    by_name = {}
+    for metric in metrics:
+        by_name.setdefault(metric["MetricName"], []).append(metric)
+
+    assert [m["Value"] for m in by_name["QueueLength"]] == [30, 10]
+    (backlog,) = by_name["BacklogPerTask"]
+    assert backlog["Value"] == 10
+    assert backlog["Dimensions"] == [{"Name": "ServiceName", "Value": "workers"}]
+    # no running tasks counts as one, so a backlog still scales out
+    assert backlog_metrics({"celery": 5}, ["celery"], 0, "workers")[-1]["Value"] == 5
+
+
+def test_inlined_source_matches_module():
+    function = build_template().resources["QueueDepthFunction"]
+    with open(QUEUE_DEPTH_SOURCE, "r", encoding="utf-8") as file:
+        assert function["Properties"]["Code"]["ZipFile"].strip() == file.read().strip()
+
+
+@requires_redis
+def test_queue_lengths():
+    queue = f"test-queue-depth-{uuid.uuid4().hex}"
+    try:
+        _redis_command("RPUSH", queue, "a", "b", "c")
+        assert queue_lengths(REDIS_HOST, REDIS_PORT, [queue, f"{queue}-empty"]) == {
+            queue: 3,
+            f"{queue}-empty": 0,
+        }
+    finally:
+        _redis_command("DEL", queue)
+
+
+@requires_redis
+def test_publish():
+    queue = f"test-queue-depth-{uuid.uuid4().hex}"
+    cloudwatch = FakeCloudWatch()
+    env = {
+        "REDIS_HOST": REDIS_HOST,
+        "REDIS_PORT": str(REDIS_PORT),
+        "WORKER_POOLS": f"default={queue};heavy={queue}-heavy",
+        "CLUSTER_NAME": "cluster",
+        "METRIC_NAMESPACE": "stack/Celery",
+    }
+    try:
+        _redis_command("RPUSH", queue, *"abcdef")
+        publish(cloudwatch, FakeEcs({"default": 2, "heavy": 1}), env)
+    finally:
+        _redis_command("DEL", queue)
+
+    (call,) = cloudwatch.calls
+    assert call["Namespace"] == "stack/Celery"
+    backlogs = {
+        m["Dimensions"][0]["Value"]: m["Value"]
+        for m in call["MetricData"]
+        if m["MetricName"] == "BacklogPerTask"
+    }
+    assert backlogs == {"default": 3, "heavy": 0}
@@ -0,0 +1,254 @@
+"""
+Deploy several copies of the stack, eg dev, staging, prod and per-lab stacks,
+at the same time.
+
+The stacks are listed in a yaml or json manifest:
+
+    stacks:
+      - name: yeastregulatorydb-dev
+        region: us-east-2
+        parameters: params/dev.json
+      - name: yeastregulatorydb-prod
+        region: us-east-2
+        parameters: params/prod.json
+        # optional. Defaults to the template built by create_template
+        template: prod_template.yaml
+        # optional. Defaults to --template-bucket. See deploy_stack
+        template_bucket: yeastregulatorydb-templates-us-east-2
+
+Each stack is deployed with `deploy_stack.deploy_stack` in a bounded pool of
+worker threads. Stacks in the same region share one CloudFormation client,
+configured with botocore's adaptive retry mode so that API throttling slows
+the run down rather than failing it.
+
+NOTE: change sets are executed without confirmation.
+"""
+
+import argparse
+import sys
+import threading
+from collections.abc import Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import boto3
+from botocore.config import Config
+
+from yeastregulatorydbstack import deploy_history
+from yeastregulatorydbstack.deploy_stack import deploy_stack, load_parameters
+from yeastregulatorydbstack.template import Template, load_fragment
+
+MAX_WORKERS = 4
+# botocore retries throttled calls with backoff, and in adaptive mode also
+# rate limits the client once it has been throttled
+RETRY_CONFIG = Config(retries={"mode": "adaptive", "max_attempts": 10})
+
+_print_lock = threading.Lock()
+
+
+class StackSpec(NamedTuple):
+    name: str
+    region: str
+    parameters: str | None = None
+    template: str | None = None
+    template_bucket: str | None = None
+
+
+class StackResult(NamedTuple):
+    name: str
+    region: str
+    status: str
+    error: str | None = None
+
+
+def load_manifest(path: str) -> list[StackSpec]:
+    """
+    Load a manifest of stacks to deploy.
+
+    :param path: a yaml or json file with a `stacks` list
+    :type path: str
+
+    :return: the stacks
+    :rtype: list[StackSpec]
+    :raises ValueError: if a stack name appears more than once in a region
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        manifest = load_fragment(file.read())
+    stacks = [
+        StackSpec(
+            name=str(entry["name"]),
+            region=str(entry["region"]),
+            parameters=entry.get("parameters"),
+            template=entry.get("template"),
+            template_bucket=entry.get("template_bucket"),
+        )
+        for entry in manifest["stacks"]
+    ]
+    keys = [(s.name, s.region) for s in stacks]
+    duplicates = {k for k in keys if keys.count(k) > 1}
+    if duplicates:
+        raise ValueError(f"Stacks are listed more than once: {sorted(duplicates)}")
+    return stacks
+
+
+def regional_clients(
+    regions: list[str], config: Config = RETRY_CONFIG, service: str = "cloudformation"
+) -> dict:
+    """
+    Create one client per region. boto3 clients, unlike sessions, are safe
+    to share between threads.
+
+    :param regions: the regions
+    :type regions: list[str]
+    :param config: the client config
+    :type config: Config
+    :param service: the client's service
+    :type service: str
+
+    :return: a map of region to client
+    :rtype: dict
+    """
+    session = boto3.session.Session()
+    return {
+        region: session.client(service, region_name=region, config=config)
+        for region in sorted(set(regions))
+    }
+
+
+def _prefixed_printer(prefix: str) -> Callable[[str], None]:
+    def printer(text: str) -> None:
+        with _print_lock:
+            for line in str(text).splitlines() or [""]:
+                print(f"[{prefix}] {line}")
+
+    return printer
+
+
+def deploy_stacks(
+    stacks: list[StackSpec],
+    default_template: Template | str,
+    clients: Mapping,
+    max_workers: int = MAX_WORKERS,
+    history_path: str | None = None,
+    force: bool = False,
+    template_bucket: str | None = None,
+    s3_clients: Mapping | None = None,
+) -> list[StackResult]:
+    """
+    Deploy stacks concurrently and wait for all of them to finish.
+
+    :param stacks: the stacks to deploy
+    :type stacks: list[StackSpec]
+    :param default_template: the template, or a rendered template, for
+      stacks which do not name their own
+    :type default_template: Template | str
+    :param clients: a map of region to CloudFormation client, see
+      `regional_clients`
+    :type clients: Mapping
+    :param max_workers: the number of stacks deployed at once
+    :type max_workers: int
+    :param history_path: record the resource timings of each deploy in this
+      deploy history database
+    :type history_path: str | None
+    :param force: see `deploy_stack`
+    :type force: bool
+    :param template_bucket: the bucket for stacks which do not name their
+      own, see `deploy_stack`
+    :type template_bucket: str | None
+    :param s3_clients: a map of region to S3 client, see `regional_clients`
+    :type s3_clients: Mapping | None
+
+    :return: the result of each stack, in manifest order. A stack which
+      raised has status `error`.
+    :rtype: list[StackResult]
+    """
+
+    def deploy(spec: StackSpec) -> StackResult:
+        if spec.template:
+            with open(spec.template, "r", encoding="utf-8") as file:
+                template = file.read()
+        else:
+            template = default_template
+        try:
+            status = deploy_stack(
+                spec.name,
+                template,
+                parameters=(
+                    load_parameters(spec.parameters) if spec.parameters else None
+                ),
+                auto_approve=True,
+                force=force,
+                history_path=history_path,
+                template_bucket=spec.template_bucket or template_bucket,
+                cf_client=clients[spec.region],
+                s3_client=(s3_clients or {}).get(spec.region),
+                printer=_prefixed_printer(f"{spec.region}/{spec.name}"),
+            )
+        except Exception as e:  # reported in the summary, the others continue
+            return StackResult(spec.name, spec.region, "error", repr(e))
+        return StackResult(spec.name, spec.region, status)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(deploy, stacks))
+
+
+def format_results(results: list[StackResult]) -> str:
+    """Format the results of `deploy_stacks` as a summary table."""
+    width = max((len(r.name) for r in results), default=5)
+    lines = [f"{'stack':<{width}}  {'region':<12}  status"]
+    for r in results:
+        line = f"{r.name:<{width}}  {r.region:<12}  {r.status}"
+        if r.error:
+            line += f"  {r.error}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Deploy the stacks in a manifest concurrently."
+    )
+    parser.add_argument("manifest", help="A yaml or json manifest of stacks.")
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=MAX_WORKERS,
+        help="The number of stacks deployed at once.",
+    )
+    parser.add_argument(
+        "--history",
+        default=deploy_history.DEFAULT_PATH,
+        help="The deploy history database in which to record resource timings.",
+    )
+    parser.add_argument(
+        "--template-bucket",
+        help="The S3 bucket templates too large to pass inline are uploaded "
+        "to, for stacks which do not name their own.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Create change sets even if the template hash is unchanged.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from yeastregulatorydbstack.create_template import build_template
+
+    args = parse_args()
+    stacks = load_manifest(args.manifest)
+    regions = [s.region for s in stacks]
+    results = deploy_stacks(
+        stacks,
+        build_template(),
+        regional_clients(regions),
+        max_workers=args.max_workers,
+        history_path=args.history,
+        force=args.force,
+        template_bucket=args.template_bucket,
+        s3_clients=regional_clients(regions, service="s3"),
+    )
+    print(format_results(results))
+    if any(r.status in ("error", "failed") for r in results):
+        sys.exit(1)
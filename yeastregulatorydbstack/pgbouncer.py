@@ -0,0 +1,222 @@
+"""
+Derive the settings of the PgBouncer sidecar from the concurrency of the task
+it runs in, see `containers.add_pgbouncer`.
+
+With AppDatabaseEndpoint pgbouncer, every app task runs PgBouncer next to the
+app, which connects to it on localhost. It pools the task's database
+connections, and caps them at `max_db_connections`, without the cost of the
+RDS Proxy.
+
+The clients of a task are the connections the app may open at once: one per
+gunicorn thread, or one per Celery worker process. The Django task size is a
+parameter, so the settings for every Fargate task size are generated into the
+`DjangoPgBouncer` mapping, from the derived gunicorn workers and threads, and
+looked up with `!FindInMap [DjangoPgBouncer, <cpu>, <memory>]`. When the
+DjangoGunicornWorkers or DjangoGunicornThreads parameter overrides the derived
+value, the settings are looked up by workers, then threads, in the
+`DjangoPgBouncerByConcurrency` mapping instead, see `mapped_settings`. Each
+entry is a list, indexed by `FIELDS`. The Celery concurrency is fixed by the
+pool spec, so their settings are written into the template directly.
+
+A task with a single client has nothing to share, so it uses session pooling,
+which supports every PostgreSQL feature. Otherwise a client only holds a
+server connection for the length of a transaction. Transaction pooling does
+not support session state, such as `SET`, advisory locks and server side
+cursors, so set DISABLE_SERVER_SIDE_CURSORS in Django's database settings.
+"""
+
+import math
+from typing import NamedTuple
+
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
+
+from yeastregulatorydbstack.fargate import task_sizes
+from yeastregulatorydbstack.gunicorn import gunicorn_settings
+from yeastregulatorydbstack.template import ref
+
+MAPPING_NAME = "DjangoPgBouncer"
+CONCURRENCY_MAPPING_NAME = "DjangoPgBouncerByConcurrency"
+# the derived gunicorn workers, and threads, of each task size, as the keys of
+# CONCURRENCY_MAPPING_NAME
+WORKERS_MAPPING_NAME = "DjangoPgBouncerWorkers"
+THREADS_MAPPING_NAME = "DjangoPgBouncerThreads"
+# the most workers and threads per worker DjangoGunicornWorkers and
+# DjangoGunicornThreads may override, ie the keys of CONCURRENCY_MAPPING_NAME
+MAX_WORKERS = 64
+MAX_THREADS = 16
+# the port PgBouncer listens on, in the task
+PORT = 6432
+
+
+class PgBouncerSettings(NamedTuple):
+    pool_mode: str
+    default_pool_size: int
+    reserve_pool_size: int
+    max_client_conn: int
+    max_db_connections: int
+
+
+FIELDS = PgBouncerSettings._fields
+
+
+def pgbouncer_settings(clients: int, busy_share: float = 0.5) -> PgBouncerSettings:
+    """
+    Return the PgBouncer settings for a task.
+
+    :param clients: the database connections the app in the task opens at
+      once
+    :type clients: int
+    :param busy_share: the share of the clients expected to be in a
+      transaction at once. Gunicorn threads spend much of a request outside
+      the database, a Celery process running a long query all of it.
+    :type busy_share: float
+
+    :return: the settings
+    :rtype: PgBouncerSettings
+    :raises ValueError: if `clients` is less than 1, or `busy_share` is not
+      in (0, 1]
+    """
+    if clients < 1:
+        raise ValueError("A task needs at least one client")
+    if not 0 < busy_share <= 1:
+        raise ValueError("busy_share must be in (0, 1]")
+    if clients == 1:
+        pool_mode = "session"
+        pool_size = 1
+    else:
+        pool_mode = "transaction"
+        pool_size = max(2, math.ceil(clients * busy_share))
+    # for bursts, once a client has waited reserve_pool_timeout
+    reserve_pool_size = max(1, pool_size // 4)
+    return PgBouncerSettings(
+        pool_mode=pool_mode,
+        default_pool_size=pool_size,
+        reserve_pool_size=reserve_pool_size,
+        # client connections are cheap, and Django may open a new one per
+        # request before the last one is closed
+        max_client_conn=max(100, clients * 2),
+        max_db_connections=pool_size + reserve_pool_size,
+    )
+
+
+def _flow(settings: PgBouncerSettings) -> CommentedSeq:
+    values = CommentedSeq(str(value) for value in settings)
+    values.fa.set_flow_style()
+    return values
+
+
+def pgbouncer_mapping() -> CommentedMap:
+    """
+    Return the `DjangoPgBouncer` template mapping of cpu, then memory, to the
+    PgBouncer settings, for the derived gunicorn workers and threads, as a
+    list of strings, and the mappings the settings are looked up in when
+    the workers or threads are overridden, see `mapped_settings`.
+
+    :rtype: CommentedMap
+    """
+    by_cpu = CommentedMap()
+    workers = CommentedMap()
+    threads = CommentedMap()
+    for cpu, memory in task_sizes():
+        gunicorn = gunicorn_settings(cpu, memory)
+        by_cpu.setdefault(str(cpu), CommentedMap())[str(memory)] = _flow(
+            pgbouncer_settings(gunicorn.workers * gunicorn.threads)
+        )
+        workers.setdefault(str(cpu), CommentedMap())[str(memory)] = str(
+            gunicorn.workers
+        )
+        threads.setdefault(str(cpu), CommentedMap())[str(memory)] = str(
+            gunicorn.threads
+        )
+    by_workers = CommentedMap()
+    for worker_count in range(1, MAX_WORKERS + 1):
+        by_workers[str(worker_count)] = CommentedMap(
+            (str(thread_count), _flow(pgbouncer_settings(worker_count * thread_count)))
+            for thread_count in range(1, MAX_THREADS + 1)
+        )
+    return CommentedMap(
+        {
+            MAPPING_NAME: by_cpu,
+            CONCURRENCY_MAPPING_NAME: by_workers,
+            WORKERS_MAPPING_NAME: workers,
+            THREADS_MAPPING_NAME: threads,
+        }
+    )
+
+
+def mapped_settings(
+    cpu_parameter: str,
+    memory_parameter: str,
+    workers_parameter: str,
+    threads_parameter: str,
+) -> dict:
+    """
+    Return the PgBouncer settings looked up by the task size parameters, by
+    field: in the `DjangoPgBouncer` mapping, or, when the gunicorn workers or
+    threads parameter is set, in the `DjangoPgBouncerByConcurrency` mapping,
+    with the derived value of the other. The condition which is true when a
+    gunicorn parameter is derived is named Derive<parameter>, as in the
+    gunicorn command.
+
+    :param cpu_parameter: the task CPU parameter
+    :type cpu_parameter: str
+    :param memory_parameter: the task memory parameter
+    :type memory_parameter: str
+    :param workers_parameter: the gunicorn workers parameter, 0 to derive
+    :type workers_parameter: str
+    :param threads_parameter: the gunicorn threads parameter, 0 to derive
+    :type threads_parameter: str
+
+    :rtype: dict
+    """
+
+    def by_size(mapping: str) -> dict:
+        return {"Fn::FindInMap": [mapping, ref(cpu_parameter), ref(memory_parameter)]}
+
+    def by_concurrency(workers, threads) -> dict:
+        return {"Fn::FindInMap": [CONCURRENCY_MAPPING_NAME, workers, threads]}
+
+    lookup = {
+        "Fn::If": [
+            f"Derive{workers_parameter}",
+            {
+                "Fn::If": [
+                    f"Derive{threads_parameter}",
+                    by_size(MAPPING_NAME),
+                    by_concurrency(
+                        by_size(WORKERS_MAPPING_NAME), ref(threads_parameter)
+                    ),
+                ]
+            },
+            {
+                "Fn::If": [
+                    f"Derive{threads_parameter}",
+                    by_concurrency(
+                        ref(workers_parameter), by_size(THREADS_MAPPING_NAME)
+                    ),
+                    by_concurrency(ref(workers_parameter), ref(threads_parameter)),
+                ]
+            },
+        ]
+    }
+
+    return {
+        field: {"Fn::Select": [index, lookup]} for index, field in enumerate(FIELDS)
+    }
+
+
+def settings_environment(settings: PgBouncerSettings | dict) -> list[dict]:
+    """
+    Return the PgBouncer settings as the environment variables of the
+    PgBouncer image, eg POOL_MODE.
+
+    :param settings: the settings, or `mapped_settings`
+    :type settings: PgBouncerSettings | dict
+
+    :rtype: list[dict]
+    """
+    if isinstance(settings, PgBouncerSettings):
+        settings = {field: str(value) for field, value in settings._asdict().items()}
+    return [
+        {"Name": field.upper(), "Value": value} for field, value in settings.items()
+    ]
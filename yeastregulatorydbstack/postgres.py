@@ -0,0 +1,181 @@
+"""
+Derive the PostgreSQL parameter group settings from the RDS instance class
+and the workload profile.
+
+RdsInstanceType and PostgresWorkloadProfile are parameters, so the settings
+for every class in `INSTANCE_CLASSES` and every profile are generated into the
+`PostgresSettings` mapping and looked up with
+`!FindInMap [PostgresSettings, <instance class>, <profile>]`. Each entry is a
+list, indexed by `FIELDS`.
+
+The profiles are
+
+- oltp: the Django web requests, many connections running short queries
+- analytical: the rank response and peak calling queries, fewer connections
+  running large joins and sorts, which get more work_mem so that they do not
+  spill to disk, and more parallel workers
+
+Memory follows the usual split: a quarter of the instance memory for
+shared_buffers, and the planner told that three quarters are available for
+caching. work_mem shares what is left after shared_buffers between the sorts
+and hashes of every connection and parallel worker: three per oltp
+connection, whose queries are small, and one per analytical connection.
+Storage is SSD (gp2 or gp3), so a random page costs little more than a
+sequential one.
+
+NOTE: shared_buffers and max_connections are static: a change applies after
+the instance reboots.
+"""
+
+from typing import NamedTuple
+
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
+
+from yeastregulatorydbstack.template import ref
+
+MAPPING_NAME = "PostgresSettings"
+PROFILES = ("oltp", "analytical")
+
+# vCPUs and memory in GiB by RDS instance class
+INSTANCE_CLASSES: dict[str, tuple[int, int]] = {
+    **{
+        f"db.{family}.{size}": spec
+        for family in ("t3", "t4g")
+        for size, spec in {
+            "micro": (2, 1),
+            "small": (2, 2),
+            "medium": (2, 4),
+            "large": (2, 8),
+            "xlarge": (4, 16),
+            "2xlarge": (8, 32),
+        }.items()
+    },
+    **{
+        f"db.{family}.{size}": (vcpus, vcpus * 4)
+        for family in ("m6g", "m6i", "m7g")
+        for size, vcpus in {
+            "large": 2,
+            "xlarge": 4,
+            "2xlarge": 8,
+            "4xlarge": 16,
+        }.items()
+    },
+    **{
+        f"db.{family}.{size}": (vcpus, vcpus * 8)
+        for family in ("r6g", "r6i", "r7g")
+        for size, vcpus in {
+            "large": 2,
+            "xlarge": 4,
+            "2xlarge": 8,
+            "4xlarge": 16,
+        }.items()
+    },
+}
+# RDS's own limit on max_connections
+MAX_CONNECTIONS = 5000
+
+
+class PostgresSettings(NamedTuple):
+    # in 8 kB pages
+    shared_buffers: int
+    effective_cache_size: int
+    # in kB
+    work_mem: int
+    maintenance_work_mem: int
+    # in MB
+    max_wal_size: int
+    random_page_cost: float
+    max_parallel_workers_per_gather: int
+    max_connections: int
+
+
+FIELDS = PostgresSettings._fields
+
+
+def postgres_settings(vcpus: int, memory_gib: float, profile: str) -> PostgresSettings:
+    """
+    Return the PostgreSQL settings for an instance size and workload profile.
+
+    :param vcpus: the instance vCPUs
+    :type vcpus: int
+    :param memory_gib: the instance memory in GiB
+    :type memory_gib: float
+    :param profile: one of `PROFILES`
+    :type profile: str
+
+    :return: the settings
+    :rtype: PostgresSettings
+    :raises ValueError: if the profile is not one of `PROFILES`
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown workload profile {profile!r}, expected {PROFILES}")
+    analytical = profile == "analytical"
+    memory_kb = int(memory_gib * 1024 * 1024)
+    shared_buffers_kb = memory_kb // 4
+
+    memory_mb = memory_kb // 1024
+    if analytical:
+        # each connection may run a large query at any time
+        max_connections = min(500, max(100, memory_mb // 64))
+        sorts_per_connection = 1
+        parallel_workers = min(4, max(1, vcpus // 2))
+    else:
+        # about RDS's default of one connection per 9.5 MB, and no fewer than
+        # the 200 this stack used to set
+        max_connections = min(MAX_CONNECTIONS, max(200, memory_kb // 9300))
+        sorts_per_connection = 3
+        parallel_workers = min(2, max(1, vcpus // 4))
+    work_mem = (memory_kb - shared_buffers_kb) // (
+        max_connections * sorts_per_connection * parallel_workers
+    )
+    maintenance_work_mem = memory_kb // (8 if analytical else 16)
+
+    return PostgresSettings(
+        shared_buffers=shared_buffers_kb // 8,
+        effective_cache_size=memory_kb * 3 // 4 // 8,
+        work_mem=max(4096, work_mem),
+        maintenance_work_mem=min(2 * 1024 * 1024, max(65536, maintenance_work_mem)),
+        max_wal_size=4096 if analytical else 2048,
+        random_page_cost=1.1,
+        max_parallel_workers_per_gather=parallel_workers,
+        max_connections=max_connections,
+    )
+
+
+def postgres_mapping() -> CommentedMap:
+    """
+    Return the `PostgresSettings` template mapping of instance class, then
+    profile, to the settings as a list of strings.
+
+    :rtype: CommentedMap
+    """
+    by_class = CommentedMap()
+    for instance_class, (vcpus, memory_gib) in INSTANCE_CLASSES.items():
+        by_class[instance_class] = CommentedMap()
+        for profile in PROFILES:
+            settings = CommentedSeq(
+                str(value) for value in postgres_settings(vcpus, memory_gib, profile)
+            )
+            settings.fa.set_flow_style()
+            by_class[instance_class][profile] = settings
+    return CommentedMap({MAPPING_NAME: by_class})
+
+
+def parameter_group_parameters() -> CommentedMap:
+    """
+    Return the Parameters of the DB parameter group, each selected from the
+    `PostgresSettings` mapping by the RdsInstanceType and
+    PostgresWorkloadProfile parameters.
+
+    :rtype: CommentedMap
+    """
+    settings = {
+        "Fn::FindInMap": [
+            MAPPING_NAME,
+            ref("RdsInstanceType"),
+            ref("PostgresWorkloadProfile"),
+        ]
+    }
+    return CommentedMap(
+        (field, {"Fn::Select": [index, settings]}) for index, field in enumerate(FIELDS)
+    )
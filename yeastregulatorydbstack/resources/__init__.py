@@ -1,6 +1,8 @@
 from . import (
     alb,
+    celery,
     ecs_fargate,
+    efs,
     lambda_functions,
     rds_redis_ec2,
     security_groups,
@@ -73,6 +73,19 @@ def get_resources():
       LoadBalancerArn: !Ref DjangoStackLoadBalancer
       Port: 443
       Protocol: HTTPS
+
+  FlowerListenerRule:
+    Type: AWS::ElasticLoadBalancingV2::ListenerRule
+    Properties:
+      Actions:
+        - Type: forward
+          TargetGroupArn: !Ref FlowerTargetGroup
+      Conditions:
+        - Field: host-header
+          Values:
+            - !Ref FlowerHostHeader
+      ListenerArn: !Ref DjangoHttpsListener
+      Priority: 10
 """
 
 
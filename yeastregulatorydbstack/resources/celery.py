@@ -0,0 +1,564 @@
+"""
+The Celery worker pools, beat and Flower.
+
+Each pool in `WORKER_POOLS` is a worker service which consumes its own
+queues, so that long peak calling and rank response jobs cannot starve the
+short metadata tasks. The Django app routes tasks to the queues with
+`CELERY_TASK_ROUTES`. Every pool gets its own task definition, service and
+autoscaling, and its scaling bounds are parameters which default to the spec.
+
+The number of tasks in a pool tracks its backlog per running task, ie the
+total length of its Redis queues divided by its running task count. The metric
+is published every minute by the QueueDepthFunction, see lambda_functions.py,
+to the `<stack name>/Celery` CloudWatch namespace.
+"""
+
+import re
+from collections.abc import Iterable, Mapping
+from typing import NamedTuple
+
+from ruamel.yaml.comments import CommentedMap
+
+from yeastregulatorydbstack.containers import (
+    add_pgbouncer,
+    app_container,
+    configure_log_delivery,
+    log_delivery_conditions,
+    log_delivery_parameter,
+    log_delivery_rule,
+    mount_scratch_volumes,
+)
+from yeastregulatorydbstack.fargate import (
+    DEFAULT_EPHEMERAL_STORAGE,
+    constrain_task_size,
+    ephemeral_storage_needed,
+    is_valid_ephemeral_storage,
+    is_valid_task_size,
+    pin_task_definition,
+    pinned_task_definition_conditions,
+    pinned_task_definition_parameters,
+)
+from yeastregulatorydbstack.pgbouncer import pgbouncer_settings
+from yeastregulatorydbstack.resources.efs import READY as REFERENCE_DATA_READY
+from yeastregulatorydbstack.resources.efs import mount_reference_data
+from yeastregulatorydbstack.resources.rds_redis_ec2 import DATABASE_READY
+from yeastregulatorydbstack.resources.vpc_subnets_routetables_networkcon import (
+    ENDPOINTS_READY,
+    service_network_configuration,
+)
+from yeastregulatorydbstack.template import get_att, load_fragment, ref, sub
+
+# describe_services accepts at most 10 services per call, see queue_depth.py
+MAX_POOLS = 10
+
+
+class WorkerPool(NamedTuple):
+    """
+    A Celery worker service.
+
+    :ivar name: CamelCase, used in the logical IDs, eg `Heavy` gives
+      CeleryWorkerHeavyService
+    :ivar queues: the queues the workers consume
+    :ivar concurrency: worker processes per task
+    :ivar prefetch_multiplier: messages each process reserves. Use 1 for long
+      tasks, so that one process does not hold several while others idle.
+    :ivar cpu: task CPU units, where 1024 is one vCPU
+    :ivar memory: task memory in MiB
+    :ivar min_count: the default fewest tasks
+    :ivar max_count: the default most tasks
+    :ivar target_backlog_per_task: the default queued messages per running
+      task which autoscaling aims for
+    :ivar working_set: GiB, the most a task has on disk at once, eg a
+      binding data file and what is derived from it
+    :ivar ephemeral_storage: task ephemeral storage in GiB. It must hold the
+      working set and the image, see `ephemeral_storage_needed`.
+    :ivar scratch_volumes: volumes on the ephemeral storage, mounted at
+      /scratch/<name>
+    """
+
+    name: str
+    queues: tuple[str, ...]
+    concurrency: int
+    prefetch_multiplier: int
+    cpu: int
+    memory: int
+    min_count: int
+    max_count: int
+    target_backlog_per_task: int
+    working_set: float = 0
+    ephemeral_storage: int = DEFAULT_EPHEMERAL_STORAGE
+    scratch_volumes: tuple[str, ...] = ("scratch",)
+
+
+WORKER_POOLS = (
+    # metadata, notifications and other short tasks
+    WorkerPool(
+        name="Default",
+        queues=("celery",),
+        concurrency=4,
+        prefetch_multiplier=4,
+        cpu=512,
+        memory=1024,
+        min_count=1,
+        max_count=8,
+        target_backlog_per_task=20,
+    ),
+    # peak calling and rank response, which run for minutes and need memory
+    WorkerPool(
+        name="Heavy",
+        queues=("peak_calling", "rank_response"),
+        concurrency=1,
+        prefetch_multiplier=1,
+        cpu=2048,
+        memory=8192,
+        min_count=1,
+        max_count=4,
+        target_backlog_per_task=2,
+        # an unpacked binding data set and its sorted intermediates
+        working_set=48,
+        ephemeral_storage=64,
+    ),
+)
+
+
+def validate_pools(pools: Iterable[WorkerPool]) -> None:
+    """
+    Check a worker pool spec.
+
+    :raises ValueError: if a name is repeated or not CamelCase, a queue is
+      consumed by more than one pool, a task size is not supported by
+      Fargate, the ephemeral storage is not supported or is short of the
+      working set, the scaling bounds are inverted, or there are more than
+      `MAX_POOLS` pools
+    """
+    pools = list(pools)
+    if len(pools) > MAX_POOLS:
+        raise ValueError(f"At most {MAX_POOLS} worker pools are supported")
+    names: set[str] = set()
+    queues: set[str] = set()
+    for pool in pools:
+        if not re.fullmatch(r"[A-Z][A-Za-z0-9]*", pool.name) or pool.name in names:
+            raise ValueError(
+                f"Worker pool name {pool.name!r} is repeated or not CamelCase"
+            )
+        names.add(pool.name)
+        shared = queues.intersection(pool.queues)
+        if not pool.queues or shared:
+            raise ValueError(
+                f"Worker pool {pool.name} needs queues of its own, "
+                f"{sorted(shared)} are consumed by another pool"
+            )
+        queues.update(pool.queues)
+        if not is_valid_task_size(pool.cpu, pool.memory):
+            raise ValueError(
+                f"Worker pool {pool.name}: Fargate does not support "
+                f"{pool.cpu} CPU units with {pool.memory} MiB"
+            )
+        needed = ephemeral_storage_needed(pool.working_set)
+        if pool.ephemeral_storage != DEFAULT_EPHEMERAL_STORAGE and not (
+            is_valid_ephemeral_storage(pool.ephemeral_storage)
+        ):
+            raise ValueError(
+                f"Worker pool {pool.name}: Fargate does not support "
+                f"{pool.ephemeral_storage} GiB of ephemeral storage"
+            )
+        if pool.ephemeral_storage < needed:
+            raise ValueError(
+                f"Worker pool {pool.name}: a {pool.working_set} GiB working set "
+                f"needs {needed} GiB of ephemeral storage, not "
+                f"{pool.ephemeral_storage}"
+            )
+        if not 1 <= pool.min_count <= pool.max_count:
+            raise ValueError(
+                f"Worker pool {pool.name}: expected 1 <= min_count <= max_count"
+            )
+
+
+def queue_depth_pools(pools: Iterable[WorkerPool] = WORKER_POOLS) -> str:
+    """
+    Return the WORKER_POOLS environment variable of the QueueDepthFunction,
+    `<service name>=<queue>,<queue>;...`, as the body of a `!Sub`.
+
+    :rtype: str
+    """
+    return ";".join(
+        f"${{CeleryWorker{pool.name}Service.Name}}={','.join(pool.queues)}"
+        for pool in pools
+    )
+
+
+def _service_ids() -> list[str]:
+    return [f"CeleryWorker{pool.name}Service" for pool in WORKER_POOLS] + [
+        "CeleryBeatService",
+        "FlowerService",
+    ]
+
+
+def get_parameters() -> Mapping:
+    """
+    Return the parameters section of the Celery CloudFormation template.
+
+    :return: parameters section
+    :rtype: Mapping
+    """
+    parameters = load_fragment(
+        """
+  CeleryApp:
+    Type: String
+    Description: The Celery app, eg config.celery_app
+    Default: config.celery_app
+
+  CeleryWorkerFargateBase:
+    Type: Number
+    Description: The number of tasks in each worker pool which always run on on-demand FARGATE
+    Default: 0
+    MinValue: 0
+
+  CeleryWorkerFargateWeight:
+    Type: Number
+    Description: The share of worker tasks above the base which run on FARGATE
+    Default: 1
+    MinValue: 0
+
+  CeleryWorkerFargateSpotWeight:
+    Type: Number
+    Description: The share of worker tasks above the base which run on FARGATE_SPOT
+    Default: 3
+    MinValue: 0
+
+  CeleryWorkerStopTimeout:
+    Type: Number
+    Description: >-
+      Seconds a Celery worker has to finish its running tasks after SIGTERM,
+      eg on a Spot interruption, before it is killed. Fargate allows at most 120.
+    Default: 120
+    MinValue: 2
+    MaxValue: 120
+
+  CeleryFlowerPort:
+    Type: Number
+    Description: The port for Celery Flower
+    Default: 5555
+
+  CeleryFlowerTaskDefinitionCPUs:
+    Type: Number
+    Description: The number of CPUs to use for the Celery Flower task definition
+    Default: 256
+
+  CeleryFlowerTaskDefinitionMemory:
+    Type: Number
+    Description: The amount of memory to use for the Celery Flower task definition
+    Default: 512
+"""
+    )
+    for pool in WORKER_POOLS:
+        prefix = f"CeleryWorker{pool.name}"
+        parameters[f"{prefix}MinCount"] = {
+            "Type": "Number",
+            "Description": f"The fewest {pool.name} Celery worker tasks to run",
+            "Default": pool.min_count,
+            "MinValue": 1,
+        }
+        parameters[f"{prefix}MaxCount"] = {
+            "Type": "Number",
+            "Description": f"The most {pool.name} Celery worker tasks to run",
+            "Default": pool.max_count,
+            "MinValue": 1,
+        }
+        parameters[f"{prefix}TargetBacklogPerTask"] = {
+            "Type": "Number",
+            "Description": (
+                f"The queued messages per running {pool.name} worker task "
+                "which autoscaling aims for. Lower values scale out sooner."
+            ),
+            "Default": pool.target_backlog_per_task,
+            "MinValue": 1,
+        }
+    parameters["CeleryLogDelivery"] = log_delivery_parameter(
+        "Celery", "Celery worker, beat and Flower"
+    )
+    parameters.update(pinned_task_definition_parameters(_service_ids()))
+    constrain_task_size(
+        parameters,
+        "CeleryFlowerTaskDefinitionCPUs",
+        "CeleryFlowerTaskDefinitionMemory",
+    )
+    return parameters
+
+
+def get_rules() -> CommentedMap:
+    """
+    Return the rules section of the Celery CloudFormation template, which
+    rejects a Flower task Memory that Fargate does not support with its Cpu,
+    and firelens-s3 log delivery without a bucket. The worker pool sizes are
+    checked when the template is generated, see `validate_pools`.
+
+    :return: rules section
+    :rtype: CommentedMap
+    """
+    rules = constrain_task_size(
+        get_parameters(),
+        "CeleryFlowerTaskDefinitionCPUs",
+        "CeleryFlowerTaskDefinitionMemory",
+    )
+    rules["CeleryLogArchiveBucket"] = log_delivery_rule("Celery")
+    return rules
+
+
+def get_conditions() -> dict:
+    """
+    Return the conditions section of the Celery CloudFormation template.
+
+    :return: conditions section
+    :rtype: dict
+    """
+    conditions = log_delivery_conditions("Celery")
+    conditions.update(pinned_task_definition_conditions(_service_ids()))
+    return conditions
+
+
+def _task_definition(family: str, cpu, memory, container: Mapping) -> dict:
+    return {
+        "Type": "AWS::ECS::TaskDefinition",
+        "DependsOn": ["MyApplicationLogGroup", DATABASE_READY],
+        "Properties": {
+            "Family": family,
+            "ExecutionRoleArn": get_att("ExecutionRole", "Arn"),
+            "TaskRoleArn": get_att("TaskRole", "Arn"),
+            "RequiresCompatibilities": ["FARGATE"],
+            "NetworkMode": "awsvpc",
+            "Cpu": cpu,
+            "Memory": memory,
+            "RuntimePlatform": {
+                "CpuArchitecture": ref("CPUArchitecture"),
+                "OperatingSystemFamily": "LINUX",
+            },
+            "ContainerDefinitions": [container],
+            "Tags": [{"Key": "app", "Value": ref("AppTagValue")}],
+        },
+    }
+
+
+def _service(task_definition: str, desired_count=None, **properties) -> dict:
+    # an autoscaled service has no desired_count, so that a stack update does
+    # not reset its scaled out count, see worker_pool_resources
+    if desired_count is not None:
+        properties = {"DesiredCount": desired_count, **properties}
+    return {
+        "Type": "AWS::ECS::Service",
+        "DependsOn": [ENDPOINTS_READY],
+        "Properties": {
+            "Cluster": ref("DjangoAppEcsCluster"),
+            "TaskDefinition": ref(task_definition),
+            **properties,
+            "EnableExecuteCommand": True,
+            "NetworkConfiguration": service_network_configuration(),
+            "Tags": [{"Key": "app", "Value": ref("AppTagValue")}],
+        },
+    }
+
+
+def worker_pool_resources(pool: WorkerPool) -> CommentedMap:
+    """
+    Return the task definition, service and autoscaling of a worker pool.
+
+    :param pool: the pool
+    :type pool: WorkerPool
+
+    :return: resources, by logical ID
+    :rtype: CommentedMap
+    """
+    prefix = f"CeleryWorker{pool.name}"
+    container = app_container(
+        "celery-worker",
+        [
+            "celery",
+            "--app",
+            ref("CeleryApp"),
+            "worker",
+            "--loglevel=INFO",
+            f"--queues={','.join(pool.queues)}",
+            f"--concurrency={pool.concurrency}",
+            f"--prefetch-multiplier={pool.prefetch_multiplier}",
+            f"--hostname={pool.name.lower()}@%h",
+        ],
+    )
+    # Celery finishes its running tasks on SIGTERM. Spot interruptions give
+    # two minutes notice
+    container["StopTimeout"] = ref("CeleryWorkerStopTimeout")
+
+    resources = CommentedMap()
+    resources[f"{prefix}TaskDefinition"] = _task_definition(
+        f"celery-worker-{pool.name.lower()}-family",
+        str(pool.cpu),
+        str(pool.memory),
+        container,
+    )
+    task_definition = resources[f"{prefix}TaskDefinition"]
+    if pool.ephemeral_storage != DEFAULT_EPHEMERAL_STORAGE:
+        task_definition["Properties"]["EphemeralStorage"] = {
+            "SizeInGiB": pool.ephemeral_storage
+        }
+    mount_scratch_volumes(task_definition, pool.scratch_volumes)
+    mount_reference_data(task_definition)
+    # each worker process holds its connection for the length of its task
+    add_pgbouncer(task_definition, pgbouncer_settings(pool.concurrency, busy_share=1))
+    resources[f"{prefix}Service"] = _service(
+        # no DesiredCount: the scalable target owns the count. ECS starts one
+        # task, which the scalable target raises to the pool's MinCount
+        f"{prefix}TaskDefinition",
+        CapacityProviderStrategy=[
+            {
+                "CapacityProvider": "FARGATE",
+                "Base": ref("CeleryWorkerFargateBase"),
+                "Weight": ref("CeleryWorkerFargateWeight"),
+            },
+            {
+                "CapacityProvider": "FARGATE_SPOT",
+                "Weight": ref("CeleryWorkerFargateSpotWeight"),
+            },
+        ],
+    )
+    resources[f"{prefix}Service"]["DependsOn"].append(REFERENCE_DATA_READY)
+    # uses the Application Auto Scaling service linked role, so no RoleARN
+    resources[f"{prefix}ScalableTarget"] = {
+        "Type": "AWS::ApplicationAutoScaling::ScalableTarget",
+        "Properties": {
+            "ServiceNamespace": "ecs",
+            "ScalableDimension": "ecs:service:DesiredCount",
+            "ResourceId": sub(
+                f"service/${{DjangoAppEcsCluster}}/${{{prefix}Service.Name}}"
+            ),
+            "MinCapacity": ref(f"{prefix}MinCount"),
+            "MaxCapacity": ref(f"{prefix}MaxCount"),
+        },
+    }
+    resources[f"{prefix}BacklogScalingPolicy"] = {
+        "Type": "AWS::ApplicationAutoScaling::ScalingPolicy",
+        "Properties": {
+            "PolicyName": f"celery-worker-{pool.name.lower()}-backlog-per-task",
+            "PolicyType": "TargetTrackingScaling",
+            "ScalingTargetId": ref(f"{prefix}ScalableTarget"),
+            "TargetTrackingScalingPolicyConfiguration": {
+                "TargetValue": ref(f"{prefix}TargetBacklogPerTask"),
+                # scale out quickly when uploads arrive, scale in once the
+                # backlog has stayed low for a while
+                "ScaleOutCooldown": 60,
+                "ScaleInCooldown": 300,
+                "CustomizedMetricSpecification": {
+                    "Namespace": sub("${AWS::StackName}/Celery"),
+                    "MetricName": "BacklogPerTask",
+                    "Dimensions": [
+                        {
+                            "Name": "ServiceName",
+                            "Value": get_att(f"{prefix}Service", "Name"),
+                        }
+                    ],
+                    "Statistic": "Average",
+                    "Unit": "Count",
+                },
+            },
+        },
+    }
+    return resources
+
+
+def get_resources() -> Mapping:
+    """
+    Return the resources section of the Celery CloudFormation template.
+
+    :return: resources section
+    :rtype: Mapping
+    """
+    validate_pools(WORKER_POOLS)
+    resources = CommentedMap()
+    for pool in WORKER_POOLS:
+        resources.update(worker_pool_resources(pool))
+
+    resources["CeleryBeatTaskDefinition"] = _task_definition(
+        "celery-beat-family",
+        "256",
+        "512",
+        app_container("celery-beat", ["/start-celerybeat"]),
+    )
+    # a second beat would schedule every periodic task twice, so the old
+    # task is stopped before the new one starts, and beat never runs on Spot
+    resources["CeleryBeatService"] = _service(
+        "CeleryBeatTaskDefinition",
+        1,
+        CapacityProviderStrategy=[{"CapacityProvider": "FARGATE", "Weight": 1}],
+        DeploymentConfiguration={"MaximumPercent": 100, "MinimumHealthyPercent": 0},
+    )
+
+    resources.update(
+        load_fragment(
+            """
+  FlowerTargetGroup:
+    Type: AWS::ElasticLoadBalancingV2::TargetGroup
+    Properties:
+      VpcId: !Ref MyVPC
+      Port: !Ref CeleryFlowerPort
+      Protocol: HTTP
+      TargetType: ip
+      HealthCheckProtocol: HTTP
+      HealthCheckPath: /healthcheck
+      Tags:
+        - Key: app
+          Value: !Ref AppTagValue
+"""
+        )
+    )
+    flower = app_container("flower", ["/start-flower"])
+    flower["PortMappings"] = [
+        {
+            "ContainerPort": ref("CeleryFlowerPort"),
+            "HostPort": ref("CeleryFlowerPort"),
+            "Protocol": "tcp",
+        }
+    ]
+    resources["FlowerTaskDefinition"] = _task_definition(
+        "celery-flower-family",
+        ref("CeleryFlowerTaskDefinitionCPUs"),
+        ref("CeleryFlowerTaskDefinitionMemory"),
+        flower,
+    )
+    resources["FlowerService"] = _service(
+        "FlowerTaskDefinition",
+        1,
+        CapacityProviderStrategy=[{"CapacityProvider": "FARGATE", "Weight": 1}],
+        LoadBalancers=[
+            {
+                "TargetGroupArn": ref("FlowerTargetGroup"),
+                "ContainerName": "flower",
+                "ContainerPort": ref("CeleryFlowerPort"),
+            }
+        ],
+    )
+    # the target group must be behind the load balancer before the service
+    # can register with it
+    resources["FlowerService"]["DependsOn"].append("FlowerListenerRule")
+
+    for logical_id in ("CeleryBeatTaskDefinition", "FlowerTaskDefinition"):
+        add_pgbouncer(resources[logical_id], pgbouncer_settings(1))
+    for resource in resources.values():
+        if resource["Type"] == "AWS::ECS::TaskDefinition":
+            configure_log_delivery(resource, "Celery")
+    for logical_id in _service_ids():
+        pin_task_definition(resources[logical_id], logical_id)
+    return resources
+
+
+def get_outputs() -> Mapping:
+    """
+    Return the outputs section of the Celery CloudFormation template.
+
+    :return: outputs section
+    :rtype: Mapping
+    """
+    return {
+        f"CeleryWorker{pool.name}ServiceName": {
+            "Description": f"Name of the {pool.name} Celery worker service",
+            "Value": get_att(f"CeleryWorker{pool.name}Service", "Name"),
+        }
+        for pool in WORKER_POOLS
+    }
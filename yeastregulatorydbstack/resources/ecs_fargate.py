@@ -1,10 +1,95 @@
-def get_parameters() -> str:
-    return """
+"""
+The ECS cluster, the Django service and its autoscaling.
+
+The Django container runs gunicorn with settings derived from the task size,
+see yeastregulatorydbstack.gunicorn. Each setting can be overridden by a
+parameter. The PgBouncer sidecar, with AppDatabaseEndpoint pgbouncer, is
+sized for the derived gunicorn workers and threads, see
+yeastregulatorydbstack.pgbouncer.
+"""
+
+from collections.abc import Iterable, Mapping
+
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
+
+from yeastregulatorydbstack.containers import (
+    add_pgbouncer,
+    app_container,
+    configure_log_delivery,
+    log_delivery_conditions,
+    log_delivery_parameter,
+    log_delivery_rule,
+)
+from yeastregulatorydbstack.fargate import (
+    constrain_task_size,
+    pin_task_definition,
+    pinned_task_definition_conditions,
+    pinned_task_definition_parameters,
+)
+from yeastregulatorydbstack.gunicorn import gunicorn_mapping
+from yeastregulatorydbstack.pgbouncer import mapped_settings, pgbouncer_mapping
+from yeastregulatorydbstack.resources.vpc_subnets_routetables_networkcon import (
+    service_network_configuration,
+)
+from yeastregulatorydbstack.template import load_fragment, ref, set_allowed_values
+
+# the DjangoHealthCheckInterval values. They are enumerated so that the rules
+# can check that DjangoHealthCheckTimeout is shorter
+HEALTH_CHECK_INTERVALS = (5, 10, 15, 20, 30, 60, 120, 300)
+# DjangoHealthCheckTimeout MinValue and MaxValue
+HEALTH_CHECK_TIMEOUTS = range(2, 121)
+# the slow start durations the target group rejects, other than 0 to disable
+# it, between its MinValue and MaxValue
+SLOW_START_GAP = range(1, 30)
+
+
+def get_parameters() -> Mapping:
+    """
+    Return the parameters section of the ECS Fargate CloudFormation template.
+    The Django task size is restricted to the Fargate task sizes.
+
+    :return: parameters section
+    :rtype: Mapping
+    """
+    parameters = load_fragment(
+        """
   LogGroup:
     Description: "The name of the CloudWatch Logs log group."
     Type: String
     Default: "djangoappstacklog"
+
+  LogMaxBufferSize:
+    Description: >-
+      The buffer awslogs holds log lines in with non-blocking log delivery,
+      eg 25m. Lines are dropped when it is full.
+    Type: String
+    Default: 25m
+    AllowedPattern: "^[0-9]+[kmg]$"
+
+  LogArchiveBucket:
+    Description: >-
+      The S3 bucket the firelens-s3 log delivery writes gzipped logs to.
+      Only used with firelens-s3.
+    Type: String
+    Default: ""
+
+  LogRouterImage:
+    Type: String
+    Description: >-
+      The Fluent Bit image of the log router sidecar with a firelens log
+      delivery. Mirror it to ECR when the services run in the private subnets.
+    Default: public.ecr.aws/aws-observability/aws-for-fluent-bit:2.32.2
     
+  CPUArchitecture:
+    Type: String
+    Description: >-
+      The CPU architecture of every task definition. ARM64 runs on Graviton
+      and needs arm64, or multi-architecture, images.
+    Default: X86_64
+    AllowedValues:
+      - X86_64
+      - ARM64
+
   DjangoTaskDefinitionCPUs:
     Type: Number
     Description: The number of CPUs to use for the Django task definition
@@ -15,6 +100,16 @@ def get_parameters() -> str:
     Description: The amount of memory to use for the Django task definition
     Default: 512
 
+  DjangoEphemeralStorage:
+    Type: Number
+    Description: >-
+      GiB of ephemeral storage for each Django task, shared by the image and
+      anything written to disk, eg uploads before they go to S3. 20 is the
+      Fargate default.
+    Default: 20
+    MinValue: 20
+    MaxValue: 200
+
   DjangoAppImage:
     Type: String
     Description: The Docker image for the Django app. eg 040367161929.dkr.ecr.us-east-2.amazonaws.com/django-stack:latest
@@ -23,41 +118,309 @@ def get_parameters() -> str:
     Type: String
     Description: The bucket/file to the environment file for the Django app. eg yeastregulatorydb-strides-tmp/django.env
 
-  CeleryTaskDefinitionCPUs:
+  DjangoMinCount:
     Type: Number
-    Description: The number of CPUs to use for the Celery task definition
-    Default: 256
+    Description: The fewest Django tasks to run
+    Default: 1
+    MinValue: 1
 
-  CeleryTaskDefinitionMemory:
+  DjangoMaxCount:
     Type: Number
-    Description: The amount of memory to use for the Celery task definition
-    Default: 512
+    Description: The most Django tasks to run
+    Default: 6
+    MinValue: 1
 
-  CeleryFlowerPort:
+  DjangoTargetRequestsPerTask:
     Type: Number
-    Description: The port for Celery Flower
-    Default: 5555
+    Description: >-
+      The number of ALB requests per Django task per minute which
+      autoscaling aims for
+    Default: 1000
+    MinValue: 1
 
-  CeleryFlowerTaskDefinitionCPUs:
+  DjangoTargetCPUUtilization:
     Type: Number
-    Description: The number of CPUs to use for the Celery Flower task definition
-    Default: 256
+    Description: The average CPU utilization, in percent, which autoscaling aims for
+    Default: 60
+    MinValue: 1
+    MaxValue: 100
 
-  CeleryFlowerTaskDefinitionMemory:
+  DjangoScaleOutCooldown:
     Type: Number
-    Description: The amount of memory to use for the Celery Flower task definition
-    Default: 512
+    Description: Seconds after a Django scale out before another scale out
+    Default: 60
+
+  DjangoScaleInCooldown:
+    Type: Number
+    Description: Seconds after a Django scale in, or out, before a scale in
+    Default: 300
+
+  DjangoDeploymentMinimumHealthyPercent:
+    Type: Number
+    Description: >-
+      The running Django tasks, as a percent of the desired count, which a
+      deploy keeps in service
+    Default: 100
+    MinValue: 0
+    MaxValue: 100
+
+  DjangoDeploymentMaximumPercent:
+    Type: Number
+    Description: >-
+      The Django tasks, as a percent of the desired count, which may run
+      during a deploy. 200 starts a full set of new tasks at once.
+    Default: 200
+    MinValue: 100
+    MaxValue: 200
+
+  DjangoDeploymentRollback:
+    Type: String
+    Description: >-
+      Whether a Django deploy whose tasks keep failing to start, or to pass
+      the health check, rolls back to the last deployment that completed
+    Default: "true"
+    AllowedValues:
+      - "true"
+      - "false"
+
+  DjangoHealthCheckGracePeriod:
+    Type: Number
+    Description: >-
+      Seconds after a Django task starts during which ECS ignores failed load
+      balancer health checks
+    Default: 60
+    MinValue: 0
+
+  DjangoHealthCheckInterval:
+    Type: Number
+    Description: Seconds between load balancer health checks of a Django task
+    Default: 10
+
+  DjangoHealthCheckTimeout:
+    Type: Number
+    Description: >-
+      Seconds a health check waits for a response. Must be less than
+      DjangoHealthCheckInterval.
+    Default: 5
+    MinValue: 2
+    MaxValue: 120
+
+  DjangoHealthyThreshold:
+    Type: Number
+    Description: Consecutive passed health checks before a Django task gets traffic
+    Default: 2
+    MinValue: 2
+    MaxValue: 10
+
+  DjangoUnhealthyThreshold:
+    Type: Number
+    Description: Consecutive failed health checks before a Django task is replaced
+    Default: 3
+    MinValue: 2
+    MaxValue: 10
+
+  DjangoDeregistrationDelay:
+    Type: Number
+    Description: >-
+      Seconds the load balancer lets in-flight requests to a stopping Django
+      task finish. Keep it above the longest request.
+    Default: 30
+    MinValue: 0
+    MaxValue: 3600
+
+  DjangoSlowStart:
+    Type: Number
+    Description: >-
+      Seconds over which a new Django task's share of requests ramps up, so
+      that it warms up before a full share. 0 disables, otherwise 30 to 900.
+    Default: 30
+    MinValue: 0
+    MaxValue: 900
+
+  DjangoFargateBase:
+    Type: Number
+    Description: The number of Django tasks which always run on on-demand FARGATE
+    Default: 1
+    MinValue: 0
+
+  DjangoFargateWeight:
+    Type: Number
+    Description: The share of Django tasks above the base which run on FARGATE
+    Default: 1
+    MinValue: 0
+
+  DjangoFargateSpotWeight:
+    Type: Number
+    Description: The share of Django tasks above the base which run on FARGATE_SPOT
+    Default: 1
+    MinValue: 0
+
+  DjangoServerApp:
+    Type: String
+    Description: The module gunicorn serves, eg config.wsgi or config.asgi
+    Default: config.wsgi
+
+  DjangoGunicornWorkerClass:
+    Type: String
+    Description: The gunicorn worker class. Use uvicorn.workers.UvicornWorker with config.asgi
+    Default: gthread
+    AllowedValues:
+      - gthread
+      - uvicorn.workers.UvicornWorker
+
+  DjangoGunicornWorkers:
+    Type: Number
+    Description: The number of gunicorn workers. 0 derives it from the task size
+    Default: 0
+    MinValue: 0
+    MaxValue: 64
+
+  DjangoGunicornThreads:
+    Type: Number
+    Description: The threads per gthread worker. 0 derives it from the task size
+    Default: 0
+    MinValue: 0
+    MaxValue: 16
+
+  DjangoGunicornTimeout:
+    Type: Number
+    Description: Seconds before a silent worker is restarted. 0 derives it from the task size
+    Default: 0
+    MinValue: 0
+
+  DjangoGunicornMaxRequests:
+    Type: Number
+    Description: Requests before a worker is recycled. 0 derives it from the task size
+    Default: 0
+    MinValue: 0
 """
+    )
+    set_allowed_values(parameters["DjangoHealthCheckInterval"], HEALTH_CHECK_INTERVALS)
+    parameters["DjangoLogDelivery"] = log_delivery_parameter("Django", "Django")
+    parameters.update(pinned_task_definition_parameters(["DjangoService"]))
+    constrain_task_size(
+        parameters, "DjangoTaskDefinitionCPUs", "DjangoTaskDefinitionMemory"
+    )
+    return parameters
+
+
+def get_rules() -> CommentedMap:
+    """
+    Return the rules section of the ECS Fargate CloudFormation template,
+    which rejects a Django task Memory that Fargate does not support with its
+    Cpu, and firelens-s3 log delivery without a bucket.
+
+    :return: rules section
+    :rtype: CommentedMap
+    """
+    rules = constrain_task_size(
+        get_parameters(), "DjangoTaskDefinitionCPUs", "DjangoTaskDefinitionMemory"
+    )
+    rules["DjangoLogArchiveBucket"] = log_delivery_rule("Django")
+    rules.update(_health_check_rules())
+    return rules
+
+
+def _flow(values: Iterable) -> CommentedSeq:
+    values = CommentedSeq(str(value) for value in values)
+    values.fa.set_flow_style()
+    return values
 
 
-def get_resources() -> str:
+def _health_check_rules() -> CommentedMap:
+    """
+    Return the rules which reject a DjangoHealthCheckTimeout which is not
+    shorter than DjangoHealthCheckInterval, one per interval, and a
+    DjangoSlowStart which the target group does not support. Rules can not
+    compare numbers, so the allowed values are listed.
+    """
+    rules = CommentedMap()
+    for interval in HEALTH_CHECK_INTERVALS:
+        timeouts = [t for t in HEALTH_CHECK_TIMEOUTS if t < interval]
+        if len(timeouts) == len(HEALTH_CHECK_TIMEOUTS):
+            continue
+        rules[f"DjangoHealthCheckInterval{interval}"] = {
+            "RuleCondition": {
+                "Fn::Equals": [ref("DjangoHealthCheckInterval"), str(interval)]
+            },
+            "Assertions": [
+                {
+                    "Assert": {
+                        "Fn::Contains": [
+                            _flow(timeouts),
+                            ref("DjangoHealthCheckTimeout"),
+                        ]
+                    },
+                    "AssertDescription": (
+                        f"With DjangoHealthCheckInterval {interval}, "
+                        "DjangoHealthCheckTimeout must be less than "
+                        f"{interval}"
+                    ),
+                }
+            ],
+        }
+    rules["DjangoSlowStart"] = {
+        "Assertions": [
+            {
+                "Assert": {
+                    "Fn::Not": [
+                        {
+                            "Fn::Contains": [
+                                _flow(SLOW_START_GAP),
+                                ref("DjangoSlowStart"),
+                            ]
+                        }
+                    ]
+                },
+                "AssertDescription": "DjangoSlowStart must be 0 or 30 to 900",
+            }
+        ]
+    }
+    return rules
+
+
+def get_mappings() -> CommentedMap:
+    """
+    Return the mappings section of the ECS Fargate CloudFormation template.
+
+    :return: the gunicorn and PgBouncer settings of each task size
+    :rtype: CommentedMap
+    """
+    mappings = gunicorn_mapping()
+    mappings.update(pgbouncer_mapping())
+    return mappings
+
+
+def get_conditions() -> Mapping:
+    """
+    Return the conditions section of the ECS Fargate CloudFormation template.
+
+    :return: conditions section
+    :rtype: Mapping
+    """
+    conditions = load_fragment(
+        """
+  DeriveDjangoGunicornWorkers: !Equals [!Ref DjangoGunicornWorkers, "0"]
+  DeriveDjangoGunicornThreads: !Equals [!Ref DjangoGunicornThreads, "0"]
+  DeriveDjangoGunicornTimeout: !Equals [!Ref DjangoGunicornTimeout, "0"]
+  DeriveDjangoGunicornMaxRequests: !Equals [!Ref DjangoGunicornMaxRequests, "0"]
+  DefaultDjangoEphemeralStorage: !Equals [!Ref DjangoEphemeralStorage, "20"]
+"""
+    )
+    conditions.update(log_delivery_conditions("Django"))
+    conditions.update(pinned_task_definition_conditions(["DjangoService"]))
+    return conditions
+
+
+def get_resources() -> Mapping:
     """
     Return the resources section of the ECS Fargate CloudFormation template.
 
     :return: resources section
-    :rtype: str
+    :rtype: Mapping
     """
-    return """
+    resources = load_fragment(
+        """
   ExecutionRole:
     Type: AWS::IAM::Role
     Properties:
@@ -139,6 +502,10 @@ def get_resources() -> str:
     Properties:
       CapacityProviders:
         - FARGATE
+        - FARGATE_SPOT
+      DefaultCapacityProviderStrategy:
+        - CapacityProvider: FARGATE
+          Weight: 1
       ClusterName: DjangoAppCluster
       Tags:
         - Key: app
@@ -155,6 +522,15 @@ def get_resources() -> str:
       TargetType: ip
       HealthCheckProtocol: HTTP
       HealthCheckPath: /healthcheck
+      HealthCheckIntervalSeconds: !Ref DjangoHealthCheckInterval
+      HealthCheckTimeoutSeconds: !Ref DjangoHealthCheckTimeout
+      HealthyThresholdCount: !Ref DjangoHealthyThreshold
+      UnhealthyThresholdCount: !Ref DjangoUnhealthyThreshold
+      TargetGroupAttributes:
+        - Key: deregistration_delay.timeout_seconds
+          Value: !Ref DjangoDeregistrationDelay
+        - Key: slow_start.duration_seconds
+          Value: !Ref DjangoSlowStart
       Tags:
         - Key: app
           Value: !Ref AppTagValue
@@ -166,58 +542,64 @@ def get_resources() -> str:
       - ExecutionRole
       - TaskRole
       - MyElastiCacheRedis
-      - MyDBInstance
+      - DatabaseReady
       - MyApplicationLogGroup
     Properties:
       Family: django-app-family
       Cpu: !Ref DjangoTaskDefinitionCPUs
       Memory: !Ref DjangoTaskDefinitionMemory
+      # a task definition may only ask for 21 GiB or more
+      EphemeralStorage: !If
+        - DefaultDjangoEphemeralStorage
+        - !Ref AWS::NoValue
+        - SizeInGiB: !Ref DjangoEphemeralStorage
       NetworkMode: awsvpc
       RequiresCompatibilities:
         - FARGATE
+      RuntimePlatform:
+        CpuArchitecture: !Ref CPUArchitecture
+        OperatingSystemFamily: LINUX
       ExecutionRoleArn: !GetAtt ExecutionRole.Arn
       TaskRoleArn: !GetAtt TaskRole.Arn
       ContainerDefinitions:
+        # the image, environment and logging are added by get_resources.
+        # The DjangoGunicorn entries are lists of workers, threads, timeout,
+        # max requests and max requests jitter
         - Name: django
-          Image: !Ref DjangoAppImage
           Command:
-            - "tail"
-            - "-f"
-            - "/dev/null"
-          Cpu: !Ref DjangoTaskDefinitionCPUs
-          Memory: !Ref DjangoTaskDefinitionMemory
-          Environment:
-            - Name: AWS_DEFAULT_REGION
-              Value: !Ref "AWS::Region"
-            - Name: AWS_S3_REGION_NAME
-              Value: !Ref "AWS::Region"
-            - Name: REDIS_HOST
-              Value: !GetAtt MyElastiCacheRedis.RedisEndpoint.Address
-            - Name: REDIS_PORT
-              Value: !GetAtt MyElastiCacheRedis.RedisEndpoint.Port
-            - Name: POSTGRES_HOST
-              Value: !GetAtt MyDBInstance.Endpoint.Address
-            - Name: POSTGRES_PORT
-              Value: !GetAtt MyDBInstance.Endpoint.Port
-            - Name: POSTGRES_DB
-              Value: !Ref DBName
-            - Name: POSTGRES_USER
-              Value: !Ref PostgresUser
-            - Name: POSTGRES_PASSWORD
-              Value: !Ref PostgresPassword
-          EnvironmentFiles:
-            - Value: !Sub "arn:aws:s3:::${EnvFilePath}"
-              Type: s3
+            - gunicorn
+            - !Ref DjangoServerApp
+            - --bind=0.0.0.0:5000
+            - !Sub "--worker-class=${DjangoGunicornWorkerClass}"
+            - --workers
+            - !If
+              - DeriveDjangoGunicornWorkers
+              - !Select [0, !FindInMap [DjangoGunicorn, !Ref DjangoTaskDefinitionCPUs, !Ref DjangoTaskDefinitionMemory]]
+              - !Ref DjangoGunicornWorkers
+            - --threads
+            - !If
+              - DeriveDjangoGunicornThreads
+              - !Select [1, !FindInMap [DjangoGunicorn, !Ref DjangoTaskDefinitionCPUs, !Ref DjangoTaskDefinitionMemory]]
+              - !Ref DjangoGunicornThreads
+            - --timeout
+            - !If
+              - DeriveDjangoGunicornTimeout
+              - !Select [2, !FindInMap [DjangoGunicorn, !Ref DjangoTaskDefinitionCPUs, !Ref DjangoTaskDefinitionMemory]]
+              - !Ref DjangoGunicornTimeout
+            - --max-requests
+            - !If
+              - DeriveDjangoGunicornMaxRequests
+              - !Select [3, !FindInMap [DjangoGunicorn, !Ref DjangoTaskDefinitionCPUs, !Ref DjangoTaskDefinitionMemory]]
+              - !Ref DjangoGunicornMaxRequests
+            - --max-requests-jitter
+            - !Select [4, !FindInMap [DjangoGunicorn, !Ref DjangoTaskDefinitionCPUs, !Ref DjangoTaskDefinitionMemory]]
+            - --access-logfile=-
+          # no container Cpu or Memory: django may use what the sidecars,
+          # eg the log router, do not reserve of the task's
           PortMappings:
             - ContainerPort: 5000
               HostPort: 5000
               Protocol: tcp
-          LogConfiguration:
-            logDriver: awslogs
-            options:
-              awslogs-group: !Sub "/ecs/${LogGroup}"
-              awslogs-region: !Ref "AWS::Region"
-              awslogs-stream-prefix: ecs
       Tags:
         - Key: app
           Value: !Ref AppTagValue
@@ -227,26 +609,33 @@ def get_resources() -> str:
     DependsOn:
       - DjangoAppEcsCluster
       - DjangoTaskDefinition
-      - SubnetA
-      - SubnetB
-      - SubnetC
+      - VpcEndpointsReady
       - DjangoSecurityGroup
       - DjangoTargetGroup
     Properties:
       Cluster: !Ref DjangoAppEcsCluster
       TaskDefinition: !Ref DjangoTaskDefinition
-      DesiredCount: 1
+      # no DesiredCount: DjangoScalableTarget owns the count. ECS starts one
+      # task, which the scalable target raises to DjangoMinCount, and a stack
+      # update leaves the scaled out count alone rather than reset it
       EnableExecuteCommand: true
-      LaunchType: FARGATE
+      # a failed deploy stops and, by default, rolls back on its own rather
+      # than retry the bad tasks indefinitely
+      DeploymentConfiguration:
+        MinimumHealthyPercent: !Ref DjangoDeploymentMinimumHealthyPercent
+        MaximumPercent: !Ref DjangoDeploymentMaximumPercent
+        DeploymentCircuitBreaker:
+          Enable: true
+          Rollback: !Ref DjangoDeploymentRollback
+      HealthCheckGracePeriodSeconds: !Ref DjangoHealthCheckGracePeriod
+      CapacityProviderStrategy:
+        - CapacityProvider: FARGATE
+          Base: !Ref DjangoFargateBase
+          Weight: !Ref DjangoFargateWeight
+        - CapacityProvider: FARGATE_SPOT
+          Weight: !Ref DjangoFargateSpotWeight
+      # see service_network_configuration
       NetworkConfiguration:
-        AwsvpcConfiguration:
-          AssignPublicIp: ENABLED
-          Subnets:
-            - !Ref SubnetA
-            - !Ref SubnetB
-            - !Ref SubnetC
-          SecurityGroups:
-            - !GetAtt DjangoSecurityGroup.GroupId
       LoadBalancers:
         - TargetGroupArn: !Ref DjangoTargetGroup
           ContainerName: "django"
@@ -254,7 +643,73 @@ def get_resources() -> str:
       Tags:
         - Key: app
           Value: !Ref AppTagValue
+
+  # uses the Application Auto Scaling service linked role, so no RoleARN.
+  # The service scales out on whichever of the two policies asks for more
+  # tasks, and only scales in once both allow it
+  DjangoScalableTarget:
+    Type: AWS::ApplicationAutoScaling::ScalableTarget
+    Properties:
+      ServiceNamespace: ecs
+      ScalableDimension: ecs:service:DesiredCount
+      ResourceId: !Sub "service/${DjangoAppEcsCluster}/${DjangoService.Name}"
+      MinCapacity: !Ref DjangoMinCount
+      MaxCapacity: !Ref DjangoMaxCount
+
+  DjangoRequestCountScalingPolicy:
+    Type: AWS::ApplicationAutoScaling::ScalingPolicy
+    # the target group must be behind the load balancer before its request
+    # count metric exists
+    DependsOn:
+      - DjangoHttpsListener
+    Properties:
+      PolicyName: django-request-count-per-target
+      PolicyType: TargetTrackingScaling
+      ScalingTargetId: !Ref DjangoScalableTarget
+      TargetTrackingScalingPolicyConfiguration:
+        TargetValue: !Ref DjangoTargetRequestsPerTask
+        ScaleOutCooldown: !Ref DjangoScaleOutCooldown
+        ScaleInCooldown: !Ref DjangoScaleInCooldown
+        PredefinedMetricSpecification:
+          PredefinedMetricType: ALBRequestCountPerTarget
+          ResourceLabel: !Join
+            - "/"
+            - - !GetAtt DjangoStackLoadBalancer.LoadBalancerFullName
+              - !GetAtt DjangoTargetGroup.TargetGroupFullName
+
+  DjangoCPUScalingPolicy:
+    Type: AWS::ApplicationAutoScaling::ScalingPolicy
+    Properties:
+      PolicyName: django-cpu-utilization
+      PolicyType: TargetTrackingScaling
+      ScalingTargetId: !Ref DjangoScalableTarget
+      TargetTrackingScalingPolicyConfiguration:
+        TargetValue: !Ref DjangoTargetCPUUtilization
+        ScaleOutCooldown: !Ref DjangoScaleOutCooldown
+        ScaleInCooldown: !Ref DjangoScaleInCooldown
+        PredefinedMetricSpecification:
+          PredefinedMetricType: ECSServiceAverageCPUUtilization
 """
+    )
+    containers = resources["DjangoTaskDefinition"]["Properties"]["ContainerDefinitions"]
+    django = containers[0]
+    containers[0] = app_container(django.pop("Name"), django.pop("Command"))
+    containers[0].update(django)
+    resources["DjangoService"]["Properties"][
+        "NetworkConfiguration"
+    ] = service_network_configuration()
+    pin_task_definition(resources["DjangoService"], "DjangoService")
+    add_pgbouncer(
+        resources["DjangoTaskDefinition"],
+        mapped_settings(
+            "DjangoTaskDefinitionCPUs",
+            "DjangoTaskDefinitionMemory",
+            "DjangoGunicornWorkers",
+            "DjangoGunicornThreads",
+        ),
+    )
+    configure_log_delivery(resources["DjangoTaskDefinition"], "Django")
+    return resources
 
 
 def get_outputs() -> str:
@@ -0,0 +1,215 @@
+"""
+An optional EFS file system which the Celery workers share as an on-disk
+cache of reference data, eg the genome annotations, so that each new worker
+task does not download them from S3 again.
+
+The workers mount it read-write at `MOUNT_PATH`, through an access point, and
+find the path in the REFERENCE_DATA_DIR environment variable. With
+ReferenceDataCache Disabled, none of this is created and the variable is not
+set.
+"""
+
+from collections.abc import MutableMapping
+
+from yeastregulatorydbstack.template import ref
+
+CONDITION = "ReferenceDataCacheEnabled"
+MOUNT_PATH = "/mnt/reference-data"
+VOLUME_NAME = "reference-data"
+# a resource which the services that mount the file system depend on, so
+# that their tasks start once the mount targets and the policy exist
+READY = "ReferenceDataReady"
+
+
+def get_parameters() -> str:
+    """
+    Return the parameters section of the EFS CloudFormation template.
+
+    :return: parameters section
+    :rtype: str
+    """
+    return """
+  ReferenceDataCache:
+    Type: String
+    Description: >-
+      Enabled mounts a shared EFS file system into the Celery workers at
+      /mnt/reference-data, as a cache of reference data.
+    Default: Disabled
+    AllowedValues:
+      - Enabled
+      - Disabled
+
+  ReferenceDataThroughputMode:
+    Type: String
+    Description: >-
+      The EFS throughput mode. elastic scales with use and bills per GiB
+      transferred. provisioned bills ReferenceDataProvisionedThroughput
+      whether it is used or not.
+    Default: elastic
+    AllowedValues:
+      - elastic
+      - provisioned
+
+  ReferenceDataProvisionedThroughput:
+    Type: Number
+    Description: The MiB/s of throughput with the provisioned throughput mode
+    Default: 64
+    MinValue: 1
+    MaxValue: 3414
+"""
+
+
+def get_conditions() -> str:
+    """
+    Return the conditions section of the EFS CloudFormation template.
+
+    :return: conditions section
+    :rtype: str
+    """
+    return f"""
+  {CONDITION}: !Equals [!Ref ReferenceDataCache, Enabled]
+  ProvisionedReferenceDataThroughput: !Equals [!Ref ReferenceDataThroughputMode, provisioned]
+"""
+
+
+def get_resources() -> str:
+    """
+    Return the resources section of the EFS CloudFormation template.
+
+    :return: resources section
+    :rtype: str
+    """
+    mount_targets = "".join(
+        f"""
+  ReferenceDataMountTarget{az}:
+    Type: AWS::EFS::MountTarget
+    Condition: {CONDITION}
+    Properties:
+      FileSystemId: !Ref ReferenceDataFileSystem
+      SubnetId: !Ref PrivateSubnet{az}
+      SecurityGroups:
+        - !GetAtt ReferenceDataSecurityGroup.GroupId
+"""
+        for az in "ABC"
+    )
+    return f"""
+  ReferenceDataFileSystem:
+    Type: AWS::EFS::FileSystem
+    Condition: {CONDITION}
+    Properties:
+      Encrypted: true
+      PerformanceMode: generalPurpose
+      ThroughputMode: !Ref ReferenceDataThroughputMode
+      ProvisionedThroughputInMibps: !If
+        - ProvisionedReferenceDataThroughput
+        - !Ref ReferenceDataProvisionedThroughput
+        - !Ref AWS::NoValue
+      # a cache, which can be rebuilt from S3
+      BackupPolicy:
+        Status: DISABLED
+      FileSystemTags:
+        - Key: app
+          Value: !Ref AppTagValue
+{mount_targets}
+  # every task writes as the same user, whatever user its image runs as, so
+  # files cached by one worker can be replaced by another
+  ReferenceDataAccessPoint:
+    Type: AWS::EFS::AccessPoint
+    Condition: {CONDITION}
+    Properties:
+      FileSystemId: !Ref ReferenceDataFileSystem
+      PosixUser:
+        Uid: "1000"
+        Gid: "1000"
+      RootDirectory:
+        Path: /reference-data
+        CreationInfo:
+          OwnerUid: "1000"
+          OwnerGid: "1000"
+          Permissions: "0755"
+      AccessPointTags:
+        - Key: app
+          Value: !Ref AppTagValue
+
+  ReferenceDataClientPolicy:
+    Type: AWS::IAM::Policy
+    Condition: {CONDITION}
+    Properties:
+      PolicyName: ReferenceDataClientPolicy
+      Roles:
+        - !Ref TaskRole
+      PolicyDocument:
+        Version: '2012-10-17'
+        Statement:
+          - Effect: Allow
+            Action:
+              - elasticfilesystem:ClientMount
+              - elasticfilesystem:ClientWrite
+            Resource: !GetAtt ReferenceDataFileSystem.Arn
+            Condition:
+              StringEquals:
+                elasticfilesystem:AccessPointArn: !GetAtt ReferenceDataAccessPoint.Arn
+
+  # DependsOn may not name a resource whose condition is false
+  {READY}:
+    Type: AWS::CloudFormation::WaitConditionHandle
+    Metadata:
+      MountTargetA: !If [{CONDITION}, !Ref ReferenceDataMountTargetA, ""]
+      MountTargetB: !If [{CONDITION}, !Ref ReferenceDataMountTargetB, ""]
+      MountTargetC: !If [{CONDITION}, !Ref ReferenceDataMountTargetC, ""]
+      ClientPolicy: !If [{CONDITION}, !Ref ReferenceDataClientPolicy, ""]
+"""
+
+
+def get_outputs() -> str:
+    """
+    Return the outputs section of the EFS CloudFormation template.
+
+    :return: outputs section
+    :rtype: str
+    """
+    return f"""
+  ReferenceDataFileSystemId:
+    Condition: {CONDITION}
+    Description: ID of the reference data EFS file system
+    Value: !Ref ReferenceDataFileSystem
+"""
+
+
+def _if_enabled(value) -> dict:
+    return {"Fn::If": [CONDITION, value, ref("AWS::NoValue")]}
+
+
+def mount_reference_data(task_definition: MutableMapping) -> None:
+    """
+    Mount the reference data file system into every container of a task
+    definition resource, when ReferenceDataCache is Enabled. A service which
+    runs the task definition should depend on `READY`.
+
+    :param task_definition: an AWS::ECS::TaskDefinition resource. It is
+      modified in place.
+    :type task_definition: MutableMapping
+    """
+    properties = task_definition["Properties"]
+    properties.setdefault("Volumes", []).append(
+        _if_enabled(
+            {
+                "Name": VOLUME_NAME,
+                "EFSVolumeConfiguration": {
+                    "FilesystemId": ref("ReferenceDataFileSystem"),
+                    "TransitEncryption": "ENABLED",
+                    "AuthorizationConfig": {
+                        "AccessPointId": ref("ReferenceDataAccessPoint"),
+                        "IAM": "ENABLED",
+                    },
+                },
+            }
+        )
+    )
+    for container in properties["ContainerDefinitions"]:
+        container.setdefault("MountPoints", []).append(
+            _if_enabled({"SourceVolume": VOLUME_NAME, "ContainerPath": MOUNT_PATH})
+        )
+        container["Environment"].append(
+            _if_enabled({"Name": "REFERENCE_DATA_DIR", "Value": MOUNT_PATH})
+        )
@@ -3,15 +3,51 @@ UpdateSecreteLambdaFunction and SecretUpdater function to update the DB
 secret with the RDS endpoint. This is necessary because the RDS instance
 endpoint is not known at the time the secret is created. This info is necessary
 to use the DBProxy
+
+QueueDepthFunction publishes the backlog of each Celery worker pool, which
+scales the pool, see celery.py. Its source is lambdas/queue_depth.py, inlined
+into the template.
 """
 
+import textwrap
+from pathlib import Path
+
+from yeastregulatorydbstack.resources.celery import queue_depth_pools
+
+QUEUE_DEPTH_SOURCE = Path(__file__).parent.parent / "lambdas" / "queue_depth.py"
+# the limit on the size of Code.ZipFile
+MAX_INLINE_SOURCE = 4096
+
+
+def inline_source(path: Path, indent: int = 10) -> str:
+    """
+    Read a Lambda function source, indented for a `ZipFile: |` block.
+
+    :param path: the python source
+    :type path: Path
+    :param indent: the number of spaces to indent each line by
+    :type indent: int
+
+    :return: the indented source
+    :rtype: str
+    :raises ValueError: if the source is too long to be inlined
+    """
+    source = path.read_text(encoding="utf-8")
+    if len(source) > MAX_INLINE_SOURCE:
+        raise ValueError(
+            f"{path} is {len(source)} characters. Inline Lambda sources "
+            f"are limited to {MAX_INLINE_SOURCE}."
+        )
+    return textwrap.indent(source, " " * indent)
+
 
 def get_parameters() -> str:
     return """"""
 
 
 def get_resources() -> str:
-    return """
+    return (
+        """
   LambdaExecutionRole:
     Type: AWS::IAM::Role
     Properties:
@@ -74,10 +110,93 @@ def get_resources() -> str:
     Properties:
       ServiceToken: !GetAtt UpdateSecretLambdaFunction.Arn
       SecretArn: !Ref MyDBSecret  # ARN of the secret you want to update
-      RDSEndpoint: !GetAtt MyDBInstance.Endpoint.Address  # Get the RDS instance endpoint
+      # the RDS instance or Aurora cluster writer endpoint
+      RDSEndpoint: !If
+        - UseAurora
+        - !GetAtt MyDBCluster.Endpoint.Address
+        - !GetAtt MyDBInstance.Endpoint.Address
     DependsOn:
-      - MyDBInstance
+      - DatabaseReady
+
+  QueueDepthFunctionRole:
+    Type: AWS::IAM::Role
+    Properties:
+      AssumeRolePolicyDocument:
+        Version: '2012-10-17'
+        Statement:
+          - Effect: Allow
+            Principal:
+              Service: lambda.amazonaws.com
+            Action: sts:AssumeRole
+      ManagedPolicyArns:
+        - arn:aws:iam::aws:policy/service-role/AWSLambdaVPCAccessExecutionRole
+      Policies:
+        - PolicyName: QueueDepthMetricsPolicy
+          PolicyDocument:
+            Version: '2012-10-17'
+            Statement:
+              - Effect: Allow
+                Action:
+                  - cloudwatch:PutMetricData
+                  - ecs:DescribeServices
+                Resource: '*'
+      Tags:
+        - Key: app
+          Value: !Ref AppTagValue
+
+  # runs in the private subnets to reach Redis, and reaches CloudWatch and
+  # ECS through the MonitoringVpcEndpoint and EcsVpcEndpoint
+  QueueDepthFunction:
+    Type: AWS::Lambda::Function
+    Properties:
+      Handler: index.handler
+      Role: !GetAtt QueueDepthFunctionRole.Arn
+      Runtime: python3.12
+      Timeout: 30
+      VpcConfig:
+        SubnetIds:
+          - !Ref PrivateSubnetA
+          - !Ref PrivateSubnetB
+          - !Ref PrivateSubnetC
+        SecurityGroupIds:
+          - !GetAtt DjangoSecurityGroup.GroupId
+      Environment:
+        Variables:
+          REDIS_HOST: !GetAtt MyElastiCacheRedis.RedisEndpoint.Address
+          REDIS_PORT: !GetAtt MyElastiCacheRedis.RedisEndpoint.Port
+          CLUSTER_NAME: !Ref DjangoAppEcsCluster
+          WORKER_POOLS: !Sub """
+        + queue_depth_pools()
+        + """
+          METRIC_NAMESPACE: !Sub "${AWS::StackName}/Celery"
+      Code:
+        ZipFile: |
+"""
+        + inline_source(QUEUE_DEPTH_SOURCE)
+        + """
+      Tags:
+        - Key: app
+          Value: !Ref AppTagValue
+
+  QueueDepthSchedule:
+    Type: AWS::Events::Rule
+    Properties:
+      Description: Publish the Celery backlog every minute
+      ScheduleExpression: rate(1 minute)
+      State: ENABLED
+      Targets:
+        - Arn: !GetAtt QueueDepthFunction.Arn
+          Id: QueueDepthFunction
+
+  QueueDepthSchedulePermission:
+    Type: AWS::Lambda::Permission
+    Properties:
+      Action: lambda:InvokeFunction
+      FunctionName: !Ref QueueDepthFunction
+      Principal: events.amazonaws.com
+      SourceArn: !GetAtt QueueDepthSchedule.Arn
 """
+    )
 
 
 def get_outputs() -> str:
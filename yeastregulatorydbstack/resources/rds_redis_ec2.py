@@ -5,13 +5,70 @@ named SubnetA, SubnetB, and SubnetC.
 
 NOTE: This requires a vpc_subnets_routetables_networkcon.py file with a vpc
 named MyVPC.
+
+The parameter group settings are derived from RdsInstanceType and
+PostgresWorkloadProfile, see yeastregulatorydbstack.postgres.
+
+ReadReplicaCount read replicas of MyDBInstance are created, each in the
+availability zone of its own private subnet, with the primary's instance
+class and parameter group. The app containers find them in
+POSTGRES_READ_HOST, for a Django database router: a name in a private hosted
+zone with a weighted record for each replica, so that every lookup picks
+one. Without replicas, POSTGRES_READ_HOST is POSTGRES_HOST. The reads go to
+the replicas directly, not through the RDS Proxy or PgBouncer.
+
+With DatabaseEngine aurora-postgresql-serverless, an Aurora cluster of
+Serverless v2 instances, which scale between AuroraMinCapacity and
+AuroraMaxCapacity ACUs, replaces MyDBInstance, its parameter group and its
+replicas. ReadReplicaCount then sets the number of Serverless v2 readers,
+behind the cluster's reader endpoint. Aurora sizes its memory settings by
+the ACUs, so the derived parameter group does not apply. The rest of the
+stack refers to whichever database exists through
+yeastregulatorydbstack.database.
 """
 
+from collections.abc import Mapping
+
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
+
+from yeastregulatorydbstack.database import (
+    AURORA_CONDITION,
+    INSTANCE_CONDITION,
+    READER_NAME,
+)
+from yeastregulatorydbstack.postgres import (
+    INSTANCE_CLASSES,
+    PROFILES,
+    parameter_group_parameters,
+    postgres_mapping,
+)
+from yeastregulatorydbstack.template import (
+    get_att,
+    load_fragment,
+    ref,
+    set_allowed_values,
+    sub,
+)
 
-def get_parameters() -> str:
+# a resource which the app task definitions depend on, see DatabaseReady
+DATABASE_READY = "DatabaseReady"
+# one in each private subnet
+MAX_READ_REPLICAS = 3
+DATABASE_ENGINES = ("postgres", "aurora-postgresql-serverless")
+# the AuroraMinCapacity and AuroraMaxCapacity ACUs. They are enumerated so
+# that the rules can check that the max is at least the min
+AURORA_CAPACITIES = (0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+# the DBProxyMaxConnectionsPercent and DBProxyMaxIdleConnectionsPercent
+# values, enumerated so that the rules can check that the idle percent is at
+# most the max
+DB_PROXY_PERCENTS = tuple(range(0, 101, 5))
+
+
+def get_parameters() -> Mapping:
     """Return the parameters section of the RDS/ElstiCache/EC2 CloudFormation
     template."""
-    return """
+    parameters = load_fragment(
+        """
 
   DBName:
     Type: String
@@ -51,26 +108,374 @@ def get_parameters() -> str:
     Type: String
     Description: The instance type for the ElastiCache Redis instance
     Default: cache.t2.micro
+
+  PostgresWorkloadProfile:
+    Type: String
+    Description: >-
+      The workload the parameter group is tuned for. oltp suits many short
+      web queries, analytical fewer connections running large joins.
+    Default: oltp
+
+  AppDatabaseEndpoint:
+    Type: String
+    Description: >-
+      How the app containers connect to PostgreSQL: through the RDS Proxy,
+      which pools the connections of every task, through a PgBouncer sidecar
+      in each task, or to the instance directly. The proxy is only created
+      for proxy.
+    Default: proxy
+    AllowedValues:
+      - proxy
+      - pgbouncer
+      - instance
+
+  ReadReplicaCount:
+    Type: String
+    Description: >-
+      The read replicas of the RDS instance, or the readers of the Aurora
+      cluster, each in its own availability zone. The app containers find
+      them in POSTGRES_READ_HOST.
+    Default: "0"
+
+  DatabaseEngine:
+    Type: String
+    Description: >-
+      postgres runs an RDS instance of RdsInstanceType. aurora-postgresql-serverless
+      runs an Aurora cluster of Serverless v2 instances, which scale with
+      the load between AuroraMinCapacity and AuroraMaxCapacity. Changing it
+      replaces the database, without its data.
+    Default: postgres
+
+  AuroraMinCapacity:
+    Type: Number
+    Description: >-
+      The fewest Aurora capacity units (ACUs) of each Serverless v2 instance.
+      An ACU is about 2 GiB of memory, with the CPU and network to match.
+    Default: 0.5
+
+  AuroraMaxCapacity:
+    Type: Number
+    Description: >-
+      The most ACUs of each Serverless v2 instance. At least
+      AuroraMinCapacity.
+    Default: 8
+
+  PgBouncerImage:
+    Type: String
+    Description: >-
+      The PgBouncer image of the sidecar with AppDatabaseEndpoint pgbouncer.
+      It is configured by environment variables, eg POOL_MODE. Use a
+      pinned, multi-architecture tag, so that the sidecar runs on ARM64 and
+      does not change under a running stack. Mirror it to ECR when the
+      services run in the private subnets.
+    Default: edoburu/pgbouncer:v1.23.1-p2
+
+  DBProxyMaxConnectionsPercent:
+    Type: Number
+    Description: >-
+      The percent of the instance's max_connections the proxy may open, a
+      multiple of 5
+    Default: 90
+
+  DBProxyMaxIdleConnectionsPercent:
+    Type: Number
+    Description: >-
+      The percent of the instance's max_connections the proxy keeps open
+      while idle, a multiple of 5. At most DBProxyMaxConnectionsPercent.
+    Default: 50
+
+  DBProxyConnectionBorrowTimeout:
+    Type: Number
+    Description: >-
+      The seconds a client waits for a pooled connection when every one is
+      in use, before its connection fails
+    Default: 120
+    MinValue: 0
+    MaxValue: 3600
+
+  DBProxyIdleClientTimeout:
+    Type: Number
+    Description: >-
+      The seconds a client connection may be idle before the proxy closes it.
+      0 keeps the RDS default of 1800.
+    Default: 0
+    MinValue: 0
+    MaxValue: 28800
+"""
+    )
+    # the parameter group settings are only known for these
+    set_allowed_values(parameters["RdsInstanceType"], INSTANCE_CLASSES)
+    set_allowed_values(parameters["PostgresWorkloadProfile"], PROFILES)
+    set_allowed_values(parameters["DatabaseEngine"], DATABASE_ENGINES)
+    set_allowed_values(parameters["AuroraMinCapacity"], AURORA_CAPACITIES)
+    # a Serverless v2 instance scales up to at least 1 ACU
+    set_allowed_values(parameters["AuroraMaxCapacity"], AURORA_CAPACITIES[1:])
+    # the proxy needs at least one connection
+    set_allowed_values(
+        parameters["DBProxyMaxConnectionsPercent"], DB_PROXY_PERCENTS[1:]
+    )
+    set_allowed_values(
+        parameters["DBProxyMaxIdleConnectionsPercent"], DB_PROXY_PERCENTS
+    )
+    set_allowed_values(
+        parameters["ReadReplicaCount"],
+        [str(count) for count in range(MAX_READ_REPLICAS + 1)],
+    )
+    return parameters
+
+
+def get_rules() -> CommentedMap:
+    """
+    Return the rules section of the RDS/ElastiCache/EC2 CloudFormation
+    template, which rejects an AuroraMaxCapacity below AuroraMinCapacity,
+    with one rule per AuroraMinCapacity value, and a
+    DBProxyMaxIdleConnectionsPercent above DBProxyMaxConnectionsPercent, with
+    one rule per DBProxyMaxConnectionsPercent value. Rules can not compare
+    numbers, so the allowed values are listed.
+
+    :return: rules section
+    :rtype: CommentedMap
+    """
+    rules = CommentedMap()
+    for index, minimum in enumerate(AURORA_CAPACITIES):
+        allowed = CommentedSeq(
+            str(capacity) for capacity in AURORA_CAPACITIES[max(index, 1) :]
+        )
+        allowed.fa.set_flow_style()
+        rules[f"AuroraMinCapacity{str(minimum).replace('.', '')}"] = {
+            "RuleCondition": {"Fn::Equals": [ref("AuroraMinCapacity"), str(minimum)]},
+            "Assertions": [
+                {
+                    "Assert": {"Fn::Contains": [allowed, ref("AuroraMaxCapacity")]},
+                    "AssertDescription": (
+                        f"With AuroraMinCapacity {minimum}, AuroraMaxCapacity "
+                        f"must be at least {minimum}"
+                    ),
+                }
+            ],
+        }
+    for maximum in DB_PROXY_PERCENTS[1:]:
+        allowed = CommentedSeq(
+            str(percent) for percent in DB_PROXY_PERCENTS if percent <= maximum
+        )
+        allowed.fa.set_flow_style()
+        rules[f"DBProxyMaxConnectionsPercent{maximum}"] = {
+            "RuleCondition": {
+                "Fn::Equals": [ref("DBProxyMaxConnectionsPercent"), str(maximum)]
+            },
+            "Assertions": [
+                {
+                    "Assert": {
+                        "Fn::Contains": [
+                            allowed,
+                            ref("DBProxyMaxIdleConnectionsPercent"),
+                        ]
+                    },
+                    "AssertDescription": (
+                        f"With DBProxyMaxConnectionsPercent {maximum}, "
+                        f"DBProxyMaxIdleConnectionsPercent must be at most "
+                        f"{maximum}"
+                    ),
+                }
+            ],
+        }
+    return rules
+
+
+def get_mappings() -> CommentedMap:
+    """
+    Return the mappings section of the RDS/ElastiCache/EC2 CloudFormation
+    template.
+
+    :return: the PostgresSettings mapping
+    :rtype: CommentedMap
+    """
+    return postgres_mapping()
+
+
+def read_replica_condition(index: int) -> dict:
+    """
+    Return the condition that the ReadReplicaCount is at least `index`.
+
+    :param index: the replica number, from 1
+    :type index: int
+    :rtype: dict
+    """
+    counts = [
+        {"Fn::Equals": [ref("ReadReplicaCount"), str(count)]}
+        for count in range(index, MAX_READ_REPLICAS + 1)
+    ]
+    # Fn::Or takes at least two conditions
+    return counts[0] if len(counts) == 1 else {"Fn::Or": counts}
+
+
+def get_conditions() -> Mapping:
+    """
+    Return the conditions section of the RDS/ElastiCache/EC2 CloudFormation
+    template.
+
+    :return: conditions section
+    :rtype: Mapping
+    """
+    conditions = load_fragment(
+        """
+  AppsUseDBProxy: !Equals [!Ref AppDatabaseEndpoint, proxy]
+  AppsUsePgBouncer: !Equals [!Ref AppDatabaseEndpoint, pgbouncer]
+  DefaultDBProxyIdleClientTimeout: !Equals [!Ref DBProxyIdleClientTimeout, "0"]
+  UseAurora: !Equals [!Ref DatabaseEngine, aurora-postgresql-serverless]
+  UseRdsInstance: !Not [!Condition UseAurora]
+"""
+    )
+    for index in range(1, MAX_READ_REPLICAS + 1):
+        conditions[f"HasReadReplica{index}"] = read_replica_condition(index)
+        for engine, condition in (
+            ("InstanceReadReplica", INSTANCE_CONDITION),
+            ("AuroraReader", AURORA_CONDITION),
+        ):
+            conditions[f"{engine}{index}"] = {
+                "Fn::And": [
+                    {"Condition": f"HasReadReplica{index}"},
+                    {"Condition": condition},
+                ]
+            }
+    return conditions
+
+
+def read_replica_resources() -> CommentedMap:
+    """
+    Return the read replicas, the private hosted zone and a weighted
+    POSTGRES_READ_HOST record for each replica.
+
+    :return: resources, by logical ID
+    :rtype: CommentedMap
+    """
+    resources = load_fragment(
+        """
+  DBPrivateHostedZone:
+    Type: AWS::Route53::HostedZone
+    Condition: InstanceReadReplica1
+    Properties:
+      Name: !Sub "${AWS::StackName}.internal"
+      HostedZoneConfig:
+        Comment: The database read replicas
+      VPCs:
+        - VPCId: !Ref MyVPC
+          VPCRegion: !Ref AWS::Region
+      HostedZoneTags:
+        - Key: app
+          Value: !Ref AppTagValue
+"""
+    )
+    for index, subnet in enumerate("ABC"[:MAX_READ_REPLICAS], start=1):
+        condition = f"InstanceReadReplica{index}"
+        # the subnet group, storage, engine and credentials are the primary's
+        resources[f"MyDBReadReplica{index}"] = {
+            "Type": "AWS::RDS::DBInstance",
+            "Condition": condition,
+            "Properties": {
+                "SourceDBInstanceIdentifier": ref("MyDBInstance"),
+                "DBInstanceClass": ref("RdsInstanceType"),
+                "AvailabilityZone": get_att(
+                    f"PrivateSubnet{subnet}", "AvailabilityZone"
+                ),
+                "VPCSecurityGroups": [ref("MyDBSecurityGroup")],
+                "DBParameterGroupName": ref("MyCustomParameterGroup"),
+                "Tags": [{"Key": "app", "Value": ref("AppTagValue")}],
+            },
+        }
+        # a short TTL, so that the app spreads its connections over the
+        # replicas as it reconnects
+        resources[f"MyDBReaderRecord{index}"] = {
+            "Type": "AWS::Route53::RecordSet",
+            "Condition": condition,
+            "Properties": {
+                "HostedZoneId": ref("DBPrivateHostedZone"),
+                "Name": sub(READER_NAME),
+                "Type": "CNAME",
+                "TTL": "10",
+                "SetIdentifier": f"replica-{index}",
+                "Weight": 1,
+                "ResourceRecords": [
+                    get_att(f"MyDBReadReplica{index}", "Endpoint.Address")
+                ],
+            },
+        }
+    return resources
+
+
+def aurora_resources() -> CommentedMap:
+    """
+    Return the Aurora cluster, its Serverless v2 writer and a Serverless v2
+    reader for each read replica, which replace MyDBInstance with
+    DatabaseEngine aurora-postgresql-serverless.
+
+    :return: resources, by logical ID
+    :rtype: CommentedMap
+    """
+    resources = load_fragment(
+        f"""
+  MyDBCluster:
+    Type: AWS::RDS::DBCluster
+    Condition: {AURORA_CONDITION}
+    Properties:
+      DatabaseName: !Ref DBName
+      Engine: aurora-postgresql
+      EngineVersion: !Ref PostgresVersion
+      MasterUsername: !Ref PostgresUser
+      MasterUserPassword: !Ref PostgresPassword
+      BackupRetentionPeriod: 3
+      DBSubnetGroupName: !Ref MyDBSubnetGroup
+      VpcSecurityGroupIds:
+        - !Ref MyDBSecurityGroup
+      ServerlessV2ScalingConfiguration:
+        MinCapacity: !Ref AuroraMinCapacity
+        MaxCapacity: !Ref AuroraMaxCapacity
+      Tags:
+        - Key: app
+          Value: !Ref AppTagValue
 """
+    )
+    instances = {"MyDBClusterWriter": (AURORA_CONDITION, None)}
+    for index, subnet in enumerate("ABC"[:MAX_READ_REPLICAS], start=1):
+        instances[f"MyDBClusterReader{index}"] = (f"AuroraReader{index}", subnet)
+    for logical_id, (condition, subnet) in instances.items():
+        properties = {
+            "DBClusterIdentifier": ref("MyDBCluster"),
+            "DBInstanceClass": "db.serverless",
+            "Engine": "aurora-postgresql",
+        }
+        if subnet is not None:
+            properties["AvailabilityZone"] = get_att(
+                f"PrivateSubnet{subnet}", "AvailabilityZone"
+            )
+        properties["Tags"] = [{"Key": "app", "Value": ref("AppTagValue")}]
+        resources[logical_id] = {
+            "Type": "AWS::RDS::DBInstance",
+            "Condition": condition,
+            "Properties": properties,
+        }
+    return resources
 
 
-def get_resources() -> str:
-    """return a string of resources for the rds, redis, and ec2 instances."""
+def get_resources() -> Mapping:
+    """return the resources for the rds, redis, and ec2 instances."""
     resources_list = [
         """
   MyCustomParameterGroup:
     Type: AWS::RDS::DBParameterGroup
+    Condition: UseRdsInstance
     Properties:
       Description: Custom parameter group for my DB
       Family: !Ref PostgresVersionFamily
+      # added by get_resources
       Parameters:
-        max_connections: "200"
       Tags:
         - Key: app
           Value: !Ref AppTagValue
 
   MyDBProxyRole:
     Type: AWS::IAM::Role
+    Condition: AppsUseDBProxy
     Properties:
       AssumeRolePolicyDocument:
         Version: "2012-10-17"
@@ -95,7 +500,6 @@ def get_resources() -> str:
 
   MyDBSecret:
     Type: AWS::SecretsManager::Secret
-    DependsOn: MyDBInstance
     Properties:
       Name: MyDBSecret
       Description: RDS database credentials
@@ -106,6 +510,7 @@ def get_resources() -> str:
 
   MyDBProxy:
     Type: AWS::RDS::DBProxy
+    Condition: AppsUseDBProxy
     DependsOn:
       - MyDBProxyRole
       - MyDBSecret
@@ -124,10 +529,44 @@ def get_resources() -> str:
         - !Ref SubnetB
         - !Ref SubnetC
       RequireTLS: false
+      IdleClientTimeout: !If
+        - DefaultDBProxyIdleClientTimeout
+        - !Ref AWS::NoValue
+        - !Ref DBProxyIdleClientTimeout
       Tags:
         - Key: app
           Value: !Ref AppTagValue
 
+  # the proxy has no database to connect to without a target group
+  MyDBProxyTargetGroup:
+    Type: AWS::RDS::DBProxyTargetGroup
+    Condition: AppsUseDBProxy
+    Properties:
+      DBProxyName: !Ref MyDBProxy
+      TargetGroupName: default
+      DBInstanceIdentifiers: !If
+        - UseRdsInstance
+        - [!Ref MyDBInstance]
+        - !Ref AWS::NoValue
+      DBClusterIdentifiers: !If
+        - UseAurora
+        - [!Ref MyDBCluster]
+        - !Ref AWS::NoValue
+      ConnectionPoolConfigurationInfo:
+        MaxConnectionsPercent: !Ref DBProxyMaxConnectionsPercent
+        MaxIdleConnectionsPercent: !Ref DBProxyMaxIdleConnectionsPercent
+        ConnectionBorrowTimeout: !Ref DBProxyConnectionBorrowTimeout
+
+  # the app task definitions depend on this rather than on the instance or
+  # the proxy, since DependsOn may not name a resource whose condition is
+  # false
+  DatabaseReady:
+    Type: AWS::CloudFormation::WaitConditionHandle
+    Metadata:
+      Instance: !If [UseRdsInstance, !Ref MyDBInstance, ""]
+      ClusterWriter: !If [UseAurora, !Ref MyDBClusterWriter, ""]
+      ProxyTargetGroup: !If [AppsUseDBProxy, !Ref MyDBProxyTargetGroup, ""]
+
   MyDBSubnetGroup:
     Type: AWS::RDS::DBSubnetGroup
     Properties:
@@ -139,6 +578,7 @@ def get_resources() -> str:
 
   MyDBInstance:
     Type: AWS::RDS::DBInstance
+    Condition: UseRdsInstance
     Properties:
       DBName: !Ref DBName
       AllocatedStorage: !Ref RdsAllocatedStorage
@@ -188,24 +628,60 @@ def get_resources() -> str:
     """,
     ]
 
-    return "\n".join(resources_list)
+    resources = load_fragment("\n".join(resources_list))
+    resources["MyCustomParameterGroup"]["Properties"][
+        "Parameters"
+    ] = parameter_group_parameters()
+    resources.update(read_replica_resources())
+    resources.update(aurora_resources())
+    metadata = resources[DATABASE_READY]["Metadata"]
+    for index in range(1, MAX_READ_REPLICAS + 1):
+        metadata[f"ReaderRecord{index}"] = {
+            "Fn::If": [
+                f"InstanceReadReplica{index}",
+                ref(f"MyDBReaderRecord{index}"),
+                "",
+            ]
+        }
+        metadata[f"ClusterReader{index}"] = {
+            "Fn::If": [
+                f"AuroraReader{index}",
+                ref(f"MyDBClusterReader{index}"),
+                "",
+            ]
+        }
+    return resources
 
 
-def get_outputs():
+def get_outputs() -> Mapping:
     """
     Return the outputs section of the RDS/ElstiCache/EC2
     CloudFormation template.
     """
-    return """
+    return load_fragment(
+        """
   RDSInstanceEndpoint:
-    Description: Endpoint of the RDS instance
-    Value: !GetAtt MyDBInstance.Endpoint.Address
+    Description: Endpoint of the RDS instance, or the Aurora cluster writer
+    Value: !If
+      - UseAurora
+      - !GetAtt MyDBCluster.Endpoint.Address
+      - !GetAtt MyDBInstance.Endpoint.Address
 
   RDSProxyEndpoint:
+    Condition: AppsUseDBProxy
     Description: Endpoint of the RDS Proxy
     Value: !GetAtt MyDBProxy.Endpoint
 
+  RDSReaderEndpoint:
+    Condition: HasReadReplica1
+    Description: The name which resolves to a read replica or Aurora reader
+    Value: !If
+      - UseAurora
+      - !GetAtt MyDBCluster.ReadEndpoint.Address
+      - !Sub "reader.${AWS::StackName}.internal"
+
   RedisEndpoint:
     Description: Endpoint of the Redis ElastiCache instance
     Value: !GetAtt MyElastiCacheRedis.RedisEndpoint.Address
 """
+    )
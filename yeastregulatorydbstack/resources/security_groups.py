@@ -142,6 +142,72 @@ def get_resources() -> str:
         Tags:
           - Key: app
             Value: !Ref AppTagValue
+
+  # the load balancer forwards to gunicorn and Flower on their own ports
+  DjangoIngressFromLoadBalancer:
+    Type: AWS::EC2::SecurityGroupIngress
+    Properties:
+      GroupId: !GetAtt DjangoSecurityGroup.GroupId
+      IpProtocol: tcp
+      FromPort: 5000
+      ToPort: 5000
+      SourceSecurityGroupId: !GetAtt DjangoStackLoadBalancerSecurityGroup.GroupId
+
+  FlowerIngressFromLoadBalancer:
+    Type: AWS::EC2::SecurityGroupIngress
+    Properties:
+      GroupId: !GetAtt DjangoSecurityGroup.GroupId
+      IpProtocol: tcp
+      FromPort: !Ref CeleryFlowerPort
+      ToPort: !Ref CeleryFlowerPort
+      SourceSecurityGroupId: !GetAtt DjangoStackLoadBalancerSecurityGroup.GroupId
+
+  # the RDS Proxy shares MyDBSecurityGroup with the instance it connects to
+  DBProxyIngressToInstance:
+    Type: AWS::EC2::SecurityGroupIngress
+    Condition: AppsUseDBProxy
+    Properties:
+      GroupId: !GetAtt MyDBSecurityGroup.GroupId
+      IpProtocol: tcp
+      FromPort: 5432
+      ToPort: 5432
+      SourceSecurityGroupId: !GetAtt MyDBSecurityGroup.GroupId
+
+  # NFS from the tasks to the reference data EFS mount targets
+  ReferenceDataSecurityGroup:
+    Type: AWS::EC2::SecurityGroup
+    Condition: ReferenceDataCacheEnabled
+    DependsOn:
+      - MyVPC
+      - DjangoSecurityGroup
+    Properties:
+      GroupDescription: Allow NFS to the reference data EFS file system
+      VpcId: !Ref MyVPC
+      SecurityGroupIngress:
+        - IpProtocol: tcp
+          FromPort: 2049
+          ToPort: 2049
+          SourceSecurityGroupId: !Ref DjangoSecurityGroup
+      Tags:
+        - Key: app
+          Value: !Ref AppTagValue
+
+  VpcEndpointSecurityGroup:
+    Type: AWS::EC2::SecurityGroup
+    DependsOn:
+      - MyVPC
+      - DjangoSecurityGroup
+    Properties:
+      GroupDescription: Allow HTTPS to the interface VPC endpoints
+      VpcId: !Ref MyVPC
+      SecurityGroupIngress:
+        - IpProtocol: tcp
+          FromPort: 443
+          ToPort: 443
+          SourceSecurityGroupId: !Ref DjangoSecurityGroup
+      Tags:
+        - Key: app
+          Value: !Ref AppTagValue
 """
 
 
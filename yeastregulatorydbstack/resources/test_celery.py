@@ -0,0 +1,92 @@
+import pytest
+
+from yeastregulatorydbstack.create_template import build_template
+from yeastregulatorydbstack.template import to_plain
+
+from .celery import WORKER_POOLS, WorkerPool, queue_depth_pools, validate_pools
+
+POOL = WorkerPool(
+    name="Short",
+    queues=("celery",),
+    concurrency=4,
+    prefetch_multiplier=4,
+    cpu=512,
+    memory=1024,
+    min_count=1,
+    max_count=4,
+    target_backlog_per_task=10,
+)
+
+
+def test_validate_pools():
+    validate_pools([POOL, POOL._replace(name="Long", queues=("long",))])
+    with pytest.raises(ValueError, match="consumed by another pool"):
+        validate_pools([POOL, POOL._replace(name="Long")])
+    with pytest.raises(ValueError, match="repeated"):
+        validate_pools([POOL, POOL._replace(queues=("long",))])
+    with pytest.raises(ValueError, match="Fargate does not support"):
+        validate_pools([POOL._replace(memory=8192)])
+    with pytest.raises(ValueError, match="needs 24 GiB of ephemeral storage"):
+        validate_pools([POOL._replace(working_set=19.5)])
+    with pytest.raises(ValueError, match="does not support 201 GiB"):
+        validate_pools([POOL._replace(working_set=190, ephemeral_storage=201)])
+    with pytest.raises(ValueError, match="min_count"):
+        validate_pools([POOL._replace(min_count=5)])
+
+
+def test_every_pool_gets_a_scaled_service():
+    template = build_template()
+    for pool in WORKER_POOLS:
+        prefix = f"CeleryWorker{pool.name}"
+        command = to_plain(
+            template.resources[f"{prefix}TaskDefinition"]["Properties"][
+                "ContainerDefinitions"
+            ][0]["Command"]
+        )
+        assert f"--queues={','.join(pool.queues)}" in command
+        assert template.parameters[f"{prefix}MaxCount"]["Default"] == pool.max_count
+        policy = to_plain(template.resources[f"{prefix}BacklogScalingPolicy"])
+        assert policy["Properties"]["ScalingTargetId"] == {
+            "Ref": f"{prefix}ScalableTarget"
+        }
+        assert f"${{{prefix}Service.Name}}" in queue_depth_pools()
+        # a stack update must not cut the scaled out workers back
+        assert (
+            "DesiredCount" not in template.resources[f"{prefix}Service"]["Properties"]
+        )
+
+
+def test_worker_storage():
+    template = build_template()
+    for pool in WORKER_POOLS:
+        properties = template.resources[f"CeleryWorker{pool.name}TaskDefinition"][
+            "Properties"
+        ]
+        if pool.ephemeral_storage == 20:
+            assert "EphemeralStorage" not in properties
+        else:
+            assert properties["EphemeralStorage"] == {
+                "SizeInGiB": pool.ephemeral_storage
+            }
+        mounts = properties["ContainerDefinitions"][0]["MountPoints"]
+        for name in pool.scratch_volumes:
+            assert {"Name": name} in properties["Volumes"]
+            assert {"SourceVolume": name, "ContainerPath": f"/scratch/{name}"} in mounts
+
+
+def test_every_service_can_be_pinned_to_a_task_definition():
+    template = to_plain(build_template().to_mapping())
+    services = [
+        logical_id
+        for logical_id, resource in template["Resources"].items()
+        if resource["Type"] == "AWS::ECS::Service"
+    ]
+    assert "FlowerService" in services and "DjangoService" in services
+    for service in services:
+        parameter = f"{service}TaskDefinitionArn"
+        assert template["Parameters"][parameter]["Default"] == ""
+        condition, pinned, _ = template["Resources"][service]["Properties"][
+            "TaskDefinition"
+        ]["Fn::If"]
+        assert condition in template["Conditions"]
+        assert pinned == {"Ref": parameter}
@@ -0,0 +1,79 @@
+from yeastregulatorydbstack.template import Template, to_plain
+
+from .ecs_fargate import (
+    HEALTH_CHECK_INTERVALS,
+    HEALTH_CHECK_TIMEOUTS,
+    get_parameters,
+    get_resources,
+    get_rules,
+)
+
+
+def test_django_rollouts_are_tuned_by_parameters():
+    template = Template()
+    template.add_parameters(get_parameters())
+    template.add_resources(get_resources())
+    service = to_plain(template.resources["DjangoService"])["Properties"]
+    assert service["DeploymentConfiguration"]["DeploymentCircuitBreaker"] == {
+        "Enable": True,
+        "Rollback": {"Ref": "DjangoDeploymentRollback"},
+    }
+    target_group = to_plain(template.resources["DjangoTargetGroup"])["Properties"]
+    attributes = {a["Key"]: a["Value"] for a in target_group["TargetGroupAttributes"]}
+    assert attributes["deregistration_delay.timeout_seconds"] == {
+        "Ref": "DjangoDeregistrationDelay"
+    }
+    # the defaults take a new task into service within half a minute
+    parameters = template.parameters
+    assert (
+        parameters["DjangoHealthCheckInterval"]["Default"]
+        * parameters["DjangoHealthyThreshold"]["Default"]
+        <= 30
+    )
+    assert (
+        parameters["DjangoHealthCheckTimeout"]["Default"]
+        < parameters["DjangoHealthCheckInterval"]["Default"]
+    )
+
+
+def test_stack_updates_leave_the_scaled_count_alone():
+    resources = Template()
+    resources.add_resources(get_resources())
+    assert "DesiredCount" not in resources.resources["DjangoService"]["Properties"]
+    assert resources.resources["DjangoScalableTarget"]["Properties"]["MinCapacity"]
+
+
+def _passes(rules, values):
+    # evaluate the Equals conditions and Contains assertions of the rules
+    def evaluate(item):
+        ((function, arguments),) = item.items()
+        if function == "Fn::Not":
+            return not evaluate(arguments[0])
+        if function == "Fn::Equals":
+            return values[arguments[0]["Ref"]] == arguments[1]
+        assert function == "Fn::Contains"
+        return values[arguments[1]["Ref"]] in arguments[0]
+
+    return all(
+        evaluate(assertion["Assert"])
+        for rule in to_plain(rules).values()
+        if "RuleCondition" not in rule or evaluate(rule["RuleCondition"])
+        for assertion in rule["Assertions"]
+    )
+
+
+def test_health_check_timeout_and_slow_start_rules():
+    rules = get_rules()
+    values = {"DjangoTaskDefinitionCPUs": "256", "DjangoTaskDefinitionMemory": "512"}
+    values.update(DjangoLogDelivery="blocking", DjangoSlowStart="30")
+    for interval in HEALTH_CHECK_INTERVALS:
+        for timeout in HEALTH_CHECK_TIMEOUTS:
+            values.update(
+                DjangoHealthCheckInterval=str(interval),
+                DjangoHealthCheckTimeout=str(timeout),
+            )
+            assert _passes(rules, values) is (timeout < interval)
+    values.update(DjangoHealthCheckInterval="10", DjangoHealthCheckTimeout="5")
+    for slow_start, allowed in [("0", True), ("1", False), ("29", False), ("30", True)]:
+        values["DjangoSlowStart"] = slow_start
+        assert _passes(rules, values) is allowed
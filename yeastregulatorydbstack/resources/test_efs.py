@@ -0,0 +1,31 @@
+from yeastregulatorydbstack.create_template import build_template
+from yeastregulatorydbstack.template import Template, to_plain
+
+from .celery import WORKER_POOLS
+from .efs import CONDITION, READY, get_resources
+
+
+def test_file_system_only_exists_when_enabled():
+    resources = Template()
+    resources.add_resources(get_resources())
+    for logical_id, resource in resources.resources.items():
+        assert logical_id == READY or resource["Condition"] == CONDITION
+
+
+def test_workers_mount_the_reference_data():
+    template = build_template()
+    assert template.resources["ReferenceDataSecurityGroup"]["Condition"] == CONDITION
+    for pool in WORKER_POOLS:
+        prefix = f"CeleryWorker{pool.name}"
+        properties = to_plain(template.resources[f"{prefix}TaskDefinition"])[
+            "Properties"
+        ]
+        (volume,) = [v["Fn::If"] for v in properties["Volumes"] if "Fn::If" in v]
+        assert volume[0] == CONDITION
+        assert volume[1]["EFSVolumeConfiguration"]["AuthorizationConfig"] == {
+            "AccessPointId": {"Ref": "ReferenceDataAccessPoint"},
+            "IAM": "ENABLED",
+        }
+        assert "MountPoints" in properties["ContainerDefinitions"][0]
+        assert READY in template.resources[f"{prefix}Service"]["DependsOn"]
+    assert "Volumes" not in template.resources["DjangoTaskDefinition"]["Properties"]
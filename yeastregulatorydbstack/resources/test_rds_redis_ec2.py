@@ -0,0 +1,155 @@
+from yeastregulatorydbstack.create_template import build_template
+from yeastregulatorydbstack.template import to_plain
+
+from .rds_redis_ec2 import (
+    AURORA_CAPACITIES,
+    DATABASE_READY,
+    MAX_READ_REPLICAS,
+    get_rules,
+    read_replica_condition,
+)
+
+
+def test_proxy_targets_the_instance():
+    template = build_template()
+    target_group = to_plain(template.resources["MyDBProxyTargetGroup"])
+    assert target_group["Properties"]["DBProxyName"] == {"Ref": "MyDBProxy"}
+    assert target_group["Properties"]["DBInstanceIdentifiers"]["Fn::If"][1] == [
+        {"Ref": "MyDBInstance"}
+    ]
+    assert target_group["Properties"]["DBClusterIdentifiers"]["Fn::If"][1] == [
+        {"Ref": "MyDBCluster"}
+    ]
+    assert set(target_group["Properties"]["ConnectionPoolConfigurationInfo"]) == {
+        "MaxConnectionsPercent",
+        "MaxIdleConnectionsPercent",
+        "ConnectionBorrowTimeout",
+    }
+    # DependsOn may not name the proxy, which only exists for proxy
+    for logical_id in ("MyDBProxy", "MyDBProxyTargetGroup"):
+        assert template.resources[logical_id]["Condition"] == "AppsUseDBProxy"
+
+
+def test_app_containers_connect_through_the_proxy():
+    template = build_template()
+    for logical_id, resource in template.resources.items():
+        if resource["Type"] != "AWS::ECS::TaskDefinition":
+            continue
+        assert DATABASE_READY in resource["DependsOn"], logical_id
+        for container in to_plain(resource["Properties"]["ContainerDefinitions"]):
+            environment = {
+                variable["Name"]: variable["Value"]
+                for variable in container.get("Environment", [])
+                if "Name" in variable
+            }
+            if "POSTGRES_HOST" in environment:
+                pgbouncer, _, proxy = environment["POSTGRES_HOST"]["Fn::If"]
+                assert pgbouncer == "AppsUsePgBouncer"
+                assert proxy["Fn::If"][:2] == [
+                    "AppsUseDBProxy",
+                    {"Fn::GetAtt": ["MyDBProxy", "Endpoint"]},
+                ]
+
+
+def test_read_replica_conditions():
+    assert to_plain(read_replica_condition(MAX_READ_REPLICAS)) == {
+        "Fn::Equals": [{"Ref": "ReadReplicaCount"}, str(MAX_READ_REPLICAS)]
+    }
+    counts = to_plain(read_replica_condition(1))["Fn::Or"]
+    assert [equals["Fn::Equals"][1] for equals in counts] == ["1", "2", "3"]
+
+
+def test_read_replicas_share_a_weighted_reader_name():
+    template = build_template()
+    assert list(template.parameters["ReadReplicaCount"]["AllowedValues"]) == [
+        "0",
+        "1",
+        "2",
+        "3",
+    ]
+    zones = set()
+    for index in range(1, MAX_READ_REPLICAS + 1):
+        replica = to_plain(template.resources[f"MyDBReadReplica{index}"])
+        assert replica["Condition"] == f"InstanceReadReplica{index}"
+        assert replica["Properties"]["SourceDBInstanceIdentifier"] == {
+            "Ref": "MyDBInstance"
+        }
+        zones.add(replica["Properties"]["AvailabilityZone"]["Fn::GetAtt"][0])
+        record = to_plain(template.resources[f"MyDBReaderRecord{index}"])
+        assert record["Properties"]["Weight"] == 1
+        assert record["Properties"]["Name"] == {
+            "Fn::Sub": "reader.${AWS::StackName}.internal"
+        }
+        assert f"ReaderRecord{index}" in template.resources[DATABASE_READY]["Metadata"]
+    assert len(zones) == MAX_READ_REPLICAS
+
+    django = to_plain(
+        template.resources["DjangoTaskDefinition"]["Properties"][
+            "ContainerDefinitions"
+        ][0]
+    )
+    environment = {
+        variable["Name"]: variable["Value"]
+        for variable in django["Environment"]
+        if "Name" in variable
+    }
+    aurora, _, instance = environment["POSTGRES_READ_HOST"]["Fn::If"]
+    assert aurora == "UseAurora"
+    assert instance["Fn::If"][0] == "InstanceReadReplica1"
+    assert "POSTGRES_READ_PORT" in environment
+
+
+def test_aurora_replaces_the_instance():
+    template = build_template()
+    assert template.resources["MyDBCluster"]["Condition"] == "UseAurora"
+    for logical_id in ("MyDBInstance", "MyCustomParameterGroup"):
+        assert template.resources[logical_id]["Condition"] == "UseRdsInstance"
+    for index in range(1, MAX_READ_REPLICAS + 1):
+        reader = to_plain(template.resources[f"MyDBClusterReader{index}"])
+        assert reader["Condition"] == f"AuroraReader{index}"
+        assert reader["Properties"]["DBInstanceClass"] == "db.serverless"
+    scaling = to_plain(template.resources["MyDBCluster"])["Properties"][
+        "ServerlessV2ScalingConfiguration"
+    ]
+    assert scaling == {
+        "MinCapacity": {"Ref": "AuroraMinCapacity"},
+        "MaxCapacity": {"Ref": "AuroraMaxCapacity"},
+    }
+    # nothing outside the database resources names the instance unconditionally
+    for logical_id, resource in template.resources.items():
+        assert "MyDBInstance" not in resource.get("DependsOn", []), logical_id
+
+
+def test_aurora_max_capacity_is_at_least_the_min():
+    rules = to_plain(get_rules())
+    allowed_max = build_template().parameters["AuroraMaxCapacity"]["AllowedValues"]
+    for minimum in AURORA_CAPACITIES:
+        (rule,) = [
+            rule
+            for rule in rules.values()
+            if rule["RuleCondition"]["Fn::Equals"][1] == str(minimum)
+        ]
+        (assertion,) = rule["Assertions"]
+        accepted = assertion["Assert"]["Fn::Contains"][0]
+        assert accepted == [str(m) for m in allowed_max if m >= minimum]
+
+
+def test_db_proxy_idle_connections_are_at_most_the_max():
+    rules = to_plain(get_rules())
+    parameters = build_template().parameters
+    allowed_idle = parameters["DBProxyMaxIdleConnectionsPercent"]["AllowedValues"]
+    for maximum in parameters["DBProxyMaxConnectionsPercent"]["AllowedValues"]:
+        rule = rules[f"DBProxyMaxConnectionsPercent{maximum}"]
+        assert rule["RuleCondition"]["Fn::Equals"][1] == str(maximum)
+        (assertion,) = rule["Assertions"]
+        accepted = assertion["Assert"]["Fn::Contains"][0]
+        assert accepted == [str(p) for p in allowed_idle if p <= maximum]
+
+
+def test_conditions_compare_parameters_to_strings():
+    # CloudFormation compares the values of Fn::Equals as strings
+    for condition in to_plain(build_template().conditions).values():
+        if "Fn::Equals" in condition:
+            assert all(
+                isinstance(value, (str, dict)) for value in condition["Fn::Equals"]
+            )
@@ -0,0 +1,55 @@
+from yeastregulatorydbstack.create_template import build_template
+from yeastregulatorydbstack.template import to_plain
+
+from .vpc_subnets_routetables_networkcon import (
+    ENDPOINTS_READY,
+    INTERFACE_ENDPOINTS,
+    PRIVATE_SERVICES_CONDITION,
+    service_network_configuration,
+)
+
+
+def test_private_only_endpoints_are_conditional():
+    template = build_template()
+    ready = to_plain(template.resources[ENDPOINTS_READY]["Metadata"])
+    for endpoint in INTERFACE_ENDPOINTS:
+        logical_id = f"{endpoint.name}VpcEndpoint"
+        resource = template.resources[logical_id]
+        assert (resource.get("Condition") == PRIVATE_SERVICES_CONDITION) is (
+            endpoint.private_services_only
+        )
+        assert logical_id in ready
+    assert template.resources["S3VpcEndpoint"]["Properties"]["VpcEndpointType"] == (
+        "Gateway"
+    )
+    # ECS Exec, on every service, reaches SSM through an endpoint in private mode
+    assert "ssmmessages" in {endpoint.service for endpoint in INTERFACE_ENDPOINTS}
+
+
+def test_every_service_follows_the_service_subnets_parameter():
+    template = build_template()
+    services = {
+        logical_id: resource
+        for logical_id, resource in template.resources.items()
+        if resource["Type"] == "AWS::ECS::Service"
+    }
+    assert "DjangoService" in services and "FlowerService" in services
+    for resource in services.values():
+        assert ENDPOINTS_READY in resource["DependsOn"]
+        assert to_plain(resource["Properties"]["NetworkConfiguration"]) == (
+            to_plain(service_network_configuration())
+        )
+
+
+def test_subnets_are_in_the_zones_of_the_stack_region():
+    template = build_template()
+    for subnet in ("Subnet", "PrivateSubnet"):
+        zones = [
+            to_plain(template.resources[f"{subnet}{letter}"]["Properties"])[
+                "AvailabilityZone"
+            ]
+            for letter in "ABC"
+        ]
+        assert zones == [
+            {"Fn::Select": [index, {"Fn::GetAZs": ""}]} for index in range(3)
+        ]
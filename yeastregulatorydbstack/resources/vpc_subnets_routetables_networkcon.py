@@ -1,8 +1,53 @@
 """
 Construct the VPC and associated component CloudFormation parameters,
-resources, and outputs. Note that this is hardcoded for region US-east-2
+resources, and outputs. The public and private subnets are in the first three
+availability zones of the stack's region, so the template deploys to any
+region with at least three.
+
+The ECS services run in the public subnets, or with ServiceSubnets Private in
+the private subnets, which have no route to the internet. The services then
+reach ECR, S3, CloudWatch Logs, Secrets Manager and SSM messages through the
+VPC endpoints in `INTERFACE_ENDPOINTS` and the S3 gateway endpoint, so image
+pulls and S3 reads stay inside the AWS network.
 """
 
+from collections.abc import Mapping
+from typing import NamedTuple
+
+from ruamel.yaml.comments import CommentedMap
+
+from yeastregulatorydbstack.template import get_att, load_fragment, ref, sub
+
+# the condition which puts the ECS services in the private subnets
+PRIVATE_SERVICES_CONDITION = "ServicesInPrivateSubnets"
+# a resource which the ECS services depend on, so that they start once the
+# endpoints they need exist
+ENDPOINTS_READY = "VpcEndpointsReady"
+
+
+class InterfaceEndpoint(NamedTuple):
+    # the logical ID is <name>VpcEndpoint
+    name: str
+    # the service, eg ecr.api for com.amazonaws.<region>.ecr.api
+    service: str
+    # True if only the ECS services in the private subnets need it. Interface
+    # endpoints are billed by the hour in each subnet
+    private_services_only: bool
+
+
+INTERFACE_ENDPOINTS: tuple[InterfaceEndpoint, ...] = (
+    # the queue depth lambda runs in the private subnets
+    InterfaceEndpoint("Monitoring", "monitoring", False),
+    InterfaceEndpoint("Ecs", "ecs", False),
+    # the image manifests. The layers are served from S3
+    InterfaceEndpoint("EcrApi", "ecr.api", True),
+    InterfaceEndpoint("EcrDkr", "ecr.dkr", True),
+    InterfaceEndpoint("Logs", "logs", True),
+    InterfaceEndpoint("SecretsManager", "secretsmanager", True),
+    # ECS Exec, which every service enables with EnableExecuteCommand
+    InterfaceEndpoint("SsmMessages", "ssmmessages", True),
+)
+
 
 def get_parameters() -> str:
     """
@@ -52,22 +97,121 @@ def get_parameters() -> str:
     Type: String
     Default: yeastregulatorydb
     Description: The value for the `app` tag applied to all resources.
+
+  ServiceSubnets:
+    Type: String
+    Description: >-
+      The subnets the ECS services run in. Private tasks have no public IP
+      and reach the AWS services they use through VPC endpoints only.
+    Default: Public
+    AllowedValues:
+      - Public
+      - Private
+"""
+
+
+def get_conditions() -> str:
+    """
+    Return the conditions section of the VPC, subnets, route tables,
+    and network connections CloudFormation template.
+
+    :return: conditions section
+    :rtype: str
+    """
+    return f"""
+  {PRIVATE_SERVICES_CONDITION}: !Equals [!Ref ServiceSubnets, Private]
 """
 
 
-def get_resources() -> str:
+def service_network_configuration() -> dict:
+    """
+    Return the NetworkConfiguration of an ECS service, in the public or the
+    private subnets depending on the ServiceSubnets parameter.
+
+    :return: a new network configuration
+    :rtype: dict
+    """
+    return {
+        "AwsvpcConfiguration": {
+            "AssignPublicIp": {
+                "Fn::If": [PRIVATE_SERVICES_CONDITION, "DISABLED", "ENABLED"]
+            },
+            "Subnets": {
+                "Fn::If": [
+                    PRIVATE_SERVICES_CONDITION,
+                    [ref(f"PrivateSubnet{az}") for az in "ABC"],
+                    [ref(f"Subnet{az}") for az in "ABC"],
+                ]
+            },
+            "SecurityGroups": [get_att("DjangoSecurityGroup", "GroupId")],
+        }
+    }
+
+
+def interface_endpoint_resources(
+    endpoints: tuple[InterfaceEndpoint, ...] = INTERFACE_ENDPOINTS
+) -> CommentedMap:
+    """
+    Return the interface VPC endpoints, in the private subnets, and the
+    `ENDPOINTS_READY` resource which depends on them.
+
+    :param endpoints: the endpoints
+    :type endpoints: tuple[InterfaceEndpoint, ...]
+
+    :return: resources, by logical ID
+    :rtype: CommentedMap
+    """
+    resources = CommentedMap()
+    # DependsOn may not name a resource whose condition is false, so the
+    # services depend on a handle whose metadata references the endpoints
+    ready = {"S3VpcEndpoint": ref("S3VpcEndpoint")}
+    for endpoint in endpoints:
+        logical_id = f"{endpoint.name}VpcEndpoint"
+        resources[logical_id] = resource = {}
+        if endpoint.private_services_only:
+            resource["Condition"] = PRIVATE_SERVICES_CONDITION
+        resource |= {
+            "Type": "AWS::EC2::VPCEndpoint",
+            "Properties": {
+                "VpcId": ref("MyVPC"),
+                "ServiceName": sub(
+                    f"com.amazonaws.${{AWS::Region}}.{endpoint.service}"
+                ),
+                "VpcEndpointType": "Interface",
+                "PrivateDnsEnabled": True,
+                "SubnetIds": [ref(f"PrivateSubnet{az}") for az in "ABC"],
+                "SecurityGroupIds": [get_att("VpcEndpointSecurityGroup", "GroupId")],
+            },
+        }
+        ready[logical_id] = (
+            {"Fn::If": [PRIVATE_SERVICES_CONDITION, ref(logical_id), ""]}
+            if endpoint.private_services_only
+            else ref(logical_id)
+        )
+    resources[ENDPOINTS_READY] = {
+        "Type": "AWS::CloudFormation::WaitConditionHandle",
+        "Metadata": ready,
+    }
+    return resources
+
+
+def get_resources() -> Mapping:
     """
     Return the resources section of the VPC, subnets, route tables,
     and network connections CloudFormation template.
 
     :return: resources section
-    :rtype: str
+    :rtype: Mapping
     """
-    return """
+    resources = load_fragment(
+        """
   MyVPC:
     Type: AWS::EC2::VPC
     Properties:
       CidrBlock: !Ref VpcCidrBlock
+      # required by the private DNS names of the interface endpoints
+      EnableDnsSupport: true
+      EnableDnsHostnames: true
       Tags:
         - Key: app
           Value: !Ref AppTagValue
@@ -80,7 +224,7 @@ def get_resources() -> str:
     Properties:
       VpcId: !Ref MyVPC
       CidrBlock: !Ref SubnetACidrBlock
-      AvailabilityZone: us-east-2a
+      AvailabilityZone: !Select [0, !GetAZs ""]
       Tags:
         - Key: app
           Value: !Ref AppTagValue
@@ -93,7 +237,7 @@ def get_resources() -> str:
     Properties:
       VpcId: !Ref MyVPC
       CidrBlock: !Ref SubnetBCidrBlock
-      AvailabilityZone: us-east-2b
+      AvailabilityZone: !Select [1, !GetAZs ""]
       Tags:
         - Key: app
           Value: !Ref AppTagValue
@@ -106,7 +250,7 @@ def get_resources() -> str:
     Properties:
       VpcId: !Ref MyVPC
       CidrBlock: !Ref SubnetCCidrBlock
-      AvailabilityZone: us-east-2c
+      AvailabilityZone: !Select [2, !GetAZs ""]
       Tags:
         - Key: app
           Value: !Ref AppTagValue
@@ -118,7 +262,7 @@ def get_resources() -> str:
     Properties:
       VpcId: !Ref MyVPC
       CidrBlock: !Ref PrivateSubnetACidrBlock
-      AvailabilityZone: us-east-2a
+      AvailabilityZone: !Select [0, !GetAZs ""]
       Tags:
         - Key: app
           Value: !Ref AppTagValue
@@ -130,7 +274,7 @@ def get_resources() -> str:
     Properties:
       VpcId: !Ref MyVPC
       CidrBlock: !Ref PrivateSubnetBCidrBlock
-      AvailabilityZone: us-east-2b
+      AvailabilityZone: !Select [1, !GetAZs ""]
       Tags:
         - Key: app
           Value: !Ref AppTagValue
@@ -142,7 +286,7 @@ def get_resources() -> str:
     Properties:
       VpcId: !Ref MyVPC
       CidrBlock: !Ref PrivateSubnetCCidrBlock
-      AvailabilityZone: us-east-2c
+      AvailabilityZone: !Select [2, !GetAZs ""]
       Tags:
         - Key: app
           Value: !Ref AppTagValue
@@ -246,7 +390,22 @@ def get_resources() -> str:
     Properties:
       SubnetId: !Ref PrivateSubnetC
       RouteTableId: !Ref PrivateRouteTable
+
+  # free, and used by the tasks in either subnet. Traffic to S3 in the
+  # region, including ECR image layers, stays off the internet gateway
+  S3VpcEndpoint:
+    Type: AWS::EC2::VPCEndpoint
+    Properties:
+      VpcId: !Ref MyVPC
+      ServiceName: !Sub "com.amazonaws.${AWS::Region}.s3"
+      VpcEndpointType: Gateway
+      RouteTableIds:
+        - !Ref PrivateRouteTable
+        - !Ref MyPublicRouteTable
 """
+    )
+    resources.update(interface_endpoint_resources())
+    return resources
 
 
 def get_outputs() -> str:
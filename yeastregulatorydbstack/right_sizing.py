@@ -0,0 +1,288 @@
+"""
+Recommend a Fargate task size and task counts for each ECS service from the
+task utilization that Container Insights records.
+
+Container Insights writes a performance log event for every task each minute
+to /aws/ecs/containerinsights/<cluster>/performance. Export the task events,
+eg with a Logs Insights query
+
+    fields @timestamp, ServiceName, TaskId, CpuUtilized, CpuReserved,
+      MemoryUtilized, MemoryReserved
+    | filter Type = "Task"
+
+saved as CSV or JSON, and run
+
+    python -m yeastregulatorydbstack.right_sizing tasks.csv
+
+The task size is the cheapest Fargate size with enough CPU for the
+`percentile` CPU use of a task at `target_cpu_utilization`, and enough memory
+for the peak memory use of a task plus `memory_headroom`: memory is not
+compressible, so it is sized on the peak. The task counts keep the
+service's total CPU use, minute by minute, at the target utilization: the
+minimum count covers the median minute and the maximum count the busiest.
+CPU is in CPU units, where 1024 is one vCPU, and memory in MiB.
+"""
+
+import argparse
+import csv
+import json
+import math
+import statistics
+from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from yeastregulatorydbstack.fargate import task_sizes
+
+# relative on-demand Fargate (Linux, x86) prices, per vCPU hour and GiB hour
+VCPU_PRICE = 0.04048
+GIB_PRICE = 0.004445
+
+
+class TaskSample(NamedTuple):
+    service: str
+    task_id: str
+    minute: int
+    cpu_utilized: float
+    cpu_reserved: float
+    memory_utilized: float
+    memory_reserved: float
+
+
+class Recommendation(NamedTuple):
+    service: str
+    samples: int
+    current_cpu: int
+    current_memory: int
+    cpu: int
+    memory: int
+    min_count: int
+    max_count: int
+    # False if even the largest task size is short of the measured use
+    fits: bool
+
+
+def hourly_price(cpu: int, memory: int) -> float:
+    """Return the on-demand price of running a task of this size for an hour."""
+    return cpu / 1024 * VCPU_PRICE + memory / 1024 * GIB_PRICE
+
+
+def _minute(timestamp) -> int:
+    """Return a Container Insights timestamp, in epoch ms or ISO 8601, as
+    minutes since the epoch. An ISO 8601 timestamp without an offset, as
+    Logs Insights exports them, is UTC."""
+    try:
+        return int(float(timestamp) // 60_000)
+    except ValueError:
+        parsed = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp() // 60)
+
+
+def parse_samples(records: Iterable[Mapping]) -> list[TaskSample]:
+    """
+    Return the task samples in Container Insights performance log events.
+    Events of other types, and of tasks which are not part of a service, are
+    skipped.
+
+    :param records: performance log events, or rows of an export of them
+    :type records: Iterable[Mapping]
+
+    :return: one sample per task per minute
+    :rtype: list[TaskSample]
+    """
+    samples = []
+    for record in records:
+        if record.get("Type", "Task") != "Task" or not record.get("ServiceName"):
+            continue
+        samples.append(
+            TaskSample(
+                service=record["ServiceName"],
+                task_id=record.get("TaskId", ""),
+                minute=_minute(record.get("Timestamp") or record["@timestamp"]),
+                cpu_utilized=float(record["CpuUtilized"]),
+                cpu_reserved=float(record["CpuReserved"]),
+                memory_utilized=float(record["MemoryUtilized"]),
+                memory_reserved=float(record["MemoryReserved"]),
+            )
+        )
+    return samples
+
+
+def load_samples(path: str) -> list[TaskSample]:
+    """
+    Read an export of Container Insights task events. A `.csv` file is read
+    with a header row. Otherwise the file is JSON: a list of events, the
+    output of `aws logs get-query-results`, or one event per line.
+
+    :param path: the export
+    :type path: str
+
+    :return: the task samples in the export
+    :rtype: list[TaskSample]
+    """
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        if path.endswith(".csv"):
+            return parse_samples(csv.DictReader(file))
+        text = file.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        data = [
+            {field["field"]: field["value"] for field in row} for row in data["results"]
+        ]
+    return parse_samples(data)
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[
+        max(0, min(98, round(percentile) - 1))
+    ]
+
+
+def recommend(
+    samples: Iterable[TaskSample],
+    target_cpu_utilization: float = 0.7,
+    memory_headroom: float = 0.2,
+    percentile: float = 95,
+) -> list[Recommendation]:
+    """
+    Recommend a task size and task counts for each service in the samples.
+
+    :param samples: task samples, see `parse_samples`
+    :type samples: Iterable[TaskSample]
+    :param target_cpu_utilization: the fraction of a task's CPU it should use
+      at the `percentile` CPU use
+    :type target_cpu_utilization: float
+    :param memory_headroom: the fraction of the peak memory use to add
+    :type memory_headroom: float
+    :param percentile: the percentile of per task CPU use to size for
+    :type percentile: float
+
+    :return: one recommendation per service, by service name
+    :rtype: list[Recommendation]
+    """
+    if not 0 < target_cpu_utilization <= 1:
+        raise ValueError("target_cpu_utilization must be in (0, 1]")
+    by_service: dict[str, list[TaskSample]] = defaultdict(list)
+    for sample in samples:
+        by_service[sample.service].append(sample)
+
+    recommendations = []
+    for service, service_samples in sorted(by_service.items()):
+        cpu_needed = (
+            _percentile([s.cpu_utilized for s in service_samples], percentile)
+            / target_cpu_utilization
+        )
+        memory_needed = max(s.memory_utilized for s in service_samples) * (
+            1 + memory_headroom
+        )
+        sizes = [
+            (cpu, memory)
+            for cpu, memory in task_sizes()
+            if cpu >= cpu_needed and memory >= memory_needed
+        ]
+        fits = bool(sizes)
+        cpu, memory = (
+            min(sizes, key=lambda size: hourly_price(*size))
+            if fits
+            else max(task_sizes(), key=lambda size: hourly_price(*size))
+        )
+
+        per_minute: dict[int, float] = defaultdict(float)
+        for sample in service_samples:
+            per_minute[sample.minute] += sample.cpu_utilized
+        task_cpu = cpu * target_cpu_utilization
+        recommendations.append(
+            Recommendation(
+                service=service,
+                samples=len(service_samples),
+                current_cpu=int(
+                    statistics.mode(s.cpu_reserved for s in service_samples)
+                ),
+                current_memory=int(
+                    statistics.mode(s.memory_reserved for s in service_samples)
+                ),
+                cpu=cpu,
+                memory=memory,
+                min_count=max(
+                    1, math.ceil(statistics.median(per_minute.values()) / task_cpu)
+                ),
+                max_count=max(1, math.ceil(max(per_minute.values()) / task_cpu)),
+                fits=fits,
+            )
+        )
+    return recommendations
+
+
+def format_recommendations(recommendations: Iterable[Recommendation]) -> str:
+    """Return the recommendations as a table, one row per service."""
+    rows = [("service", "samples", "current", "recommended", "tasks", "")]
+    for r in recommendations:
+        rows.append(
+            (
+                r.service,
+                str(r.samples),
+                f"{r.current_cpu}/{r.current_memory}",
+                f"{r.cpu}/{r.memory}",
+                f"{r.min_count}-{r.max_count}",
+                "" if r.fits else "exceeds the largest task size",
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Recommend Fargate task sizes and counts from exported "
+        "Container Insights task utilization."
+    )
+    parser.add_argument(
+        "exports",
+        nargs="+",
+        help="CSV or JSON exports of Container Insights task events.",
+    )
+    parser.add_argument(
+        "--target-cpu-utilization",
+        type=float,
+        default=0.7,
+        help="The fraction of a task's CPU to use at the percentile CPU use.",
+    )
+    parser.add_argument(
+        "--memory-headroom",
+        type=float,
+        default=0.2,
+        help="The fraction of the peak memory use to add.",
+    )
+    parser.add_argument(
+        "--percentile",
+        type=float,
+        default=95,
+        help="The percentile of per task CPU use to size for.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    samples = [sample for path in args.exports for sample in load_samples(path)]
+    print(
+        format_recommendations(
+            recommend(
+                samples,
+                args.target_cpu_utilization,
+                args.memory_headroom,
+                args.percentile,
+            )
+        )
+    )
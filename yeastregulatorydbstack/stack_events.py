@@ -0,0 +1,228 @@
+"""
+Stream the events of a stack create/update to the terminal and report how
+long each resource took.
+
+`watch_stack` tails `describe_stack_events` until the stack reaches a
+terminal status. The poll interval backs off while nothing is happening, eg
+while RDS is creating, and drops back to the minimum as soon as new events
+arrive. boto3 is synchronous, so each call runs in a worker thread and the
+watcher can run alongside other coroutines, eg when several stacks are
+deployed at once.
+"""
+
+import argparse
+import asyncio
+from collections.abc import Callable, Iterator, Mapping
+from typing import NamedTuple
+
+import boto3
+from botocore.exceptions import ClientError
+
+from yeastregulatorydbstack.deploy_time import (
+    STACK_TYPE,
+    parse_timestamp,
+    resource_timings,
+)
+
+# poll interval, in seconds, and the factor by which it grows between polls
+# which return no new events
+MIN_DELAY = 2.0
+MAX_DELAY = 30.0
+BACKOFF = 1.5
+
+# stack statuses which begin an operation. Rollbacks and cleanups are part of
+# the operation which preceded them
+_OPERATION_STARTS = (
+    "CREATE_IN_PROGRESS",
+    "UPDATE_IN_PROGRESS",
+    "DELETE_IN_PROGRESS",
+    "IMPORT_IN_PROGRESS",
+)
+
+
+class WatchResult(NamedTuple):
+    stack_status: str
+    events: list[dict]
+
+
+def is_terminal(status: str) -> bool:
+    """
+    Return True if a stack status is final, eg UPDATE_COMPLETE or
+    ROLLBACK_FAILED, but not UPDATE_COMPLETE_CLEANUP_IN_PROGRESS.
+    """
+    return status.endswith("_COMPLETE") or status.endswith("_FAILED")
+
+
+def is_success(status: str) -> bool:
+    """Return True if a terminal stack status is a successful create/update."""
+    return status in ("CREATE_COMPLETE", "UPDATE_COMPLETE", "IMPORT_COMPLETE")
+
+
+def _iter_events(cf_client, stack_name: str) -> Iterator[dict]:
+    # describe_stack_events returns the newest events first
+    kwargs = {"StackName": stack_name}
+    while True:
+        response = cf_client.describe_stack_events(**kwargs)
+        yield from response["StackEvents"]
+        if not response.get("NextToken"):
+            return
+        kwargs["NextToken"] = response["NextToken"]
+
+
+def latest_event_id(cf_client, stack_name: str) -> str | None:
+    """
+    Return the ID of the most recent event of a stack, or None if the stack
+    does not exist or has no events. Pass it to `watch_stack` before starting
+    a deploy so that the events of earlier deploys are skipped.
+    """
+    try:
+        return next(_iter_events(cf_client, stack_name), {}).get("EventId")
+    except ClientError as e:
+        if "does not exist" in str(e):
+            return None
+        raise
+
+
+def operation_start_event_id(cf_client, stack_name: str) -> str | None:
+    """
+    Return the ID of the last event before the stack's most recent create,
+    update or delete began, so that an operation which is already running
+    can be watched from its start.
+
+    :return: the event ID, or None if the operation is the stack's first
+    :rtype: str | None
+    """
+    found_start = False
+    for event in _iter_events(cf_client, stack_name):
+        if found_start:
+            return event["EventId"]
+        found_start = (
+            event["ResourceType"] == STACK_TYPE
+            and event["ResourceStatus"] in _OPERATION_STARTS
+        )
+    return None
+
+
+def _new_events(
+    cf_client, stack_name: str, seen: set[str], stop_at: str | None
+) -> list[dict]:
+    new_events = []
+    for event in _iter_events(cf_client, stack_name):
+        if event["EventId"] in seen or event["EventId"] == stop_at:
+            break
+        new_events.append(event)
+    return list(reversed(new_events))
+
+
+def format_event(event: Mapping) -> str:
+    """Format a stack event as a single line of progress."""
+    line = (
+        f"{parse_timestamp(event['Timestamp']):%H:%M:%S}  {event['ResourceStatus']:<35}"
+        f"  {event['LogicalResourceId']:<35}  {event['ResourceType']}"
+    )
+    if event.get("ResourceStatusReason"):
+        line += f"  {event['ResourceStatusReason']}"
+    return line
+
+
+async def watch_stack(
+    stack_name: str,
+    cf_client=None,
+    after_event_id: str | None = None,
+    min_delay: float = MIN_DELAY,
+    max_delay: float = MAX_DELAY,
+    backoff: float = BACKOFF,
+    printer: Callable[[str], None] = print,
+) -> WatchResult:
+    """
+    Poll the events of a stack until it reaches a terminal status.
+
+    :param stack_name: the stack name
+    :type stack_name: str
+    :param cf_client: a boto3 CloudFormation client. Defaults to a new one.
+    :param after_event_id: only report events newer than this one, see
+      `latest_event_id`
+    :type after_event_id: str | None
+    :param min_delay: seconds between polls while events are arriving
+    :type min_delay: float
+    :param max_delay: the longest wait between polls
+    :type max_delay: float
+    :param backoff: factor by which the wait grows after an empty poll
+    :type backoff: float
+    :param printer: called with each formatted event
+    :type printer: Callable[[str], None]
+
+    :return: the final stack status and the new events, oldest first
+    :rtype: WatchResult
+    """
+    cf_client = cf_client or boto3.client("cloudformation")
+    seen: set[str] = set()
+    events: list[dict] = []
+    delay = min_delay
+    while True:
+        new_events = await asyncio.to_thread(
+            _new_events, cf_client, stack_name, seen, after_event_id
+        )
+        for event in new_events:
+            seen.add(event["EventId"])
+            events.append(event)
+            printer(format_event(event))
+            if (
+                event["ResourceType"] == STACK_TYPE
+                and event["LogicalResourceId"] == stack_name
+                and is_terminal(event["ResourceStatus"])
+            ):
+                return WatchResult(event["ResourceStatus"], events)
+        delay = min_delay if new_events else min(delay * backoff, max_delay)
+        await asyncio.sleep(delay)
+
+
+def format_timings(events: list[Mapping]) -> str:
+    """
+    Format the per resource start/end times and durations of a deploy as a
+    table, ordered by start time. The stack itself is the last row.
+
+    :param events: the events of one deploy, eg `WatchResult.events`
+    :type events: list[Mapping]
+
+    :return: the table
+    :rtype: str
+    """
+    timings = sorted(
+        resource_timings(events),
+        key=lambda t: (t.resource_type == STACK_TYPE, t.start),
+    )
+    width = max((len(t.logical_id) for t in timings), default=8)
+    lines = [
+        f"{'resource':<{width}}  {'type':<45}  {'action':<6}  {'status':<8}"
+        f"  {'start':<8}  {'end':<8}  duration"
+    ]
+    for t in timings:
+        lines.append(
+            f"{t.logical_id:<{width}}  {t.resource_type:<45}  {t.action:<6}"
+            f"  {t.status:<8}  {t.start:%H:%M:%S}  {t.end:%H:%M:%S}"
+            f"  {t.seconds:>7.0f}s"
+        )
+    return "\n".join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Stream the events of an in progress stack deploy."
+    )
+    parser.add_argument("stack_name", help="The stack to watch.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    client = boto3.client("cloudformation")
+    result = asyncio.run(
+        watch_stack(
+            args.stack_name,
+            client,
+            after_event_id=operation_start_event_id(client, args.stack_name),
+        )
+    )
+    print(format_timings(result.events))
+    print(f"Stack {args.stack_name} finished with {result.stack_status}")
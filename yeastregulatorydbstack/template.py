@@ -0,0 +1,355 @@
+"""
+In-memory model of the CloudFormation template assembled by create_template.
+
+Each resource module contributes parameters, resources and outputs, either as
+the yaml fragments returned by its `get_*` functions or as mappings built in
+python. Fragments are parsed once, when they are added, with the ruamel.yaml
+round trip loader so that the short form intrinsic functions (`!Ref`,
+`!GetAtt`, `!Sub`, ...) survive, and the whole template is serialized in a
+single pass by `Template.to_yaml`.
+"""
+
+from collections.abc import Iterable, Mapping, MutableMapping
+from io import StringIO
+from types import ModuleType
+from typing import Any
+
+from ruamel.yaml import YAML
+from ruamel.yaml.comments import CommentedMap, CommentedSeq, TaggedScalar
+from ruamel.yaml.scalarbool import ScalarBoolean
+
+DESCRIPTION = (
+    "CloudFormation template for PostgreSQL RDS, ElastiCache Redis, "
+    "EC2 and a ECS/Fargate cluster for a django app complete with VPC, "
+    "subnets, security groups, and IAM roles."
+)
+
+# top level template sections, in the order in which they are serialized
+SECTIONS = (
+    "Parameters",
+    "Rules",
+    "Mappings",
+    "Conditions",
+    "Resources",
+    "Outputs",
+)
+
+# Parameters and Resources are both targets of !Ref, so CloudFormation
+# requires that their logical IDs are unique across both sections
+_SHARED_NAMESPACE = ("Parameters", "Resources")
+
+
+class DuplicateLogicalIdError(ValueError):
+    """Raised when a logical ID is added to a template more than once."""
+
+
+def yaml_handler() -> YAML:
+    """
+    Return a round trip YAML loader/dumper configured to match the layout
+    of the templates in this repo.
+
+    :return: a configured ruamel.yaml YAML instance
+    :rtype: YAML
+    """
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    yaml.indent(mapping=2, sequence=4, offset=2)
+    yaml.width = 4096
+    # CloudFormation does not resolve anchors and aliases, so a node which
+    # appears more than once in a template is written out each time
+    yaml.representer.ignore_aliases = lambda *_: True
+    return yaml
+
+
+def ref(logical_id: str) -> TaggedScalar:
+    """
+    Return a `!Ref` to a parameter or resource.
+
+    :param logical_id: the logical ID of the parameter or resource
+    :type logical_id: str
+
+    :return: a tagged scalar which serializes as `!Ref <logical_id>`
+    :rtype: TaggedScalar
+    """
+    return TaggedScalar(logical_id, tag="!Ref")
+
+
+def get_att(logical_id: str, attribute: str) -> TaggedScalar:
+    """
+    Return a `!GetAtt` of a resource attribute.
+
+    :param logical_id: the logical ID of the resource
+    :type logical_id: str
+    :param attribute: the attribute name, eg `Endpoint.Address`
+    :type attribute: str
+
+    :return: a tagged scalar which serializes as
+      `!GetAtt <logical_id>.<attribute>`
+    :rtype: TaggedScalar
+    """
+    return TaggedScalar(f"{logical_id}.{attribute}", tag="!GetAtt")
+
+
+def sub(string: str) -> TaggedScalar:
+    """
+    Return a `!Sub` of a string.
+
+    :param string: the string to substitute, eg `arn:aws:s3:::${EnvFilePath}`
+    :type string: str
+
+    :return: a tagged scalar which serializes as `!Sub <string>`
+    :rtype: TaggedScalar
+    """
+    return TaggedScalar(string, tag="!Sub")
+
+
+def to_plain(value: Any) -> Any:
+    """
+    Convert a parsed template value to plain python types, with short form
+    intrinsic functions rewritten to their long (json) form, eg
+    `!GetAtt A.B` to `{"Fn::GetAtt": ["A", "B"]}`.
+
+    ruamel.yaml's tagged values compare by identity, so use this to compare
+    or hash template content.
+
+    :param value: a template, or any part of one
+    :type value: Any
+
+    :return: the value as dicts, lists and scalars
+    :rtype: Any
+    """
+    tag = getattr(getattr(value, "tag", None), "value", None)
+    if isinstance(value, Mapping):
+        plain: Any = {str(k): to_plain(v) for k, v in value.items()}
+    elif isinstance(value, list):
+        plain = [to_plain(v) for v in value]
+    elif isinstance(value, TaggedScalar):
+        plain = str(value.value)
+    elif value is None:
+        return None
+    # ruamel's ScalarBoolean, ScalarInt, ... subclass the builtins, and
+    # ScalarBoolean subclasses int
+    elif isinstance(value, (bool, ScalarBoolean)):
+        return bool(value)
+    elif isinstance(value, (int, float)):
+        return type(value).__mro__[-2](value)
+    else:
+        return str(value)
+
+    if not tag or not tag.startswith("!"):
+        return plain
+    name = tag[1:]
+    if name == "GetAtt" and isinstance(plain, str):
+        plain = plain.split(".", 1)
+    if name in ("Ref", "Condition"):
+        return {name: plain}
+    return {f"Fn::{name}": plain}
+
+
+def load_fragment(fragment: str | Mapping | None) -> Mapping:
+    """
+    Parse a yaml fragment, eg the return of a resource module's
+    `get_resources()`, into a mapping of logical ID to definition.
+
+    :param fragment: a yaml formatted str, an already parsed mapping, or None
+    :type fragment: str | Mapping | None
+
+    :return: the parsed fragment. Empty fragments return an empty mapping.
+    :rtype: Mapping
+    :raises TypeError: if the fragment does not parse to a mapping
+    """
+    if isinstance(fragment, Mapping):
+        return fragment
+    parsed = yaml_handler().load(fragment) if fragment else None
+    if parsed is None:
+        return CommentedMap()
+    if not isinstance(parsed, Mapping):
+        raise TypeError(
+            f"Expected a template fragment to be a mapping, got {type(parsed)}"
+        )
+    return parsed
+
+
+def set_allowed_values(parameter: MutableMapping, values: Iterable) -> None:
+    """
+    Set the AllowedValues of a parameter, as a single line list.
+
+    :param parameter: the parameter. It is modified in place.
+    :type parameter: MutableMapping
+    :param values: the allowed values
+    :type values: Iterable
+    """
+    allowed = CommentedSeq(values)
+    allowed.fa.set_flow_style()
+    if isinstance(parameter, CommentedMap):
+        # ahead of the last key, which holds the blank line between parameters
+        parameter.insert(len(parameter) - 1, "AllowedValues", allowed)
+    else:
+        parameter["AllowedValues"] = allowed
+
+
+class Template:
+    """
+    A CloudFormation template held as one mapping per top level section.
+
+    Logical IDs are checked for duplicates when they are inserted, rather than
+    when CloudFormation rejects the rendered template.
+    """
+
+    def __init__(self, description: str = DESCRIPTION) -> None:
+        """
+        :param description: the template Description
+        :type description: str
+        """
+        self.description = description
+        # template level Metadata. It is not a logical ID namespace, so it is
+        # not one of SECTIONS
+        self.metadata = CommentedMap()
+        self.sections: dict[str, CommentedMap] = {
+            section: CommentedMap() for section in SECTIONS
+        }
+
+    @property
+    def parameters(self) -> CommentedMap:
+        return self.sections["Parameters"]
+
+    @property
+    def rules(self) -> CommentedMap:
+        return self.sections["Rules"]
+
+    @property
+    def mappings(self) -> CommentedMap:
+        return self.sections["Mappings"]
+
+    @property
+    def conditions(self) -> CommentedMap:
+        return self.sections["Conditions"]
+
+    @property
+    def resources(self) -> CommentedMap:
+        return self.sections["Resources"]
+
+    @property
+    def outputs(self) -> CommentedMap:
+        return self.sections["Outputs"]
+
+    def add(self, section: str, fragment: str | Mapping | None) -> None:
+        """
+        Add the entries of a fragment to a section of the template.
+
+        :param section: one of `SECTIONS`
+        :type section: str
+        :param fragment: a yaml formatted str or a mapping of logical ID to
+          definition
+        :type fragment: str | Mapping | None
+
+        :raises KeyError: if the section is not a template section
+        :raises DuplicateLogicalIdError: if a logical ID in the fragment
+          already exists in the template
+        """
+        if section not in self.sections:
+            raise KeyError(f"{section} is not one of {SECTIONS}")
+        namespace = _SHARED_NAMESPACE if section in _SHARED_NAMESPACE else (section,)
+        target = self.sections[section]
+        for logical_id, definition in load_fragment(fragment).items():
+            for other in namespace:
+                if logical_id in self.sections[other]:
+                    raise DuplicateLogicalIdError(
+                        f"Logical ID '{logical_id}' is already defined in {other}"
+                    )
+            target[logical_id] = definition
+
+    def add_parameters(self, fragment: str | Mapping | None) -> None:
+        self.add("Parameters", fragment)
+
+    def add_rules(self, fragment: str | Mapping | None) -> None:
+        self.add("Rules", fragment)
+
+    def add_mappings(self, fragment: str | Mapping | None) -> None:
+        self.add("Mappings", fragment)
+
+    def add_conditions(self, fragment: str | Mapping | None) -> None:
+        self.add("Conditions", fragment)
+
+    def add_resources(self, fragment: str | Mapping | None) -> None:
+        self.add("Resources", fragment)
+
+    def add_outputs(self, fragment: str | Mapping | None) -> None:
+        self.add("Outputs", fragment)
+
+    def add_module(self, module: ModuleType) -> None:
+        """
+        Add the parameters, resources and outputs of a resource module, eg
+        `yeastregulatorydbstack.resources.alb`, and its rules, mappings and
+        conditions if it has any.
+
+        :param module: a module with `get_parameters`, `get_resources` and
+          `get_outputs` functions, and optionally `get_rules`, `get_mappings`
+          and `get_conditions`
+        :type module: ModuleType
+        """
+        self.add_parameters(module.get_parameters())
+        if hasattr(module, "get_rules"):
+            self.add_rules(module.get_rules())
+        if hasattr(module, "get_mappings"):
+            self.add_mappings(module.get_mappings())
+        if hasattr(module, "get_conditions"):
+            self.add_conditions(module.get_conditions())
+        self.add_resources(module.get_resources())
+        self.add_outputs(module.get_outputs())
+
+    def to_mapping(self) -> CommentedMap:
+        """
+        Return the template as a single mapping. Empty sections are omitted.
+
+        :return: the template body
+        :rtype: CommentedMap
+        """
+        body = CommentedMap()
+        body["AWSTemplateFormatVersion"] = "2010-09-09"
+        body["Description"] = self.description
+        if self.metadata:
+            body["Metadata"] = self.metadata
+        for section, entries in self.sections.items():
+            if entries:
+                body[section] = entries
+        return body
+
+    def to_dict(self) -> dict:
+        """
+        Return the template as plain python types, suitable for
+        `json.dumps`. See `to_plain`.
+
+        :return: the template body
+        :rtype: dict
+        """
+        return to_plain(self.to_mapping())
+
+    def to_yaml(self) -> str:
+        """
+        Serialize the template.
+
+        :return: the yaml formatted template body
+        :rtype: str
+        """
+        stream = StringIO()
+        yaml_handler().dump(self.to_mapping(), stream)
+        return stream.getvalue()
+
+    @classmethod
+    def from_yaml(cls, template_body: str) -> "Template":
+        """
+        Parse a rendered template, eg one written by create_template.
+
+        :param template_body: the yaml formatted template body
+        :type template_body: str
+
+        :return: the parsed template
+        :rtype: Template
+        """
+        body: Any = load_fragment(template_body)
+        template = cls(description=body.get("Description", DESCRIPTION))
+        template.metadata.update(body.get("Metadata", {}))
+        for section in SECTIONS:
+            template.add(section, body.get(section))
+        return template
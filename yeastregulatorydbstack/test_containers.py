@@ -0,0 +1,105 @@
+import itertools
+
+from .containers import (
+    LOG_DELIVERY_MODES,
+    LOG_ROUTER,
+    app_container,
+    configure_log_delivery,
+)
+from .create_template import build_template
+from .template import to_plain
+
+
+def _task_definition():
+    return {"Properties": {"ContainerDefinitions": [app_container("app")]}}
+
+
+def test_log_delivery_adds_a_conditional_router():
+    task_definition = _task_definition()
+    configure_log_delivery(task_definition, "Django")
+    app, router = to_plain(task_definition["Properties"]["ContainerDefinitions"])
+    condition, firelens, awslogs = app["LogConfiguration"]["Fn::If"]
+    assert condition == "DjangoFireLensLogs"
+    assert firelens["logDriver"] == "awsfirelens"
+    assert awslogs["options"]["mode"] == {
+        "Fn::If": ["DjangoBlockingLogs", "blocking", "non-blocking"]
+    }
+    assert router["Fn::If"][1]["Name"] == LOG_ROUTER
+    assert router["Fn::If"][2] == {"Ref": "AWS::NoValue"}
+
+
+def test_every_task_definition_has_a_log_delivery():
+    template = build_template()
+    for logical_id, resource in template.resources.items():
+        if resource["Type"] != "AWS::ECS::TaskDefinition":
+            continue
+        prefix = "Django" if logical_id == "DjangoTaskDefinition" else "Celery"
+        assert f"{prefix}FireLensLogs" in template.conditions
+        assert f"{prefix}LogArchiveBucket" in template.rules
+        for container in resource["Properties"]["ContainerDefinitions"]:
+            if "Name" in container:
+                assert container["LogConfiguration"]["Fn::If"][0] == (
+                    f"{prefix}FireLensLogs"
+                )
+
+
+def test_template_has_no_yaml_aliases():
+    # CloudFormation does not resolve yaml anchors and aliases
+    assert "&id0" not in build_template().to_yaml()
+
+
+def _resolve(value, true_conditions):
+    """Resolve the Fn::If of a plain template value, dropping AWS::NoValue."""
+    if isinstance(value, dict):
+        if "Fn::If" in value:
+            condition, if_true, if_false = value["Fn::If"]
+            return _resolve(
+                if_true if condition in true_conditions else if_false,
+                true_conditions,
+            )
+        return {k: _resolve(v, true_conditions) for k, v in value.items()}
+    if isinstance(value, list):
+        resolved = [_resolve(v, true_conditions) for v in value]
+        return [v for v in resolved if v != {"Ref": "AWS::NoValue"}]
+    return value
+
+
+def _smallest(value, parameters):
+    """The least value of a number, or of a parameter it refers to."""
+    if isinstance(value, dict):
+        parameter = parameters[value["Ref"]]
+        return min(
+            int(v) for v in parameter.get("AllowedValues", [parameter["Default"]])
+        )
+    return int(value)
+
+
+def _container_memory_fits(template, true_conditions):
+    parameters = to_plain(template.parameters)
+    for logical_id, resource in template.resources.items():
+        if resource["Type"] != "AWS::ECS::TaskDefinition":
+            continue
+        properties = _resolve(to_plain(resource["Properties"]), true_conditions)
+        task_memory = _smallest(properties["Memory"], parameters)
+        # ECS counts a container's hard limit, or else its reservation
+        containers = sum(
+            _smallest(
+                container.get("Memory", container.get("MemoryReservation", 0)),
+                parameters,
+            )
+            for container in properties["ContainerDefinitions"]
+        )
+        assert containers <= task_memory, (logical_id, true_conditions)
+
+
+def test_containers_fit_in_the_task_memory_in_every_log_mode():
+    template = build_template()
+    # with and without the PgBouncer sidecar
+    for mode, pgbouncer in itertools.product(LOG_DELIVERY_MODES, (False, True)):
+        firelens = mode.startswith("firelens")
+        true_conditions = {
+            f"{prefix}FireLensLogs" for prefix in ("Django", "Celery") if firelens
+        }
+        if pgbouncer:
+            true_conditions.add("AppsUsePgBouncer")
+        _container_memory_fits(template, true_conditions)
@@ -0,0 +1,110 @@
+from .dependency_graph import DependencyGraph, find_references, prune_template
+from .template import Template
+
+TEMPLATE = """
+Resources:
+  MyVPC:
+    Type: AWS::EC2::VPC
+  MyRoute:
+    Type: AWS::EC2::Route
+    DependsOn: MyVPC
+  SubnetA:
+    Type: AWS::EC2::Subnet
+    DependsOn:
+      - MyVPC
+      - MyRoute
+    Properties:
+      VpcId: !Ref MyVPC
+  Service:
+    Type: AWS::ECS::Service
+    DependsOn:
+      - SubnetA
+      - MyVPC
+    Properties:
+      Name: !Sub "${AWS::StackName}-${SubnetA}-${!Literal}"
+  MyDB:
+    Type: AWS::RDS::DBInstance
+  TaskDefinition:
+    Type: AWS::ECS::TaskDefinition
+    DependsOn: MyDB
+"""
+
+
+def test_find_references_short_and_long_form():
+    value = {
+        "A": {"Ref": "X"},
+        "B": {"Fn::GetAtt": ["Y", "Arn"]},
+        "C": {"Fn::Sub": ["${Z}-${local}", {"local": {"Ref": "W"}}]},
+        "D": {"Ref": "AWS::Region"},
+    }
+    assert find_references(value) == {"X", "Y", "Z", "W"}
+
+
+def test_redundant_and_unneeded_edges():
+    graph = DependencyGraph(Template.from_yaml(TEMPLATE))
+    assert graph.unneeded_depends_on() == {"TaskDefinition": {"MyDB"}}
+    # SubnetA -> MyVPC is implied by the Ref, Service -> MyVPC by the path
+    # through SubnetA. SubnetA -> MyRoute is neither, and is kept: the
+    # resources placed in the subnet need the route
+    assert graph.redundant_depends_on() == {
+        "SubnetA": {"MyVPC"},
+        "Service": {"SubnetA", "MyVPC"},
+    }
+    assert graph.prunable_depends_on() == {
+        "SubnetA": {"MyVPC"},
+        "Service": {"SubnetA", "MyVPC"},
+        "TaskDefinition": {"MyDB"},
+    }
+
+
+def test_prune_template_keeps_build_order_and_adds_parallelism():
+    template = Template.from_yaml(TEMPLATE)
+    pruned = prune_template(template)
+    assert pruned.resources["SubnetA"]["DependsOn"] == ["MyRoute"]
+    assert "DependsOn" not in pruned.resources["Service"]
+    assert "DependsOn" not in pruned.resources["TaskDefinition"]
+    # the original is not modified
+    assert template.resources["SubnetA"]["DependsOn"] == ["MyVPC", "MyRoute"]
+    assert DependencyGraph(pruned).waves() == [
+        ["MyVPC", "MyDB", "TaskDefinition"],
+        ["MyRoute"],
+        ["SubnetA"],
+        ["Service"],
+    ]
+
+
+GATED = """
+Conditions:
+  HasDatabase: !Equals [!Ref AWS::Region, us-east-2]
+Resources:
+  MyVPC:
+    Type: AWS::EC2::VPC
+  Database:
+    Type: AWS::RDS::DBInstance
+    Condition: HasDatabase
+    DependsOn: MyVPC
+  DatabaseReady:
+    Type: AWS::CloudFormation::WaitConditionHandle
+    Metadata:
+      Database: !If [HasDatabase, !Ref Database, ""]
+  Service:
+    Type: AWS::ECS::Service
+    DependsOn:
+      - DatabaseReady
+      - MyVPC
+"""
+
+
+def test_wait_condition_handle_gates_depend_on_their_metadata():
+    graph = DependencyGraph(Template.from_yaml(GATED))
+    assert graph.dependencies("DatabaseReady") == {"Database"}
+    # the gate is not redundant. It only orders Service after MyVPC through
+    # the database, which is not created when HasDatabase is false, so
+    # Service -> MyVPC is kept
+    assert graph.redundant_depends_on() == {}
+    assert graph.waves() == [
+        ["MyVPC"],
+        ["Database"],
+        ["DatabaseReady"],
+        ["Service"],
+    ]
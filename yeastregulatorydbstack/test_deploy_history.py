@@ -0,0 +1,47 @@
+from .deploy_history import connect, percentiles, record_deploy, regressions
+
+
+def _events(db_minutes):
+    events = []
+    for n, (status, time) in enumerate(
+        [
+            ("CREATE_IN_PROGRESS", "10:00:00"),
+            ("CREATE_COMPLETE", f"10:{db_minutes:02d}:00"),
+        ]
+    ):
+        events.append(
+            {
+                "EventId": str(n),
+                "LogicalResourceId": "MyDBInstance",
+                "ResourceType": "AWS::RDS::DBInstance",
+                "ResourceStatus": status,
+                "Timestamp": f"2024-02-10T{time}+00:00",
+            }
+        )
+    return events
+
+
+def test_percentiles_and_regressions():
+    connection = connect(":memory:")
+    for minutes in (8, 10, 12):
+        record_deploy(
+            connection, "stack", "aaaa1111", "CREATE_COMPLETE", _events(minutes)
+        )
+    for minutes in (20, 22):
+        record_deploy(
+            connection, "stack", "bbbb2222", "CREATE_COMPLETE", _events(minutes)
+        )
+
+    [row] = percentiles(connection, "stack", "aaaa")
+    assert (row.key, row.action, row.count, row.p50) == (
+        "AWS::RDS::DBInstance",
+        "CREATE",
+        3,
+        600,
+    )
+    assert 660 < row.p95 <= 720
+
+    [regression] = regressions(connection, "stack", "aaaa", "bbbb")
+    assert regression.baseline_p50 == 600
+    assert regression.candidate_p50 == 1260
+    assert regressions(connection, "stack", "bbbb", "aaaa") == []
@@ -0,0 +1,208 @@
+import pytest
+
+from .deploy_image import deploy_image, swap_image
+
+OLD = "040367161929.dkr.ecr.us-east-2.amazonaws.com/django-stack:v1"
+NEW = "040367161929.dkr.ecr.us-east-2.amazonaws.com/django-stack:v2"
+ROUTER = "public.ecr.aws/aws-observability/aws-for-fluent-bit:2.32.2"
+
+
+class FakeCloudFormation:
+    """A stand-in for the parts of the CloudFormation API deploy_image uses"""
+
+    def __init__(self, status="UPDATE_COMPLETE"):
+        self.status = status
+        self.updates = []
+
+    def describe_stacks(self, StackName):
+        return {
+            "Stacks": [
+                {
+                    "StackName": StackName,
+                    "StackStatus": self.status,
+                    "Parameters": [
+                        {"ParameterKey": "DjangoAppImage", "ParameterValue": OLD},
+                        {"ParameterKey": "DBName", "ParameterValue": "db"},
+                        {
+                            "ParameterKey": "DjangoServiceTaskDefinitionArn",
+                            "ParameterValue": "",
+                        },
+                        {
+                            "ParameterKey": "OtherServiceTaskDefinitionArn",
+                            "ParameterValue": "",
+                        },
+                    ],
+                }
+            ]
+        }
+
+    def list_stack_resources(self, StackName, NextToken=None):
+        resources = [
+            ("DjangoAppEcsCluster", "AWS::ECS::Cluster", "cluster"),
+            ("DjangoService", "AWS::ECS::Service", "arn:service/django"),
+            ("WorkerService", "AWS::ECS::Service", "arn:service/worker"),
+            ("OtherService", "AWS::ECS::Service", "arn:service/other"),
+        ]
+        page = resources[2:] if NextToken else resources[:2]
+        return {
+            "StackResourceSummaries": [
+                {
+                    "LogicalResourceId": logical_id,
+                    "ResourceType": kind,
+                    "PhysicalResourceId": physical_id,
+                }
+                for logical_id, kind, physical_id in page
+            ],
+            **({} if NextToken else {"NextToken": "2"}),
+        }
+
+    def update_stack(self, **kwargs):
+        self.updates.append(kwargs)
+
+    def get_waiter(self, name):
+        assert name == "stack_update_complete"
+        return FakeWaiter(self)
+
+
+class FakeWaiter:
+    def __init__(self, client):
+        self.client = client
+
+    def wait(self, WaiterConfig, cluster=None, services=None, StackName=None):
+        if services is not None:
+            self.client.waited.extend(services)
+
+
+class FakeEcs:
+    """A local stand-in for the parts of the ECS API deploy_image uses"""
+
+    def __init__(self, rolled_back=()):
+        # the services whose deployments the circuit breaker rolls back
+        self.rolled_back = rolled_back
+        self.task_definitions = {
+            "django:1": [
+                {"name": "django", "image": OLD},
+                {"name": "log-router", "image": ROUTER},
+            ],
+            "worker:1": [{"name": "celery-worker", "image": OLD}],
+            "other:1": [{"name": "other", "image": "postgres:16"}],
+        }
+        self.services = {
+            f"arn:service/{name}": f"{name}:1" for name in ("django", "worker", "other")
+        }
+        self.registered = []
+        self.waited = []
+
+    def describe_services(self, cluster, services):
+        assert cluster == "cluster" and len(services) <= 10
+        return {
+            "services": [
+                {
+                    "serviceArn": arn,
+                    "serviceName": arn.rsplit("/", 1)[1],
+                    "taskDefinition": self.services[arn],
+                    "deployments": [
+                        {
+                            "status": "PRIMARY",
+                            "taskDefinition": self.services[arn],
+                            "rolloutState": "COMPLETED",
+                        }
+                    ],
+                }
+                for arn in services
+            ]
+        }
+
+    def describe_task_definition(self, taskDefinition, include):
+        return {
+            "taskDefinition": {
+                "taskDefinitionArn": taskDefinition,
+                "family": taskDefinition.split(":")[0],
+                "revision": 1,
+                "status": "ACTIVE",
+                "cpu": "256",
+                "containerDefinitions": self.task_definitions[taskDefinition],
+                "volumes": [],
+            },
+            "tags": [{"key": "app", "value": "yeastregulatorydb"}],
+        }
+
+    def register_task_definition(self, **kwargs):
+        self.registered.append(kwargs)
+        arn = f"{kwargs['family']}:2"
+        self.task_definitions[arn] = kwargs["containerDefinitions"]
+        return {"taskDefinition": {"taskDefinitionArn": arn}}
+
+    def update_service(self, cluster, service, taskDefinition):
+        if service not in self.rolled_back:
+            self.services[service] = taskDefinition
+
+    def get_waiter(self, name):
+        assert name == "services_stable"
+        return FakeWaiter(self)
+
+
+def test_swap_image_keeps_other_containers():
+    ecs = FakeEcs()
+    revision = swap_image(ecs.describe_task_definition("django:1", ["TAGS"]), OLD, NEW)
+    assert [c["image"] for c in revision["containerDefinitions"]] == [NEW, ROUTER]
+    assert "volumes" not in revision and "revision" not in revision
+    assert revision["tags"] == [{"key": "app", "value": "yeastregulatorydb"}]
+
+
+def test_deploy_image_updates_the_services_and_the_parameter():
+    cf, ecs = FakeCloudFormation(), FakeEcs()
+    status = deploy_image(
+        "stack", NEW, check_images=False, cf_client=cf, ecs_client=ecs
+    )
+    assert status == "deployed"
+    assert ecs.services == {
+        "arn:service/django": "django:2",
+        "arn:service/worker": "worker:2",
+        "arn:service/other": "other:1",
+    }
+    assert ecs.waited == ["arn:service/django", "arn:service/worker"]
+    (update,) = cf.updates
+    assert update["UsePreviousTemplate"]
+    # the updated services are pinned to the revisions they run, if the
+    # stack has their parameter, so that the update does not redeploy them
+    assert update["Parameters"] == [
+        {"ParameterKey": "DjangoAppImage", "ParameterValue": NEW},
+        {"ParameterKey": "DBName", "UsePreviousValue": True},
+        {
+            "ParameterKey": "DjangoServiceTaskDefinitionArn",
+            "ParameterValue": "django:2",
+        },
+        {"ParameterKey": "OtherServiceTaskDefinitionArn", "UsePreviousValue": True},
+    ]
+
+    assert (
+        deploy_image("stack", OLD, check_images=False, cf_client=cf, ecs_client=ecs)
+        == "unchanged"
+    )
+
+
+def test_deploy_image_refuses_a_stack_being_updated():
+    with pytest.raises(ValueError, match="UPDATE_IN_PROGRESS"):
+        deploy_image(
+            "stack",
+            NEW,
+            cf_client=FakeCloudFormation("UPDATE_IN_PROGRESS"),
+            ecs_client=FakeEcs(),
+        )
+
+
+def test_deploy_image_does_not_reconcile_a_rolled_back_service():
+    cf, ecs = FakeCloudFormation(), FakeEcs(rolled_back=["arn:service/worker"])
+    with pytest.raises(ValueError, match="worker runs worker:1, not worker:2"):
+        deploy_image("stack", NEW, check_images=False, cf_client=cf, ecs_client=ecs)
+    assert cf.updates == []
+
+
+def test_deploy_image_does_not_reconcile_without_waiting():
+    cf, ecs = FakeCloudFormation(), FakeEcs()
+    deploy_image(
+        "stack", NEW, wait=False, check_images=False, cf_client=cf, ecs_client=ecs
+    )
+    assert ecs.services["arn:service/django"] == "django:2"
+    assert ecs.waited == [] and cf.updates == []
@@ -0,0 +1,288 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError, WaiterError
+
+from .deploy_stack import (
+    MAX_TEMPLATE_BODY,
+    TEMPLATE_HASH_KEY,
+    deploy_stack,
+    template_hash,
+)
+from .template import Template
+
+TEMPLATE = """
+Parameters:
+  DBName:
+    Type: String
+  PostgresPassword:
+    Type: String
+    NoEcho: true
+Resources:
+  Bucket:
+    Type: AWS::S3::Bucket
+"""
+
+
+class FakeWaiter:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def wait(self, **kwargs):
+        if self.name == "stack_delete_complete":
+            self.client.deployed_body = None
+        elif not self.client.changes:
+            raise WaiterError("ChangeSetCreateComplete", "FAILED", {})
+
+
+class FakeCloudFormation:
+    """A stand-in for the parts of the CloudFormation API deploy_stack uses"""
+
+    class meta:
+        region_name = "us-west-2"
+
+    def __init__(
+        self,
+        deployed_body=None,
+        changes=(),
+        status="UPDATE_COMPLETE",
+        deployed_parameters=(),
+    ):
+        self.deployed_body = deployed_body
+        self.status = status
+        self.deployed_parameters = list(deployed_parameters)
+        self.changes = list(changes)
+        self.calls = []
+
+    def _not_found(self, operation):
+        error = {"Code": "ValidationError", "Message": "Stack does not exist"}
+        return ClientError({"Error": error}, operation)
+
+    def get_template_summary(self, StackName):
+        self.calls.append("get_template_summary")
+        if self.deployed_body is None:
+            raise self._not_found("GetTemplateSummary")
+        metadata = Template.from_yaml(self.deployed_body).to_dict().get("Metadata")
+        return {"Metadata": json.dumps(metadata)} if metadata else {}
+
+    def validate_template(self, **kwargs):
+        self.calls.append("validate_template")
+
+    def describe_stacks(self, StackName):
+        self.calls.append("describe_stacks")
+        if self.deployed_body is None:
+            raise self._not_found("DescribeStacks")
+        return {
+            "Stacks": [
+                {"StackStatus": self.status, "Parameters": self.deployed_parameters}
+            ]
+        }
+
+    def delete_stack(self, StackName):
+        self.calls.append("delete_stack")
+
+    def create_change_set(self, **kwargs):
+        self.calls.append(("create_change_set", kwargs["ChangeSetType"]))
+        self.change_set_body = kwargs.get("TemplateBody")
+        self.change_set_url = kwargs.get("TemplateURL")
+
+    def get_waiter(self, name):
+        return FakeWaiter(self, name)
+
+    def describe_change_set(self, **kwargs):
+        if not self.changes:
+            return {"StatusReason": "The submitted information didn't contain changes."}
+        return {"Changes": [{"ResourceChange": c} for c in self.changes]}
+
+    def delete_change_set(self, **kwargs):
+        self.calls.append("delete_change_set")
+
+    def execute_change_set(self, **kwargs):
+        self.calls.append("execute_change_set")
+        self.executed = True
+
+    def describe_stack_events(self, StackName):
+        if not getattr(self, "executed", False):
+            return {"StackEvents": []}
+        events = []
+        for n, status in enumerate(["CREATE_IN_PROGRESS", "CREATE_COMPLETE"]):
+            events.insert(
+                0,
+                {
+                    "EventId": str(n),
+                    "LogicalResourceId": StackName,
+                    "ResourceType": "AWS::CloudFormation::Stack",
+                    "ResourceStatus": status,
+                    "Timestamp": f"2024-02-10T10:0{n}:00+00:00",
+                },
+            )
+        return {"StackEvents": events}
+
+
+PARAMETERS = [
+    {"ParameterKey": "DBName", "ParameterValue": "yeastregulatorydb"},
+    {"ParameterKey": "PostgresPassword", "ParameterValue": "secret"},
+]
+
+
+def test_hash_ignores_noecho_values_and_metadata():
+    template = Template.from_yaml(TEMPLATE)
+    digest = template_hash(template, PARAMETERS)
+    template.metadata[TEMPLATE_HASH_KEY] = "something else"
+    changed_password = [PARAMETERS[0], {**PARAMETERS[1], "ParameterValue": "x"}]
+    assert template_hash(template, changed_password) == digest
+    changed_name = [{**PARAMETERS[0], "ParameterValue": "x"}, PARAMETERS[1]]
+    assert template_hash(template, changed_name) != digest
+
+
+def test_create_executes_change_set_and_records_hash(capsys):
+    client = FakeCloudFormation(
+        changes=[
+            {
+                "Action": "Add",
+                "LogicalResourceId": "Bucket",
+                "ResourceType": "AWS::S3::Bucket",
+            }
+        ]
+    )
+    status = deploy_stack(
+        "stack", TEMPLATE, PARAMETERS, auto_approve=True, cf_client=client
+    )
+    assert status == "executed"
+    assert ("create_change_set", "CREATE") in client.calls
+    assert client.calls[-1] == "execute_change_set"
+    assert "CREATE_COMPLETE" in capsys.readouterr().out
+
+    # deploying the same template and parameters again is a no-op
+    client = FakeCloudFormation(deployed_body=client.change_set_body)
+    assert deploy_stack("stack", TEMPLATE, PARAMETERS, cf_client=client) == (
+        "unchanged"
+    )
+    assert client.calls == ["describe_stacks", "get_template_summary"]
+
+
+def test_empty_change_set_is_deleted():
+    client = FakeCloudFormation(deployed_body=TEMPLATE)
+    status = deploy_stack(
+        "stack", TEMPLATE, PARAMETERS, auto_approve=True, cf_client=client
+    )
+    assert status == "unchanged"
+    assert ("create_change_set", "UPDATE") in client.calls
+    assert client.calls[-1] == "delete_change_set"
+
+
+def test_deploy_does_not_modify_the_template():
+    template = Template.from_yaml(TEMPLATE)
+    change = {"Action": "Add", "LogicalResourceId": "Bucket"}
+    client = FakeCloudFormation(changes=[change])
+    deploy_stack("stack", template, PARAMETERS, auto_approve=True, cf_client=client)
+    assert TEMPLATE_HASH_KEY in client.change_set_body
+    assert TEMPLATE_HASH_KEY not in template.metadata
+
+
+def test_parameters_changed_since_the_hash_are_deployed():
+    deployed = Template.from_yaml(TEMPLATE)
+    deployed.metadata[TEMPLATE_HASH_KEY] = template_hash(deployed, PARAMETERS)
+    change = {"Action": "Modify", "LogicalResourceId": "Bucket"}
+    # eg deploy_image updated a parameter with the previous template
+    client = FakeCloudFormation(
+        deployed_body=deployed.to_yaml(),
+        changes=[change],
+        deployed_parameters=[
+            {"ParameterKey": "DBName", "ParameterValue": "other"},
+            {"ParameterKey": "PostgresPassword", "ParameterValue": "****"},
+        ],
+    )
+    status = deploy_stack(
+        "stack", TEMPLATE, PARAMETERS, auto_approve=True, cf_client=client
+    )
+    assert status == "executed"
+    assert ("create_change_set", "UPDATE") in client.calls
+
+
+@pytest.mark.parametrize("same_hash", [True, False])
+def test_rolled_back_stack_is_deleted_and_created_again(same_hash):
+    deployed = Template.from_yaml(TEMPLATE)
+    if same_hash:
+        deployed.metadata[TEMPLATE_HASH_KEY] = template_hash(deployed, PARAMETERS)
+    change = {"Action": "Add", "LogicalResourceId": "Bucket"}
+    client = FakeCloudFormation(
+        deployed_body=deployed.to_yaml(), changes=[change], status="ROLLBACK_COMPLETE"
+    )
+    status = deploy_stack(
+        "stack", TEMPLATE, PARAMETERS, auto_approve=True, cf_client=client
+    )
+    assert status == "executed"
+    delete = client.calls.index("delete_stack")
+    assert client.calls.index(("create_change_set", "CREATE")) > delete
+
+
+def test_stack_in_review_is_created_with_the_same_hash():
+    deployed = Template.from_yaml(TEMPLATE)
+    deployed.metadata[TEMPLATE_HASH_KEY] = template_hash(deployed, PARAMETERS)
+    change = {"Action": "Add", "LogicalResourceId": "Bucket"}
+    client = FakeCloudFormation(
+        deployed_body=deployed.to_yaml(), changes=[change], status="REVIEW_IN_PROGRESS"
+    )
+    status = deploy_stack(
+        "stack", TEMPLATE, PARAMETERS, auto_approve=True, cf_client=client
+    )
+    assert status == "executed"
+    assert ("create_change_set", "CREATE") in client.calls
+    assert "delete_stack" not in client.calls
+
+
+def test_change_set_is_not_executed_without_approval(monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda prompt: "n")
+    client = FakeCloudFormation(
+        deployed_body=TEMPLATE,
+        changes=[
+            {
+                "Action": "Modify",
+                "Replacement": "True",
+                "LogicalResourceId": "Bucket",
+                "ResourceType": "AWS::S3::Bucket",
+            }
+        ],
+    )
+    assert deploy_stack("stack", TEMPLATE, cf_client=client) == "cancelled"
+    assert "execute_change_set" not in client.calls
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+
+def test_large_template_is_uploaded_to_the_template_bucket():
+    large = TEMPLATE + f"Outputs:\n  Padding:\n    Value: {'x' * MAX_TEMPLATE_BODY}\n"
+    change = {"Action": "Add", "LogicalResourceId": "Bucket"}
+    with pytest.raises(ValueError, match="template bucket"):
+        deploy_stack(
+            "stack",
+            large,
+            auto_approve=True,
+            cf_client=FakeCloudFormation(changes=[change]),
+        )
+
+    client = FakeCloudFormation(changes=[change])
+    s3 = FakeS3()
+    deploy_stack(
+        "stack",
+        large,
+        auto_approve=True,
+        template_bucket="templates",
+        cf_client=client,
+        s3_client=s3,
+    )
+    ((bucket, key),) = s3.objects
+    assert bucket == "templates" and key.startswith("stack/")
+    # the bucket is in the stack's region, the region of the CloudFormation
+    # client
+    assert client.change_set_url == (
+        f"https://templates.s3.us-west-2.amazonaws.com/{key}"
+    )
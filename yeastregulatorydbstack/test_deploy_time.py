@@ -0,0 +1,115 @@
+from .deploy_time import calibrate, changed_resources, estimate, evaluate_conditions
+from .template import Template
+
+TEMPLATE = """
+Resources:
+  MyVPC:
+    Type: AWS::EC2::VPC
+  MyDBInstance:
+    Type: AWS::RDS::DBInstance
+    Properties:
+      VpcId: !Ref MyVPC
+  DjangoService:
+    Type: AWS::ECS::Service
+    Properties:
+      Host: !GetAtt MyDBInstance.Endpoint.Address
+  DjangoStackLoadBalancer:
+    Type: AWS::ElasticLoadBalancingV2::LoadBalancer
+    DependsOn: MyVPC
+"""
+
+DURATIONS = {
+    "AWS::EC2::VPC": (10, 10),
+    "AWS::RDS::DBInstance": (600, 300),
+    "AWS::ECS::Service": (120, 60),
+    "AWS::ElasticLoadBalancingV2::LoadBalancer": (180, 30),
+}
+
+
+def test_estimate_follows_the_critical_path():
+    result = estimate(Template.from_yaml(TEMPLATE), DURATIONS)
+    assert result.seconds == 730
+    assert [step.logical_id for step in result.critical_path] == [
+        "MyVPC",
+        "MyDBInstance",
+        "DjangoService",
+    ]
+
+
+def test_update_only_counts_changed_resources():
+    template = Template.from_yaml(TEMPLATE)
+    baseline = Template.from_yaml(TEMPLATE)
+    assert changed_resources(template, baseline) == set()
+
+    template.resources["DjangoService"]["Properties"]["DesiredCount"] = 2
+    changed = changed_resources(template, baseline)
+    assert changed == {"DjangoService"}
+    assert estimate(template, DURATIONS, changed).seconds == 60
+
+
+def test_calibrate_uses_median_of_observed_events():
+    events = []
+    for start, end in [("00:00:00", "00:08:00"), ("01:00:00", "01:12:00")]:
+        for status, time in [("CREATE_IN_PROGRESS", start), ("CREATE_COMPLETE", end)]:
+            events.append(
+                {
+                    "LogicalResourceId": "MyDBInstance",
+                    "ResourceType": "AWS::RDS::DBInstance",
+                    "ResourceStatus": status,
+                    "Timestamp": f"2024-02-10T{time}+00:00",
+                }
+            )
+    calibrated = calibrate(events, DURATIONS)
+    assert calibrated["AWS::RDS::DBInstance"] == (600, 300)
+    calibrated = calibrate(events[:2], DURATIONS)
+    assert calibrated["AWS::RDS::DBInstance"] == (480, 300)
+
+
+CONDITIONAL = """
+Parameters:
+  ReadReplicaCount:
+    Type: String
+    Default: "0"
+Conditions:
+  HasReadReplica1: !Not [!Equals [!Ref ReadReplicaCount, "0"]]
+  NoReadReplica: !Not [!Condition HasReadReplica1]
+Resources:
+  MyVPC:
+    Type: AWS::EC2::VPC
+  MyDBInstance:
+    Type: AWS::RDS::DBInstance
+    DependsOn: MyVPC
+  MyDBReadReplica1:
+    Type: AWS::RDS::DBInstance
+    Condition: HasReadReplica1
+    Properties:
+      SourceDBInstanceIdentifier: !Ref MyDBInstance
+  DjangoService:
+    Type: AWS::ECS::Service
+    Properties:
+      Host: !If [HasReadReplica1, !Ref MyDBReadReplica1, !Ref MyVPC]
+"""
+
+
+def test_estimate_leaves_out_resources_whose_condition_is_false():
+    template = Template.from_yaml(CONDITIONAL)
+    assert evaluate_conditions(template) == {
+        "HasReadReplica1": False,
+        "NoReadReplica": True,
+    }
+    result = estimate(template, DURATIONS)
+    assert result.seconds == 610
+    assert [step.logical_id for step in result.critical_path] == [
+        "MyVPC",
+        "MyDBInstance",
+    ]
+
+    replica = [{"ParameterKey": "ReadReplicaCount", "ParameterValue": "1"}]
+    result = estimate(template, DURATIONS, parameters=replica)
+    assert result.seconds == 1330
+    assert [step.logical_id for step in result.critical_path] == [
+        "MyVPC",
+        "MyDBInstance",
+        "MyDBReadReplica1",
+        "DjangoService",
+    ]
@@ -0,0 +1,53 @@
+from .create_template import build_template
+from .fargate import is_valid_task_size, task_sizes
+from .gunicorn import FIELDS, MAPPING_NAME, GunicornSettings, gunicorn_settings
+from .template import to_plain
+
+
+def test_gunicorn_settings():
+    # a quarter vCPU is throttled, and 512 MiB only fits one worker
+    assert gunicorn_settings(256, 512) == GunicornSettings(1, 2, 60, 500, 50)
+    assert gunicorn_settings(1024, 2048) == GunicornSettings(3, 4, 30, 1000, 100)
+    # memory caps the 2 x vCPUs + 1 workers
+    assert gunicorn_settings(4096, 8192).workers == 9
+    assert gunicorn_settings(4096, 1024 * 2).workers == 7
+    assert all(gunicorn_settings(*size).workers >= 1 for size in task_sizes())
+
+
+def test_task_sizes():
+    assert is_valid_task_size(256, 2048)
+    assert not is_valid_task_size(256, 4096)
+    assert is_valid_task_size("1024", 8192)
+    assert len(list(task_sizes())) == 74
+
+
+def test_django_command_selects_the_mapped_settings():
+    template = build_template()
+    assert set(template.mappings[MAPPING_NAME]["1024"]) == {
+        str(memory) for memory in range(2048, 8193, 1024)
+    }
+    command = to_plain(
+        template.resources["DjangoTaskDefinition"]["Properties"][
+            "ContainerDefinitions"
+        ][0]["Command"]
+    )
+    for field in ("workers", "threads", "timeout", "max_requests"):
+        option = command.index(f"--{field.replace('_', '-')}")
+        derived = command[option + 1]["Fn::If"][1]["Fn::Select"]
+        assert derived[0] == FIELDS.index(field)
+        assert derived[1]["Fn::FindInMap"][0] == MAPPING_NAME
+
+
+def test_task_size_parameters_are_constrained():
+    template = build_template()
+    for cpu, memory in [
+        ("DjangoTaskDefinitionCPUs", "DjangoTaskDefinitionMemory"),
+        ("CeleryFlowerTaskDefinitionCPUs", "CeleryFlowerTaskDefinitionMemory"),
+    ]:
+        assert 3072 in template.parameters[memory]["AllowedValues"]
+        rule = to_plain(template.rules[f"{cpu}256"])
+        assert rule["RuleCondition"] == {"Fn::Equals": [{"Ref": cpu}, "256"]}
+        assert rule["Assertions"][0]["Assert"]["Fn::Contains"] == [
+            ["512", "1024", "2048"],
+            {"Ref": memory},
+        ]
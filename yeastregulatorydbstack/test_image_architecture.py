@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from .image_architecture import (
+    EcrImage,
+    check_image_architectures,
+    image_architectures,
+    parse_ecr_image,
+)
+from .template import Template
+
+IMAGE = "040367161929.dkr.ecr.us-east-2.amazonaws.com/django-stack:latest"
+
+TEMPLATE = """
+Parameters:
+  CPUArchitecture:
+    Type: String
+    Default: X86_64
+  DjangoAppImage:
+    Type: String
+  LogRouterImage:
+    Type: String
+    Default: public.ecr.aws/aws-observability/aws-for-fluent-bit:2.32.2
+Resources: {}
+"""
+
+
+class FakeEcr:
+    def __init__(self, manifest, config=None):
+        self.manifest = manifest
+        self.config = config
+
+    def batch_get_image(self, **kwargs):
+        return {"images": [{"imageManifest": json.dumps(self.manifest)}]}
+
+    def get_download_url_for_layer(self, layerDigest, **kwargs):
+        return {"downloadUrl": f"https://blobs/{layerDigest}"}
+
+
+def _index(*architectures):
+    return {
+        "mediaType": "application/vnd.oci.image.index.v1+json",
+        "manifests": [
+            {"digest": f"sha256:{arch}", "platform": {"architecture": arch}}
+            for arch in architectures + ("unknown",)
+        ],
+    }
+
+
+def test_parse_ecr_image():
+    assert parse_ecr_image(IMAGE) == EcrImage(
+        "040367161929", "us-east-2", "django-stack", "latest"
+    )
+    assert parse_ecr_image(
+        "040367161929.dkr.ecr.us-east-2.amazonaws.com/org/app@sha256:abc"
+    ) == EcrImage("040367161929", "us-east-2", "org/app", None, "sha256:abc")
+    assert parse_ecr_image(IMAGE.split(":")[0]).tag == "latest"
+    assert parse_ecr_image("python:3.11") is None
+
+
+def test_image_architectures():
+    image = parse_ecr_image(IMAGE)
+    assert image_architectures(FakeEcr(_index("amd64", "arm64")), image) == {
+        "amd64",
+        "arm64",
+    }
+
+    single = {
+        "mediaType": "application/vnd.docker.distribution.manifest.v2+json",
+        "config": {"digest": "sha256:config"},
+    }
+    fetched = []
+
+    def fetch(url):
+        fetched.append(url)
+        return {"architecture": "arm64", "os": "linux"}
+
+    assert image_architectures(FakeEcr(single), image, fetch) == {"arm64"}
+    assert fetched == ["https://blobs/sha256:config"]
+
+
+def test_check_image_architectures():
+    template = Template.from_yaml(TEMPLATE)
+    arm = [
+        {"ParameterKey": "CPUArchitecture", "ParameterValue": "ARM64"},
+        {"ParameterKey": "DjangoAppImage", "ParameterValue": IMAGE},
+    ]
+
+    assert check_image_architectures(
+        template, arm, FakeEcr(_index("amd64", "arm64"))
+    ) == {IMAGE: {"amd64", "arm64"}}
+    with pytest.raises(ValueError, match="needs arm64 images"):
+        check_image_architectures(template, arm, FakeEcr(_index("amd64")))
+    # CPUArchitecture falls back to its X86_64 default
+    check_image_architectures(template, arm[1:], FakeEcr(_index("amd64")))
+    # images outside ECR are not checked
+    docker_hub = [{"ParameterKey": "DjangoAppImage", "ParameterValue": "app:1"}]
+    assert check_image_architectures(template, docker_hub, FakeEcr({})) == {}
+    # the sidecar images are checked once mirrored into ECR
+    mirror = IMAGE.replace("django-stack:latest", "fluent-bit:2.32.2")
+    with pytest.raises(ValueError, match=f"{mirror} is amd64"):
+        check_image_architectures(
+            template,
+            arm + [{"ParameterKey": "LogRouterImage", "ParameterValue": mirror}],
+            FakeEcr(_index("amd64")),
+        )
@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from . import multi_deploy
+from .multi_deploy import StackSpec, deploy_stacks, load_manifest
+
+
+def test_load_manifest(tmp_path):
+    manifest = tmp_path / "stacks.yaml"
+    manifest.write_text(
+        "stacks:\n"
+        "  - name: dev\n"
+        "    region: us-east-2\n"
+        "    parameters: dev.json\n"
+        "  - name: prod\n"
+        "    region: us-west-2\n"
+    )
+    assert load_manifest(str(manifest)) == [
+        StackSpec("dev", "us-east-2", "dev.json"),
+        StackSpec("prod", "us-west-2"),
+    ]
+    manifest.write_text(
+        '{"stacks": [{"name": "dev", "region": "us-east-2"},'
+        ' {"name": "dev", "region": "us-east-2"}]}'
+    )
+    with pytest.raises(ValueError):
+        load_manifest(str(manifest))
+
+
+def test_deploy_stacks_runs_concurrently_with_shared_clients(monkeypatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+    used_clients = {}
+
+    def fake_deploy_stack(stack_name, template_body, cf_client, **kwargs):
+        with lock:
+            running.append(stack_name)
+            peak.append(len(running))
+            used_clients[stack_name] = cf_client
+        time.sleep(0.05)
+        with lock:
+            running.remove(stack_name)
+        if stack_name == "broken":
+            raise RuntimeError("throttled")
+        return "executed"
+
+    monkeypatch.setattr(multi_deploy, "deploy_stack", fake_deploy_stack)
+    stacks = [
+        StackSpec("dev", "us-east-2"),
+        StackSpec("staging", "us-east-2"),
+        StackSpec("broken", "us-west-2"),
+        StackSpec("prod", "us-west-2"),
+    ]
+    clients = {"us-east-2": object(), "us-west-2": object()}
+    results = deploy_stacks(stacks, "template", clients, max_workers=2)
+
+    assert [r.name for r in results] == ["dev", "staging", "broken", "prod"]
+    assert [r.status for r in results] == ["executed", "executed", "error", "executed"]
+    assert "throttled" in results[2].error
+    assert max(peak) == 2
+    assert used_clients["dev"] is used_clients["staging"] is clients["us-east-2"]
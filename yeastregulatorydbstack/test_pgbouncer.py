@@ -0,0 +1,101 @@
+import pytest
+
+from .create_template import build_template
+from .pgbouncer import (
+    CONCURRENCY_MAPPING_NAME,
+    FIELDS,
+    MAPPING_NAME,
+    MAX_THREADS,
+    MAX_WORKERS,
+    THREADS_MAPPING_NAME,
+    WORKERS_MAPPING_NAME,
+    PgBouncerSettings,
+    pgbouncer_settings,
+)
+from .resources.celery import WORKER_POOLS
+from .template import to_plain
+
+
+def test_pgbouncer_settings():
+    assert pgbouncer_settings(1) == PgBouncerSettings("session", 1, 1, 100, 2)
+    # 3 workers of 4 threads
+    assert pgbouncer_settings(12) == PgBouncerSettings("transaction", 6, 1, 100, 7)
+    assert pgbouncer_settings(4, busy_share=1).default_pool_size == 4
+    assert pgbouncer_settings(80).max_client_conn == 160
+    with pytest.raises(ValueError):
+        pgbouncer_settings(0)
+    with pytest.raises(ValueError):
+        pgbouncer_settings(4, busy_share=0)
+
+
+def _pgbouncer(template, logical_id):
+    containers = to_plain(
+        template.resources[logical_id]["Properties"]["ContainerDefinitions"]
+    )
+    (sidecar,) = [
+        container["Fn::If"]
+        for container in containers
+        if "Fn::If" in container and container["Fn::If"][1]["Name"] == "pgbouncer"
+    ]
+    assert sidecar[0] == "AppsUsePgBouncer"
+    assert "LogConfiguration" in sidecar[1]
+    return {
+        variable["Name"]: variable["Value"] for variable in sidecar[1]["Environment"]
+    }
+
+
+def test_every_app_task_gets_a_sidecar():
+    template = build_template()
+    assert "1024" in template.mappings[MAPPING_NAME]
+
+    environment = _pgbouncer(template, "DjangoTaskDefinition")
+    size = [{"Ref": "DjangoTaskDefinitionCPUs"}, {"Ref": "DjangoTaskDefinitionMemory"}]
+    workers, threads = {"Ref": "DjangoGunicornWorkers"}, {
+        "Ref": "DjangoGunicornThreads"
+    }
+    # the lookup for each combination of derived workers and threads
+    lookups = {
+        (True, True): [MAPPING_NAME, *size],
+        (True, False): [
+            CONCURRENCY_MAPPING_NAME,
+            {"Fn::FindInMap": [WORKERS_MAPPING_NAME, *size]},
+            threads,
+        ],
+        (False, True): [
+            CONCURRENCY_MAPPING_NAME,
+            workers,
+            {"Fn::FindInMap": [THREADS_MAPPING_NAME, *size]},
+        ],
+        (False, False): [CONCURRENCY_MAPPING_NAME, workers, threads],
+    }
+    for index, field in enumerate(FIELDS):
+        index_, lookup = environment[field.upper()]["Fn::Select"]
+        assert index_ == index
+        condition, derived_workers, set_workers = lookup["Fn::If"]
+        assert condition == "DeriveDjangoGunicornWorkers"
+        for derive_workers, branch in ((True, derived_workers), (False, set_workers)):
+            condition, derived_threads, set_threads = branch["Fn::If"]
+            assert condition == "DeriveDjangoGunicornThreads"
+            assert derived_threads["Fn::FindInMap"] == lookups[(derive_workers, True)]
+            assert set_threads["Fn::FindInMap"] == lookups[(derive_workers, False)]
+
+    for pool in WORKER_POOLS:
+        environment = _pgbouncer(template, f"CeleryWorker{pool.name}TaskDefinition")
+        assert environment["DEFAULT_POOL_SIZE"] == str(pool.concurrency)
+    assert _pgbouncer(template, "CeleryBeatTaskDefinition")["POOL_MODE"] == "session"
+
+
+def test_overridden_concurrency_is_mapped():
+    template = build_template()
+    parameters = template.parameters
+    assert parameters["DjangoGunicornWorkers"]["MaxValue"] == MAX_WORKERS
+    assert parameters["DjangoGunicornThreads"]["MaxValue"] == MAX_THREADS
+    mappings = to_plain(template.mappings)
+    by_concurrency = mappings[CONCURRENCY_MAPPING_NAME]
+    assert len(by_concurrency) == MAX_WORKERS
+    assert by_concurrency["3"]["4"] == [str(v) for v in pgbouncer_settings(12)]
+    # the derived workers and threads are those of the DjangoGunicorn mapping
+    for cpu, by_memory in mappings["DjangoGunicorn"].items():
+        for memory, gunicorn in by_memory.items():
+            assert mappings[WORKERS_MAPPING_NAME][cpu][memory] == gunicorn[0]
+            assert mappings[THREADS_MAPPING_NAME][cpu][memory] == gunicorn[1]
@@ -0,0 +1,65 @@
+import pytest
+
+from .create_template import build_template
+from .postgres import (
+    FIELDS,
+    INSTANCE_CLASSES,
+    MAPPING_NAME,
+    PROFILES,
+    postgres_settings,
+)
+from .template import to_plain
+
+
+def test_postgres_settings():
+    settings = postgres_settings(2, 1, "oltp")
+    # a quarter of 1 GiB, in 8 kB pages
+    assert settings.shared_buffers == 32768
+    assert settings.effective_cache_size == 3 * 32768
+    assert settings.max_connections == 200
+    assert settings.random_page_cost == 1.1
+    # large joins get fewer connections, more memory and more workers each
+    oltp = postgres_settings(16, 128, "oltp")
+    analytical = postgres_settings(16, 128, "analytical")
+    assert analytical.max_connections < oltp.max_connections
+    assert analytical.work_mem > oltp.work_mem
+    assert analytical.max_parallel_workers_per_gather == 4
+    assert analytical.maintenance_work_mem == 2 * 1024 * 1024
+    with pytest.raises(ValueError):
+        postgres_settings(2, 8, "batch")
+
+
+def test_work_mem_fits_in_memory():
+    for vcpus, memory_gib in INSTANCE_CLASSES.values():
+        for profile in PROFILES:
+            settings = postgres_settings(vcpus, memory_gib, profile)
+            if settings.work_mem == 4096:
+                continue
+            sorts = 3 if profile == "oltp" else 1
+            assert (
+                settings.work_mem
+                * settings.max_connections
+                * sorts
+                * settings.max_parallel_workers_per_gather
+                + settings.shared_buffers * 8
+                <= memory_gib * 1024 * 1024
+            )
+
+
+def test_parameter_group_selects_the_mapped_settings():
+    template = build_template()
+    assert set(template.mappings[MAPPING_NAME]) == set(INSTANCE_CLASSES)
+    assert list(template.parameters["RdsInstanceType"]["AllowedValues"]) == list(
+        INSTANCE_CLASSES
+    )
+    parameters = to_plain(
+        template.resources["MyCustomParameterGroup"]["Properties"]["Parameters"]
+    )
+    assert list(parameters) == list(FIELDS)
+    for index, field in enumerate(FIELDS):
+        assert parameters[field]["Fn::Select"][0] == index
+        assert parameters[field]["Fn::Select"][1]["Fn::FindInMap"] == [
+            MAPPING_NAME,
+            {"Ref": "RdsInstanceType"},
+            {"Ref": "PostgresWorkloadProfile"},
+        ]
@@ -0,0 +1,75 @@
+import json
+
+from .right_sizing import TaskSample, load_samples, recommend
+
+
+def _samples(service, cpus, memory=300, reserved=(1024, 2048)):
+    # two tasks per minute, each using cpu units from cpus
+    return [
+        TaskSample(service, task, minute, cpu, *reserved[:1], memory, reserved[1])
+        for minute, cpu in enumerate(cpus)
+        for task in ("a", "b")
+    ]
+
+
+def test_recommend_shrinks_an_idle_service():
+    (result,) = recommend(_samples("DjangoService", [50] * 20))
+    assert (result.current_cpu, result.current_memory) == (1024, 2048)
+    # 50 units at 70% fits a quarter vCPU, and 360 MiB fits 512
+    assert (result.cpu, result.memory) == (256, 512)
+    assert (result.min_count, result.max_count) == (1, 1)
+    assert result.fits
+
+
+def test_recommend_sizes_memory_on_the_peak_and_counts_on_busy_minutes():
+    samples = _samples("Worker", [100] * 9 + [1400], memory=2000)
+    (result,) = recommend(samples, percentile=50)
+    # 2400 MiB needs 3072, and the cheapest size with it is half a vCPU
+    assert (result.cpu, result.memory) == (512, 3072)
+    # the busiest minute uses 2800 units over two tasks
+    assert result.max_count == 8
+    assert result.min_count == 1
+
+
+def test_recommend_flags_use_beyond_the_largest_size():
+    (result,) = recommend(_samples("Huge", [20000], memory=200_000))
+    assert not result.fits
+    assert (result.cpu, result.memory) == (16384, 122880)
+
+
+def test_load_samples(tmp_path):
+    events = [
+        {
+            "Type": "Task",
+            "ServiceName": "DjangoService",
+            "TaskId": "a",
+            "Timestamp": 1_700_000_040_000,
+            "CpuUtilized": 12.5,
+            "CpuReserved": 256.0,
+            "MemoryUtilized": 180,
+            "MemoryReserved": 512,
+        },
+        {"Type": "Container", "ServiceName": "DjangoService"},
+    ]
+    ndjson = tmp_path / "events.json"
+    ndjson.write_text("\n".join(json.dumps(event) for event in events))
+    (sample,) = load_samples(str(ndjson))
+    assert sample.minute == 28_333_334
+    assert sample.cpu_utilized == 12.5
+
+    query = tmp_path / "query.json"
+    row = dict(events[0], Timestamp="2023-11-14 22:14:00.000")
+    query.write_text(
+        json.dumps(
+            {"results": [[{"field": k, "value": str(v)} for k, v in row.items()]]}
+        )
+    )
+    assert load_samples(str(query)) == [sample]
+
+    exported = tmp_path / "tasks.csv"
+    exported.write_text(
+        "@timestamp,ServiceName,TaskId,CpuUtilized,CpuReserved,"
+        "MemoryUtilized,MemoryReserved\n"
+        "2023-11-14T22:14:00Z,DjangoService,a,12.5,256,180,512\n"
+    )
+    assert load_samples(str(exported)) == [sample]
@@ -0,0 +1,96 @@
+import asyncio
+
+from .stack_events import format_timings, operation_start_event_id, watch_stack
+
+
+def _event(n, logical_id, resource_type, status, time):
+    return {
+        "EventId": f"event-{n}",
+        "LogicalResourceId": logical_id,
+        "ResourceType": resource_type,
+        "ResourceStatus": status,
+        "Timestamp": f"2024-02-10T{time}+00:00",
+    }
+
+
+OLD = [
+    _event(0, "stack", "AWS::CloudFormation::Stack", "CREATE_IN_PROGRESS", "09:00:00"),
+    _event(1, "stack", "AWS::CloudFormation::Stack", "CREATE_COMPLETE", "09:10:00"),
+]
+# the events of an update, in the batches in which successive polls see them
+BATCHES = [
+    [
+        _event(
+            2, "stack", "AWS::CloudFormation::Stack", "UPDATE_IN_PROGRESS", "10:00:00"
+        ),
+        _event(
+            3, "MyDBInstance", "AWS::RDS::DBInstance", "UPDATE_IN_PROGRESS", "10:00:05"
+        ),
+    ],
+    [],
+    [],
+    [
+        _event(
+            4, "MyDBInstance", "AWS::RDS::DBInstance", "UPDATE_COMPLETE", "10:06:05"
+        ),
+        _event(
+            5,
+            "stack",
+            "AWS::CloudFormation::Stack",
+            "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS",
+            "10:06:10",
+        ),
+    ],
+    [_event(6, "stack", "AWS::CloudFormation::Stack", "UPDATE_COMPLETE", "10:06:20")],
+]
+
+
+class FakeCloudFormation:
+    """Serves stack events, newest first, two to a page"""
+
+    def __init__(self, batches):
+        self.events = list(reversed(OLD))
+        self.batches = list(batches)
+        self.polls = 0
+
+    def describe_stack_events(self, StackName, NextToken=None):
+        if NextToken is None:
+            self.polls += 1
+            if self.batches:
+                self.events = list(reversed(self.batches.pop(0))) + self.events
+        start = int(NextToken or 0)
+        response = {"StackEvents": self.events[start : start + 2]}
+        if start + 2 < len(self.events):
+            response["NextToken"] = str(start + 2)
+        return response
+
+
+def test_watch_stack_streams_until_terminal_status():
+    client = FakeCloudFormation(BATCHES)
+    lines = []
+    result = asyncio.run(
+        watch_stack(
+            "stack",
+            client,
+            after_event_id="event-1",
+            min_delay=0,
+            max_delay=0,
+            printer=lines.append,
+        )
+    )
+    assert result.stack_status == "UPDATE_COMPLETE"
+    assert [e["EventId"] for e in result.events] == [f"event-{n}" for n in range(2, 7)]
+    assert len(lines) == 5
+    assert client.polls == 5
+
+    table = format_timings(result.events).splitlines()
+    assert table[1].startswith("MyDBInstance")
+    assert table[1].endswith("360s")
+    assert table[2].startswith("stack")
+
+
+def test_operation_start_event_id_skips_previous_operations():
+    client = FakeCloudFormation(BATCHES[:2])
+    client.describe_stack_events("stack")
+    client.describe_stack_events("stack")
+    assert operation_start_event_id(client, "stack") == "event-1"
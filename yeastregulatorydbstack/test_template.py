@@ -0,0 +1,38 @@
+import pytest
+
+from .create_template import build_template
+from .template import DuplicateLogicalIdError, Template, get_att, ref
+
+
+def test_fragments_and_mappings_share_a_template():
+    template = Template()
+    template.add_parameters(
+        """
+  AppTagValue:
+    Type: String
+"""
+    )
+    template.add_resources(
+        {"Bucket": {"Type": "AWS::S3::Bucket", "Properties": {"Name": ref("X")}}}
+    )
+    template.add_outputs({"BucketArn": {"Value": get_att("Bucket", "Arn")}})
+    body = template.to_yaml()
+    assert "Name: !Ref X" in body
+    assert "Value: !GetAtt Bucket.Arn" in body
+    assert "Conditions" not in body
+
+
+def test_duplicate_logical_id_is_rejected_on_insert():
+    template = Template()
+    template.add_parameters({"Shared": {"Type": "String"}})
+    with pytest.raises(DuplicateLogicalIdError):
+        template.add_resources({"Shared": {"Type": "AWS::S3::Bucket"}})
+    # outputs have their own namespace
+    template.add_outputs({"Shared": {"Value": ref("Shared")}})
+
+
+def test_round_trip_of_generated_template():
+    template = build_template()
+    parsed = Template.from_yaml(template.to_yaml())
+    assert list(parsed.resources) == list(template.resources)
+    assert parsed.to_yaml() == template.to_yaml()